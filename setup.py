@@ -26,5 +26,8 @@ setup(
     },
     python_requires='>=3.10',
     install_requires=parse_requirements('requirements.txt'),
+    extras_require={
+        'numba': ['numba>=0.57'],
+    },
     include_package_data=True
 )
@@ -1,7 +1,8 @@
 __version__ = '1.0'
 
-from .core import Module, WorkFlow
-from .default import DefaultWorkFlow
+from .core import Module, WorkFlow, DAGWorkFlow
+from .default import DefaultWorkFlow, DefaultDAGWorkFlow
+from .impl.result import AnalysisResult
 from . import api
 from . import default
 
@@ -1,7 +1,19 @@
 from .api import (
     read, seg, skel, trunk, grfy, meas, analysis,
-    vgnt_corr, hist_std, est_wid, analysis_and_vis
+    vgnt_corr, hist_std, est_wid, analysis_and_vis, analysis_full,
+    analysis_from_binary, build_mask_archive, replay, batch_analysis
 )
 
 from superccm.impl.utils.tools import get_canvas, show_image, save_image
-from superccm.impl.graph.vis import vis_graph, vis_ACCM
+from superccm.impl.graph.vis import vis_graph, vis_ACCM, render_ACCM
+from superccm.impl.io.write import OverlayWriter, montage
+from superccm.impl.io.archive import MaskArchive
+from superccm.impl.io.sources import iter_frames, iter_tiff, iter_video, iter_zip, iter_tar
+from superccm.impl.utils.dedup import FrameDeduplicator, frame_signature
+from superccm.impl.utils.quality import QualityGate, quality_measures
+from superccm.impl.incremental.incremental import init_analysis, update_analysis
+from superccm.impl.metircs.aggregate import MetricsAggregator, aggregate_stream
+from superccm.impl.metircs.features import graph_features, stack_features, to_arrow, write_parquet
+from superccm.impl.metircs.density import density_maps, render_density
+from superccm.impl.runner.pool import run_batch
+from . import aio
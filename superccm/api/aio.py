@@ -0,0 +1,264 @@
+"""
+Asyncio entry points.
+
+Decoding, network fetches and all the CPU work run on executors, so the event loop is never blocked.
+Concurrent segmentation calls are coalesced into batched inference calls (see SegmentationBatcher).
+
+    from superccm.api import aio
+
+    metrics = await aio.analysis_async('test.jpg', timeout=10)
+    async for key, metrics in aio.batch_analysis_async(items, concurrency=8):
+        ...
+"""
+import asyncio
+import contextvars
+import functools
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Mapping
+
+import numpy as np
+
+from superccm.api import api
+from superccm.impl.metircs.metrics import METRICS, empty_metrics
+from superccm.impl.segment.segment import CornealNerveSegmenter
+from superccm.impl.utils.quality import QualityGate
+
+_executors: dict[str, Executor | None] = {'io': None, 'cpu': None}
+_batchers: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SegmentationBatcher]' = weakref.WeakKeyDictionary()
+# Options of the batchers created by seg_async, see configure
+_batch_options = {'max_batch': 8, 'max_delay': 0.005}
+
+
+def configure(
+        io_executor: Executor | None = None,
+        cpu_executor: Executor | None = None,
+        max_batch: int | None = None,
+        max_delay: float | None = None,
+):
+    """
+    :param io_executor: Runs read_image (file reads, URL fetches, decoding). Default: 8 threads
+    :param cpu_executor: Runs segmentation and the analysis stages. Default: 4 threads
+                         (onnxruntime and OpenCV release the GIL). A ProcessPoolExecutor can't be used for segmentation.
+    :param max_batch: Maximum number of images in one coalesced segmentation call
+    :param max_delay: Seconds a segmentation call waits for others to join its batch
+    """
+    if io_executor is not None:
+        _executors['io'] = io_executor
+    if cpu_executor is not None:
+        _executors['cpu'] = cpu_executor
+    if max_batch is not None:
+        _batch_options['max_batch'] = max_batch
+    if max_delay is not None:
+        _batch_options['max_delay'] = max_delay
+    _batchers.clear()
+
+
+def _executor(kind: str) -> Executor:
+    if _executors[kind] is None:
+        workers = 8 if kind == 'io' else 4
+        _executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'superccm-{kind}')
+    return _executors[kind]
+
+
+async def _run(kind: str, function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Executor threads don't inherit context variables, e.g. the selection of use_implementations
+    call = functools.partial(contextvars.copy_context().run, function, *args, **kwargs)
+    return await loop.run_in_executor(_executor(kind), call)
+
+
+class SegmentationBatcher:
+    """
+    Coalesces the segmentation calls made on one event loop: the first call waits up to 'max_delay' seconds
+    (or until 'max_batch' images are queued), then all queued images go through one seg_batch call.
+    Cancelled calls are dropped from the batch, or their result is discarded if it is already running.
+    """
+
+    def __init__(self, segmenter: CornealNerveSegmenter | None = None, max_batch: int = 8, max_delay: float = 0.005,
+                 executor: Executor | None = None):
+        """
+        :param segmenter: None means the segmenter of the API, loaded by the first batch on the executor
+                          (loading the model would block the event loop)
+        """
+        self.segmenter = segmenter
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.executor = executor
+        self._pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def __call__(self, image: np.ndarray) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _seg_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        segmenter = self.segmenter or api.get_segmenter()
+        return segmenter.seg_batch(images)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(image, future) for image, future in self._pending if not future.cancelled()]
+        self._pending = []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[np.ndarray, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        images = [image for image, _ in batch]
+        try:
+            masks = await loop.run_in_executor(self.executor or _executor('cpu'), contextvars.copy_context().run,
+                                               self._seg_batch, images)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), mask in zip(batch, masks):
+            if not future.done():
+                future.set_result(mask)
+
+
+def _batcher() -> SegmentationBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = SegmentationBatcher(**_batch_options)
+        _batchers[loop] = batcher
+    return batcher
+
+
+async def read_async(image_or_path, **kwargs) -> np.ndarray:
+    """ read_image on the io executor """
+    return await _run('io', api.read, image_or_path, **kwargs)
+
+
+async def seg_async(image: np.ndarray, timeout: float | None = None) -> np.ndarray:
+    """ Segment an image. Concurrent calls on the same event loop share inference calls. """
+    if not image.shape == (384, 384):
+        raise TypeError('This method is expected to input a grayscale image with a size of 384*384.')
+    return await asyncio.wait_for(_batcher()(image), timeout)
+
+
+async def _analysis(image_or_path, include: Iterable[METRICS] | None,
+                    gate: QualityGate | None) -> tuple[dict[str, float], dict | None]:
+    """ The metrics and the gate report (None without a gate), as in api.analysis_full """
+    image = await read_async(image_or_path)
+    quality = None
+    if gate is not None:
+        quality = await _run('cpu', gate.check_image, image)
+        if not quality['passed']:
+            return empty_metrics(include=include, measured=False), quality
+    binary = await _batcher()(image)
+    if gate is not None:
+        quality = gate.check_mask(binary, quality)
+        if not quality['passed']:
+            return empty_metrics(include=include), quality
+    return await _run('cpu', api.analysis_from_binary, image, binary, include=include), quality
+
+
+async def analysis_async(
+        image_or_path,
+        include: Iterable[METRICS] | None = None,
+        timeout: float | None = None,
+        gate: QualityGate | None = None,
+) -> dict[str, float]:
+    """
+    Async version of api.analysis.
+    :param timeout: Seconds, raises asyncio.TimeoutError. A stage already running on an executor
+                    finishes in the background, its result is discarded.
+    :param gate: Optional quality gate, see api.analysis
+    """
+    metrics, _ = await asyncio.wait_for(_analysis(image_or_path, include, gate), timeout)
+    return metrics
+
+
+async def _aiter_items(items) -> AsyncIterator[tuple[str, Any]]:
+    if isinstance(items, Mapping):
+        items = items.items()
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def batch_analysis_async(
+        items: Mapping[str, Any] | Iterable[tuple[str, Any]] | AsyncIterable[tuple[str, Any]],
+        include: Iterable[METRICS] | None = None,
+        concurrency: int = 8,
+        timeout: float | None = None,
+        ordered: bool = False,
+        gate: QualityGate | None = None,
+        reports: dict | None = None,
+) -> AsyncIterator[tuple[str, dict[str, float] | BaseException]]:
+    """
+    Analyze a batch of images with at most 'concurrency' images in flight, so that their segmentation is batched.
+    :param items: (key, image_or_path) pairs, a mapping, or an async iterable of pairs
+    :param timeout: Per image, see analysis_async
+    :param ordered: Yield in input order instead of completion order
+    :param gate: Optional quality gate, see api.analysis
+    :param reports: If given with a gate, filled with the gate report of each analyzed key
+    :return: (key, metrics) pairs. A failed or timed out image yields (key, exception) and doesn't stop the batch.
+             Closing the iterator cancels the images in flight.
+    """
+    include = None if include is None else tuple(include)
+    source = _aiter_items(items)
+    running: dict[asyncio.Task, tuple[int, str]] = {}
+    finished: dict[int, tuple[str, Any]] = {}
+    next_index = 0
+    exhausted = False
+
+    async def fill(index):
+        nonlocal exhausted
+        while not exhausted and len(running) < concurrency:
+            try:
+                key, image_or_path = await source.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                break
+            task = asyncio.ensure_future(asyncio.wait_for(_analysis(image_or_path, include, gate), timeout))
+            running[task] = (index, key)
+            index += 1
+        return index
+
+    try:
+        submitted = await fill(0)
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, key = running.pop(task)
+                # exception() raises CancelledError for a cancelled task
+                if task.cancelled():
+                    result = asyncio.CancelledError()
+                elif task.exception() is not None:
+                    result = task.exception()
+                else:
+                    result, quality = task.result()
+                    if reports is not None and quality is not None:
+                        reports[key] = quality
+                if ordered:
+                    finished[index] = (key, result)
+                else:
+                    yield key, result
+            while ordered and next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+            submitted = await fill(submitted)
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
@@ -2,39 +2,170 @@ from superccm.impl.segment import segment
 from superccm.impl.skeleton.skeletonize import get_skeleton
 from superccm.impl.trunk.extract_trunks import extract_trunks
 from superccm.impl.graph.graphify import graphify
-from superccm.impl.graph.vis import vis_ACCM
-from superccm.impl.metircs.metrics import get_metrics
+from superccm.impl.metircs.metrics import get_metrics, required_stages, empty_metrics, METRICS
 from superccm.impl.io.read import read_image
+from superccm.impl.io.archive import MaskArchive
+from superccm.impl.utils.dedup import FrameDeduplicator
+from superccm.impl.result import AnalysisResult
+from superccm.impl.utils.quality import QualityGate
 from superccm.impl.utils.histogram_matching import histogram_standardization
 from superccm.impl.utils.ccm_vignetting import vignetting_correction
 from superccm.impl.utils.estimate_width import estimate_width
 
+import threading
 import numpy as np
 import cv2
 import networkx as nx
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping, Callable, Any
 
-segmenter = segment.CornealNerveSegmenter()
+_segmenter_lock = threading.Lock()
 
 
-def analysis(image_or_path) -> dict[str, float]:
+def get_segmenter() -> segment.CornealNerveSegmenter:
+    """ The segmenter shared by the API (api.segmenter), loaded on first use so that importing superccm needs no model """
+    global segmenter
+    if 'segmenter' not in globals():
+        with _segmenter_lock:
+            if 'segmenter' not in globals():
+                segmenter = segment.CornealNerveSegmenter()
+    return segmenter
+
+
+def __getattr__(name):
+    if name == 'segmenter':
+        return get_segmenter()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def analysis(image_or_path, include: Iterable[METRICS] | None = None,
+             gate: QualityGate | None = None) -> dict[str, float]:
+    """
+    Analyze an image. 'include' selects the metrics to compute; stages they don't need are skipped.
+    With a quality gate, rejected frames are not segmented (every metric is None) and empty masks give zero metrics.
+    The metrics stay flat: the gate report is in the result of analysis_full (result.quality).
+    """
+    return analysis_full(image_or_path, include=include, gate=gate).metrics
+
+
+def _is_empty(skeleton: np.ndarray) -> bool:
+    return cv2.countNonZero(skeleton) == 0
+
+
+def analysis_full(image_or_path, include: Iterable[METRICS] | None = None,
+                  gate: QualityGate | None = None) -> AnalysisResult:
+    """
+    Analyze an image and keep the stage outputs. The overlay and the other artifacts are computed on access.
+    Masks whose skeleton is empty give zero metrics without running graphify and trunk extraction.
+    :param gate: Optional quality gate, its report is stored in result.quality
+    """
     image = read(image_or_path)
+    quality = None
+    if gate is not None:
+        quality = gate.check_image(image)
+        if not quality['passed']:
+            return AnalysisResult(image, None, None, nx.MultiGraph(), None,
+                                  empty_metrics(include=include, measured=False), quality)
     binary = seg(image)
-    skeleton = skel(binary)
+    if gate is not None:
+        quality = gate.check_mask(binary, quality)
+    skeleton = None if quality is not None and not quality['passed'] else skel(binary)
+    # Nothing to measure
+    if skeleton is None or _is_empty(skeleton):
+        return AnalysisResult(image, binary, skeleton, nx.MultiGraph(), None, empty_metrics(include=include), quality)
     graph = grfy(image, skeleton)
-    graph, trunks = trunk(graph)
-    metrics = meas(graph, binary, trunks)
-    return metrics
+    trunks = None
+    if 'trunks' in required_stages(include):
+        graph, trunks = trunk(graph)
+    metrics = meas(graph, binary, trunks, include=include)
+    return AnalysisResult(image, binary, skeleton, graph, trunks, metrics, quality)
 
 
 def analysis_and_vis(image_or_path) -> tuple[dict[str, float], np.ndarray]:
+    result = analysis_full(image_or_path)
+    return result.metrics, result.overlay
+
+
+def batch_analysis(
+        items: Mapping[str, Any] | Iterable[tuple[str, Any]],
+        dedup: FrameDeduplicator | None = None,
+        include: Iterable[METRICS] | None = None,
+        gate: QualityGate | None = None,
+        reports: dict | None = None,
+) -> Iterator[tuple[str, dict[str, float]]]:
+    """
+    Analyze a batch of images lazily.
+    :param items: (key, image_or_path) pairs or a mapping
+    :param include: The metrics to compute, None means all
+    :param dedup: Opt-in. If given, duplicate frames skip segmentation and reuse the metrics of the frame they duplicate.
+                  dedup.duplicates records, for each skipped frame, the key whose metrics it got.
+    :param gate: Optional quality gate, see analysis
+    :param reports: If given with a gate, filled with the gate report of each analyzed key (not of duplicates)
+    :return: (key, metrics) pairs
+    """
+    pairs = items.items() if isinstance(items, Mapping) else items
+    reference_metrics = {}
+    for key, image_or_path in pairs:
+        image = read(image_or_path)
+        if dedup is not None:
+            reference = dedup.match(key, image)
+            if reference is not None:
+                yield key, dict(reference_metrics[reference])
+                continue
+        result = analysis_full(image, include=include, gate=gate)
+        metrics = result.metrics
+        if reports is not None and result.quality is not None:
+            reports[key] = result.quality
+        if dedup is not None:
+            reference_metrics[key] = metrics
+        yield key, metrics
+
+
+def analysis_from_binary(image_or_path, binary: np.ndarray,
+                         include: Iterable[METRICS] | None = None) -> dict[str, float]:
+    """ Run the stages after segmentation on a given (e.g. archived or externally produced) binary mask """
     image = read(image_or_path)
-    binary = seg(image)
+    binary = ((binary > 0) * 255).astype(np.uint8)
     skeleton = skel(binary)
+    if _is_empty(skeleton):
+        return empty_metrics(include=include)
     graph = grfy(image, skeleton)
-    graph, trunks = trunk(graph)
-    metrics = meas(graph, binary, trunks)
-    image_vis = vis_ACCM(graph, image)
-    return metrics, image_vis
+    trunks = None
+    if 'trunks' in required_stages(include):
+        graph, trunks = trunk(graph)
+    metrics = meas(graph, binary, trunks, include=include)
+    return metrics
+
+
+def build_mask_archive(path: str | Path, items: Iterable[tuple[str, Any]], mode='w') -> MaskArchive:
+    """
+    Segment every image once and store the masks in a MaskArchive.
+    :param path: The archive file
+    :param items: (key, image_or_path) pairs
+    :param mode: 'w' to create, 'a' to append
+    """
+    with MaskArchive(path, mode) as archive:
+        for key, image_or_path in items:
+            archive.add(key, seg(read(image_or_path)))
+    return MaskArchive(path)
+
+
+def replay(
+        masks: MaskArchive | Mapping[str, np.ndarray] | Iterable[tuple[str, np.ndarray]],
+        images: Mapping[str, Any] | Callable[[str], Any],
+        include: Iterable[METRICS] | None = None,
+) -> Iterator[tuple[str, dict[str, float]]]:
+    """
+    Re-run skeleton -> graph -> trunks -> metrics from stored masks, without the segmentation model.
+    :param masks: A MaskArchive, a mapping or (key, binary) pairs
+    :param images: The original image (or its path) of each key, as a mapping or a function of the key
+    :param include: The metrics to compute, None means all
+    :return: (key, metrics) pairs
+    """
+    get_image = images if callable(images) else images.__getitem__
+    pairs = masks.items() if isinstance(masks, (MaskArchive, Mapping)) else masks
+    for key, binary in pairs:
+        yield key, analysis_from_binary(get_image(key), binary, include=include)
 
 
 def read(image_or_path, **kwargs) -> np.ndarray:
@@ -44,7 +175,7 @@ def read(image_or_path, **kwargs) -> np.ndarray:
 def seg(image: np.ndarray) -> np.ndarray:
     if not image.shape == (384, 384):
         raise TypeError('This method is expected to input a grayscale image with a size of 384*384.')
-    return segmenter(image)
+    return get_segmenter()(image)
 
 
 def skel(binary: np.ndarray, **kwargs) -> np.ndarray:
@@ -61,8 +192,9 @@ def grfy(image: np.ndarray, skeleton_image: np.ndarray):
     return graphify(image, skeleton_image)
 
 
-def meas(graph: nx.MultiGraph, binary_image: np.ndarray, trunk_image: np.ndarray, decimal=3) -> dict[str, float]:
-    return get_metrics(graph, binary_image, trunk_image, decimal)
+def meas(graph: nx.MultiGraph, binary_image: np.ndarray, trunk_image: np.ndarray | None, decimal=3,
+         include: Iterable[METRICS] | None = None) -> dict[str, float]:
+    return get_metrics(graph, binary_image, trunk_image, decimal, include=include)
 
 
 def hist_std(image: np.ndarray) -> np.ndarray:
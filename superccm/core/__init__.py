@@ -1,2 +1,3 @@
 from .module import Module
 from .workflow import WorkFlow
+from .dag import DAGWorkFlow
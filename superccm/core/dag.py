@@ -0,0 +1,141 @@
+import contextvars
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Iterable
+
+from .module import Module
+from .workflow import WorkFlow
+
+
+class DAGWorkFlow(WorkFlow):
+    """
+    WorkFlow Interface whose execution order is derived from the Inputs/Outputs declared by its modules.
+    Modules whose inputs are ready run concurrently on a thread pool, each value is computed once per run,
+    and modules not needed for the requested targets are skipped.
+    """
+    Author: str
+    Version: str
+    # Values given to 'run' (positional arguments map to them in order)
+    Sources: tuple[str, ...] = ('image_or_path',)
+    # Values returned by 'run' by default
+    Targets: tuple[str, ...] = ('metrics',)
+    max_workers: int = 4
+
+    def __init__(self):
+        self.modules: dict[str, Module] = {name: module() for name, module in self.module_classes()}
+        self._producers: dict[str, str] = {}
+        for name, module in self.modules.items():
+            if not module.Outputs:
+                raise TypeError(f'<{type(module).__name__}> does not declare its Outputs.')
+            for output in module.Outputs:
+                if output in self._producers or output in self.Sources:
+                    raise ValueError(f'"{output}" is produced more than once (by {name}).')
+                self._producers[output] = name
+        for name, module in self.modules.items():
+            for value in module.Inputs:
+                if value not in self._producers and value not in self.Sources:
+                    raise ValueError(f'"{value}" required by {name} is neither a source nor produced by a module.')
+        self._check_acyclic()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def module_classes(cls) -> list[tuple[str, type[Module]]]:
+        """ The mounted modules (class attributes that are Module subclasses), including inherited ones """
+        modules = {}
+        for klass in reversed(cls.__mro__):
+            for name, item in vars(klass).items():
+                if inspect.isclass(item) and issubclass(item, Module):
+                    modules[name] = item
+        return list(modules.items())
+
+    def _dependencies(self, name: str) -> set[str]:
+        return {self._producers[value] for value in self.modules[name].Inputs if value in self._producers}
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f'The modules form a cycle through {name}.')
+            state[name] = 'visiting'
+            for dependency in self._dependencies(name):
+                visit(dependency)
+            state[name] = 'done'
+
+        for name in self.modules:
+            visit(name)
+
+    def plan(self, targets: Iterable[str] | None = None) -> set[str]:
+        """ The modules needed to produce the targets """
+        needed = set()
+        stack = [self._producers[t] for t in (targets or self.Targets) if t not in self.Sources]
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self._dependencies(name))
+        return needed
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='superccm-dag')
+            return self._executor
+
+    def _call(self, name: str, values: dict[str, Any]) -> dict[str, Any]:
+        module = self.modules[name]
+        result = module(*(values[value] for value in module.Inputs))
+        if len(module.Outputs) == 1:
+            return {module.Outputs[0]: result}
+        if not isinstance(result, tuple) or len(result) != len(module.Outputs):
+            raise ValueError(f'{name} should return {len(module.Outputs)} values: {module.Outputs}')
+        return dict(zip(module.Outputs, result))
+
+    def run_values(self, *args, targets: Iterable[str] | None = None, **kwargs) -> dict[str, Any]:
+        """ Run the modules needed for the targets and return every value computed in this run """
+        values = dict(zip(self.Sources, args))
+        values.update(kwargs)
+        missing = [source for source in self.Sources if source not in values]
+        if missing:
+            raise TypeError(f'Missing inputs: {missing}')
+
+        pending = self.plan(targets)
+        running = {}
+        try:
+            while pending or running:
+                ready = [name for name in pending
+                         if all(value in values for value in self.modules[name].Inputs)]
+                for name in ready:
+                    pending.discard(name)
+                    # Modules run in the caller's context, e.g. with its use_implementations selection
+                    context = contextvars.copy_context()
+                    running[self.executor.submit(context.run, self._call, name, dict(values))] = name
+                if not running:
+                    raise RuntimeError(f'Modules cannot be scheduled: {sorted(pending)}')
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    values.update(future.result())
+        finally:
+            for future in running:
+                future.cancel()
+        return values
+
+    def run(self, *args, targets: Iterable[str] | None = None, **kwargs):
+        """ Run the workflow. Returns the value of the single target, or a dict if there are several. """
+        targets = tuple(targets or self.Targets)
+        values = self.run_values(*args, targets=targets, **kwargs)
+        if len(targets) == 1:
+            return values[targets[0]]
+        return {target: values[target] for target in targets}
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -7,6 +7,10 @@ class Module:
     Author: str
     Version: str
     Function: Type
+    # Names of the values consumed and produced by 'run', used by DAGWorkFlow to connect modules.
+    # With several outputs, 'run' returns a tuple in the same order.
+    Inputs: tuple[str, ...] = ()
+    Outputs: tuple[str, ...] = ()
 
     def __init__(self):
         function = self.__class__.Function
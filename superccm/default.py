@@ -1,6 +1,14 @@
-from superccm.core import WorkFlow
+import threading
+
+import networkx as nx
+
+from superccm.core import WorkFlow, DAGWorkFlow
+from superccm.impl.result import AnalysisResult
+from superccm.impl.metircs.metrics import required_stages, empty_metrics
+from superccm.impl.utils.quality import QualityGate
 from superccm.impl.modules import (
-    ReadModule, SegModule, SkelModule, TrunkModule, GraphifyModule, MeasureModule
+    ReadModule, SegModule, SkelModule, TrunkModule, GraphifyModule, MeasureModule,
+    IntensityModule, BuildGraphModule,
 )
 
 
@@ -22,16 +30,76 @@ class DefaultWorkFlow(WorkFlow):
         self.trunk_module = self.TrunkModule()
         self.grfy_module = self.GraphifyModule()
         self.meas_module = self.MeasureModule()
-        self.image = None
-        self.graph = None
+        self._local = threading.local()
+
+    @property
+    def image(self):
+        """ The image of the last 'run' in the calling thread (kept for compatibility, prefer run_full) """
+        return getattr(self._local, 'image', None)
+
+    @property
+    def graph(self):
+        """ The graph of the last 'run' in the calling thread (kept for compatibility, prefer run_full) """
+        return getattr(self._local, 'graph', None)
 
-    def run(self, image_or_path):
+    def run_full(self, image_or_path, include=None, gate: QualityGate | None = None) -> AnalysisResult:
+        """
+        Analyze an image without touching the workflow, so that one workflow can be run from several threads.
+        :param image_or_path: Anything accepted by the ReadModule
+        :param include: The metrics to compute (see METRICS), None means all.
+                        Trunk extraction is skipped if no requested metric depends on it.
+        :param gate: Optional quality gate, as in api.analysis_full. Its report is stored in result.quality
+        """
         image = self.read_module(image_or_path)
-        self.image = image
+        quality = None
+        if gate is not None:
+            quality = gate.check_image(image)
+            if not quality['passed']:
+                return AnalysisResult(image, None, None, nx.MultiGraph(), None,
+                                      empty_metrics(include=include, measured=False), quality)
         binary = self.seg_module(image)
+        if gate is not None:
+            quality = gate.check_mask(binary, quality)
+            if not quality['passed']:
+                return AnalysisResult(image, binary, None, nx.MultiGraph(), None, empty_metrics(include=include), quality)
         skeleton = self.skel_module(binary)
         graph = self.grfy_module(image, skeleton)
-        graph, trunks = self.trunk_module(graph)
-        self.graph = graph
-        metrics = self.meas_module(graph, binary, trunks)
-        return metrics
+        trunks = None
+        if 'trunks' in required_stages(include):
+            graph, trunks = self.trunk_module(graph)
+        if include is None:
+            metrics = self.meas_module(graph, binary, trunks)
+        else:
+            metrics = self.meas_module(graph, binary, trunks, include=include)
+        return AnalysisResult(image, binary, skeleton, graph, trunks, metrics, quality)
+
+    def run(self, image_or_path, include=None, gate: QualityGate | None = None):
+        """ See run_full. Returns the metrics only. """
+        result = self.run_full(image_or_path, include, gate)
+        self._local.image = result.image
+        self._local.graph = result.graph
+        return result.metrics
+
+
+class DefaultDAGWorkFlow(DAGWorkFlow):
+    """
+    Default Workflow scheduled as a DAG: the intensity map is computed alongside segmentation and skeletonization.
+    It has no quality gate, use DefaultWorkFlow or api.analysis_full to gate frames.
+    """
+    Author = 'Official'
+    Version = '1.0.0'
+    Sources = ('image_or_path',)
+    Targets = ('metrics',)
+    ReadModule = ReadModule
+    SegModule = SegModule
+    SkelModule = SkelModule
+    IntensityModule = IntensityModule
+    GraphModule = BuildGraphModule
+    TrunkModule = TrunkModule
+    MeasureModule = MeasureModule
+
+    def run_full(self, image_or_path) -> AnalysisResult:
+        """ Analyze an image and return every intermediate value """
+        values = self.run_values(image_or_path)
+        return AnalysisResult(values['image'], values['binary'], values['skeleton'],
+                              values['trunk_graph'], values['trunks'], values['metrics'])
@@ -1,13 +1,16 @@
 import cv2
+from functools import partial
 import numpy as np
 import networkx as nx
+from scipy.ndimage import find_objects
 from superccm.impl.utils.tools import (
     get_split_label, get_coordinates, get_8_neighbors, get_conv2d,
-    get_canvas,
+    get_canvas, get_label_map, split_label_map,
 )
 from superccm.impl.utils.histogram_matching import histogram_standardization
 from superccm.impl.utils.ccm_vignetting import vignetting_correction
 from superccm.impl.utils.estimate_width import estimate_width
+from superccm.impl.implementations import register_implementation, get_implementation
 
 from typing import Literal
 
@@ -18,42 +21,126 @@ CLASSIFY_KERNEL = np.array([
 ], dtype='uint8')
 
 
+# Neighbour offsets (dy, dx) visited once per pixel pair, and whether the step is diagonal
+_STEPS = ((0, 1, False), (1, 0, False), (1, 1, True), (1, -1, True))
+
+
+def component_geometry(labels: np.ndarray, num: int, method: Literal['pairs', 'contour'] | None = None) -> list[dict]:
+    """
+    Geometry of all the connected components of a label map in one pass.
+
+    Length: with 'pairs', a simple 8-connected path is measured by counting its orthogonal (1) and diagonal (sqrt(2))
+    steps, other shapes (e.g. branching clusters) fall back to half the perimeter of their contour on a bbox crop.
+    'contour' (reference) measures every component by its contour. A single pixel has length 1.
+
+    :param labels: Label map, 0 is the background and components are 1..num
+    :param method: 'pairs' or 'contour', None means the selected one (see superccm.impl.implementations)
+    :return: One dict per component (label i at index i - 1):
+             {'length', 'centroid': (x, y), 'bbox': (x, y, w, h), 'endpoints': [(x, y), ...]}
+             Endpoints are the pixels with at most one neighbour in the component.
+    """
+    return get_implementation('geometry', method)(labels, num)
+
+
+def _component_geometry(labels: np.ndarray, num: int, path_lengths: bool = True) -> list[dict]:
+    h, w = labels.shape
+    ys, xs = np.nonzero(labels)
+    ids = labels[ys, xs]
+    count = np.bincount(ids, minlength=num + 1)
+    sum_x = np.bincount(ids, weights=xs, minlength=num + 1)
+    sum_y = np.bincount(ids, weights=ys, minlength=num + 1)
+
+    # Count adjacent pixel pairs inside each component and the degree of each pixel
+    padded = np.pad(labels, 1)
+    degree = np.zeros(padded.shape, dtype=np.int32)
+    orthogonal = np.zeros(num + 1, dtype=np.int64)
+    diagonal = np.zeros(num + 1, dtype=np.int64)
+    centre = padded[1:h + 1, 1:w + 1]
+    for dy, dx, is_diagonal in _STEPS:
+        shifted = padded[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx]
+        same = (centre == shifted) & (centre > 0)
+        pairs = np.bincount(centre[same], minlength=num + 1)
+        if is_diagonal:
+            diagonal += pairs
+        else:
+            orthogonal += pairs
+        degree[1:h + 1, 1:w + 1][same] += 1
+        degree[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx][same] += 1
+    pixel_degree = degree[ys + 1, xs + 1]
+    branching = np.bincount(ids[pixel_degree > 2], minlength=num + 1)
+    is_path = (orthogonal + diagonal == count - 1) & (branching == 0)
+
+    # Endpoints grouped by label, in row-major order
+    is_ep = pixel_degree <= 1
+    ep_ids, ep_xs, ep_ys = ids[is_ep], xs[is_ep], ys[is_ep]
+    order = np.argsort(ep_ids, kind='stable')
+    ep_bounds = np.cumsum(np.bincount(ep_ids, minlength=num + 1))
+
+    geometry = []
+    for i, sl in enumerate(find_objects(labels, num), start=1):
+        if count[i] == 1:
+            length = 1
+        elif path_lengths and is_path[i]:
+            length = float(orthogonal[i] + np.sqrt(2) * diagonal[i])
+        else:
+            crop = np.pad((labels[sl] == i).astype('uint8') * 255, 1)
+            contours, _ = cv2.findContours(crop, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+            length = sum(cv2.arcLength(c, True) / 2 for c in contours)
+        selected = order[ep_bounds[i - 1]:ep_bounds[i]]
+        geometry.append({
+            'length': length,
+            'centroid': (round(float(sum_x[i]) / int(count[i]), 2), round(float(sum_y[i]) / int(count[i]), 2)),
+            'bbox': (int(sl[1].start), int(sl[0].start), int(sl[1].stop - sl[1].start), int(sl[0].stop - sl[0].start)),
+            'endpoints': [(int(ep_xs[j]), int(ep_ys[j])) for j in selected],
+        })
+    return geometry
+
+
+register_implementation('geometry', 'pairs', _component_geometry)
+register_implementation('geometry', 'contour', partial(_component_geometry, path_lengths=False))
+
+
 class GraphComponent:
-    def __init__(self, canvas_, type_: Literal['End', 'Branch', 'Edge']):
+    def __init__(self, canvas_, type_: Literal['End', 'Branch', 'Edge'], geometry: dict | None = None):
+        """
+        :param geometry: Precomputed geometry (see component_geometry), computed on demand otherwise
+        """
         self.canvas = canvas_.copy()
         self.coords = get_coordinates(canvas_)
         self.type = type_
-        self._centroid = None
-        self._length = None
+        self._geometry = geometry
+
+    @property
+    def geometry(self) -> dict:
+        if self._geometry is None:
+            labels = (self.canvas > 0).astype(np.int32)
+            self._geometry = component_geometry(labels, 1)[0]
+        return self._geometry
 
     @property
-    def centroid(self):
-        if self._centroid is None:
-            n = len(self.coords)
-            x, y = zip(*self.coords)
-            centroid = round(sum(x) / n, 2), round(sum(y) / n, 2)
-            self._centroid = centroid
-        return self._centroid
+    def centroid(self) -> tuple[float, float]:
+        return self.geometry['centroid']
 
     @property
     def length(self):
         """
         The length of the line segment is 1 for horizontal or vertical connections, and sqrt(2) for diagonal connections
         """
-        if self._length is None:
-            if len(self.coords) == 1:
-                return 1
-            length = 0
-            contours, _ = cv2.findContours(self.canvas, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-            for c in contours:
-                length += cv2.arcLength(c, True) / 2
-            self._length = length
-        return self._length
+        return self.geometry['length']
+
+    @property
+    def bbox(self) -> tuple[int, int, int, int]:
+        """ (x, y, w, h) """
+        return self.geometry['bbox']
+
+    @property
+    def endpoints(self) -> list[tuple[int, int]]:
+        return self.geometry['endpoints']
 
 
 class GraphEdge(GraphComponent):
-    def __init__(self, canvas_, type_: Literal['End', 'Branch', 'Edge'] = 'Edge'):
-        super().__init__(canvas_, type_)
+    def __init__(self, canvas_, type_: Literal['End', 'Branch', 'Edge'] = 'Edge', geometry: dict | None = None):
+        super().__init__(canvas_, type_, geometry)
         self.intensity_median = None  # value in (0, 1]
         self.intensity_mean = None  # value also in (0, 1]
         self.color = 'black'
@@ -73,7 +160,7 @@ def skeleton_to_graph(skeleton: np.ndarray) -> nx.MultiGraph:
     skeleton_cls = get_conv2d(skeleton / 255, CLASSIFY_KERNEL)
 
     # Convert short links to dots
-    canvas_12 = get_canvas(1)
+    canvas_12 = get_canvas(1, skeleton.shape)
     canvas_12[skeleton_cls == 12] = 255
     for label in get_split_label(canvas_12):
         if cv2.countNonZero(label) <= 2:
@@ -83,56 +170,155 @@ def skeleton_to_graph(skeleton: np.ndarray) -> nx.MultiGraph:
     node_coords = {}
 
     # Add endpoint Node
-    canvas_eps = get_canvas(1)
+    canvas_eps = get_canvas(1, skeleton.shape)
     canvas_eps[skeleton_cls == 11] = 255
-    for idx, label in enumerate(get_split_label(canvas_eps)):
-        node = GraphComponent(label, 'End')
+    labels, num = get_label_map(canvas_eps)
+    for idx, (label, geometry) in enumerate(zip(split_label_map(labels, num), component_geometry(labels, num))):
+        node = GraphComponent(label, 'End', geometry)
         g.add_node(idx, obj=node)
-        coords = get_coordinates(label)
-        for coord in coords:
+        for coord in node.coords:
             node_coords[coord] = idx
 
     # Add branching point Node
-    canvas_eps = get_canvas(1)
+    canvas_eps = get_canvas(1, skeleton.shape)
     canvas_eps[skeleton_cls >= 13] = 255
     nodes_num = len(g.nodes)
-    for idx, label in enumerate(get_split_label(canvas_eps)):
-        node = GraphComponent(label, 'Branch')
+    labels, num = get_label_map(canvas_eps)
+    for idx, (label, geometry) in enumerate(zip(split_label_map(labels, num), component_geometry(labels, num))):
+        node = GraphComponent(label, 'Branch', geometry)
         g.add_node(idx + nodes_num, obj=node)
-        coords = get_coordinates(label)
-        for coord in coords:
+        for coord in node.coords:
             node_coords[coord] = idx + nodes_num
 
     # ADD Edge
-    canvas_eps = get_canvas(1)
+    canvas_eps = get_canvas(1, skeleton.shape)
     canvas_eps[skeleton_cls == 12] = 255
-    for idx, label in enumerate(get_split_label(canvas_eps)):
-        edge_cls = get_conv2d(label / 255, CLASSIFY_KERNEL)
-        edge_eps = get_coordinates(edge_cls, 11)
+    labels, num = get_label_map(canvas_eps)
+    for label, geometry in zip(split_label_map(labels, num), component_geometry(labels, num)):
+        edge = GraphEdge(label, geometry=geometry)
         node_ids = []
-        for ep in edge_eps:
+        for ep in edge.endpoints:
             ep_nbs = get_8_neighbors(*ep)
             for nb in ep_nbs:
                 if nb in node_coords:
                     node_ids.append(node_coords[nb])
         assert len(node_ids) == 2
-        edge = GraphEdge(label)
         g.add_edge(node_ids[0], node_ids[1], obj=edge)
 
     return g
 
 
+def translate_graph(graph: nx.MultiGraph, x: int, y: int, shape: tuple[int, int]) -> nx.MultiGraph:
+    """
+    Move a graph built on a crop into the coordinates of the whole image, in place.
+    :param x, y: Position of the crop in the image
+    :param shape: Shape of the image
+    """
+    objs = [data['obj'] for _, data in graph.nodes(data=True)] + [data['obj'] for _, _, data in graph.edges(data=True)]
+    for obj in objs:
+        h, w = obj.canvas.shape
+        canvas = get_canvas(1, shape)
+        canvas[y:y + h, x:x + w] = obj.canvas
+        obj.canvas = canvas
+        obj.coords = [(cx + x, cy + y) for cx, cy in obj.coords]
+        if obj._geometry is not None:
+            geometry = dict(obj._geometry)
+            # Same rounding as component_geometry on the whole image
+            xs, ys = zip(*obj.coords)
+            geometry['centroid'] = (round(float(sum(xs)) / len(xs), 2), round(float(sum(ys)) / len(ys), 2))
+            bx, by, bw, bh = geometry['bbox']
+            geometry['bbox'] = (bx + x, by + y, bw, bh)
+            geometry['endpoints'] = [(ex + x, ey + y) for ex, ey in geometry['endpoints']]
+            obj._geometry = geometry
+    return graph
+
+
+def get_intensity_map(image: np.ndarray, skeleton: np.ndarray | None = None) -> np.ndarray:
+    """
+    Standardized and vignetting-corrected intensity map.
+    It only depends on the image, so it can be computed once and reused for any skeleton of the same image.
+    """
+    image_std = histogram_standardization(image)
+    image_vig = vignetting_correction(image_std)
+    intensity_map = estimate_width(image_vig, skeleton)
+    return intensity_map
+
+
+def label_intensity(ids: np.ndarray, values: np.ndarray, num: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Median and mean of the values of each label in one sort, instead of one full-frame mask per label.
+    Same values as np.median / np.mean of each group.
+
+    :param ids: Label of each value, in 0..num-1
+    :param values: Pixel values
+    :return: (medians, means), NaN for empty labels
+    """
+    counts = np.bincount(ids, minlength=num)
+    order = np.lexsort((values, ids))
+    sorted_values = values[order].astype(np.float64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(num, np.nan)
+    means = np.full(num, np.nan)
+    nonempty = counts > 0
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    medians[nonempty] = (sorted_values[lo[nonempty]] + sorted_values[hi[nonempty]]) / 2
+    means[nonempty] = np.bincount(ids, weights=values.astype(np.float64), minlength=num)[nonempty] / counts[nonempty]
+    return medians, means
+
+
+def _assign_intensity_vectorized(edges: list[GraphEdge], intensity_map: np.ndarray):
+    """ One label-wise reduction over the pixels of all the edges """
+    edges = [edge for edge in edges if edge.coords]
+    if not edges:
+        return
+    xs, ys = np.array([coord for edge in edges for coord in edge.coords]).T
+    ids = np.repeat(np.arange(len(edges)), [len(edge.coords) for edge in edges])
+    medians, means = label_intensity(ids, intensity_map[ys, xs], len(edges))
+    for edge, median, mean in zip(edges, medians, means):
+        edge.intensity_median = median / 255
+        edge.intensity_mean = mean / 255
+
+
+def _assign_intensity_per_edge(edges: list[GraphEdge], intensity_map: np.ndarray):
+    """ Reference: one full-frame mask per edge """
+    for edge in edges:
+        edge.cal_intensity(intensity_map)
+
+
+register_implementation('intensity', 'vectorized', _assign_intensity_vectorized)
+register_implementation('intensity', 'per_edge', _assign_intensity_per_edge)
+
+
+def assign_intensity(graph: nx.MultiGraph, intensity_map: np.ndarray,
+                     method: Literal['vectorized', 'per_edge'] | None = None) -> nx.MultiGraph:
+    """
+    Assign intensity to every edge of the graph.
+    :param method: 'vectorized' or 'per_edge', None means the selected one (see superccm.impl.implementations)
+    """
+    edges = [
+        data['obj'] for _, _, _, data in graph.edges(keys=True, data=True)
+        if data['obj'].intensity_median is None or data['obj'].intensity_mean is None
+    ]
+    get_implementation('intensity', method)(edges, intensity_map)
+    return graph
+
+
+def build_graph(skeleton: np.ndarray, intensity_map: np.ndarray) -> nx.MultiGraph:
+    """ graphify with a precomputed intensity map (see get_intensity_map) """
+    graph = skeleton_to_graph(skeleton)
+    assign_intensity(graph, intensity_map)
+    return graph
+
+
 def graphify(
         image: np.ndarray,
         skeleton: np.ndarray,
 ) -> nx.MultiGraph:
     graph = skeleton_to_graph(skeleton)
     # Assignment intensity
-    image_std = histogram_standardization(image)
-    image_vig = vignetting_correction(image_std)
-    intensity_map = estimate_width(image_vig, skeleton)
-    for _, _, _, data in graph.edges(keys=True, data=True):
-        edge_obj = data['obj']
-        edge_obj.cal_intensity(intensity_map)
+    intensity_map = get_intensity_map(image, skeleton)
+    assign_intensity(graph, intensity_map)
 
     return graph
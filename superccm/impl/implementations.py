@@ -0,0 +1,155 @@
+"""
+Runtime switch between the reference and the optimized implementations of the pipeline kernels.
+
+stage               reference       alternatives
+'thinning'          'skimage'
+'reconstruction'    'dilation'      'label'
+'geometry'          'contour'       'pairs'
+'intensity'         'per_edge'      'vectorized'
+'shortest_path'     'python'        'numba'         (ep_path.shortest_path)
+'branch_points'     'python'        'numba'         (prune.extract_true_branch_points)
+'redundant_pixels'  'python'        'numba'         (prune.remove_redundant_pixels)
+
+The 'numba' kernels (superccm.impl.utils.numba_kernels) are the default when numba is installed.
+
+The selection is made, by order of precedence:
+- for a block of code, in the current thread or asyncio task only:
+      with use_implementations(reconstruction='dilation'): ...
+      with use_implementations('reference'): ...
+  It is a context variable: the executors of superccm (api.aio, DAGWorkFlow, OverlayWriter) run their tasks in
+  a copy of the caller's context, and run_batch passes the selection in effect to its worker processes.
+  Threads started elsewhere only see it if they run in a copy of the context (contextvars.copy_context().run).
+- for the process: set_implementation('reconstruction', 'dilation') or set_implementation('reference')
+- by the SUPERCCM_IMPL environment variable, read at import:
+      SUPERCCM_IMPL=reference                                   every kernel on its reference (instant fallback)
+      SUPERCCM_IMPL=reconstruction=dilation,intensity=per_edge
+
+Use superccm.impl.parity.run_parity to check an alternative against the reference before selecting it.
+"""
+import os
+import importlib.util
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+ENV_VAR = 'SUPERCCM_IMPL'
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+JIT_STAGES = ('shortest_path', 'branch_points', 'redundant_pixels')
+
+# Implementations of each stage, registered by the modules that define them
+_registry: dict[str, dict[str, Callable]] = {}
+REFERENCE: dict[str, str] = {
+    'thinning': 'skimage',
+    'reconstruction': 'dilation',
+    'geometry': 'contour',
+    'intensity': 'per_edge',
+    **dict.fromkeys(JIT_STAGES, 'python'),
+}
+DEFAULTS: dict[str, str] = {
+    'thinning': 'skimage',
+    'reconstruction': 'label',
+    'geometry': 'pairs',
+    'intensity': 'vectorized',
+    **dict.fromkeys(JIT_STAGES, 'numba' if NUMBA_AVAILABLE else 'python'),
+}
+
+_selected: dict[str, str] = dict(DEFAULTS)
+_overrides: ContextVar[dict[str, str] | None] = ContextVar('superccm_implementations', default=None)
+
+
+def register_implementation(stage: str, name: str, function: Callable):
+    """ Make an implementation of a stage selectable. All the implementations of a stage share one signature. """
+    if stage not in REFERENCE:
+        raise ValueError(f'Unknown stage: {stage}. Available: {list(REFERENCE)}')
+    _registry.setdefault(stage, {})[name] = function
+
+
+def available_implementations(stage: str | None = None) -> dict[str, list[str]] | list[str]:
+    """ Registered implementation names of a stage, or of every stage """
+    if stage is None:
+        return {s: list(_registry.get(s, {})) for s in REFERENCE}
+    return list(_registry.get(stage, {}))
+
+
+def _parse(selection: str | dict[str, str]) -> dict[str, str]:
+    """ 'reference', 'default', 'stage=name,...' or a dict of stage names """
+    if isinstance(selection, dict):
+        parsed = dict(selection)
+    elif selection.strip() in ('reference', 'default'):
+        parsed = dict(REFERENCE if selection.strip() == 'reference' else DEFAULTS)
+    else:
+        parsed = {}
+        for item in filter(None, (s.strip() for s in selection.split(','))):
+            stage, sep, name = item.partition('=')
+            if not sep:
+                raise ValueError(f'Invalid implementation selection: {item}. Expected "stage=name".')
+            parsed[stage.strip()] = name.strip()
+    unknown = set(parsed) - set(REFERENCE)
+    if unknown:
+        raise ValueError(f'Unknown stages: {sorted(unknown)}. Available: {list(REFERENCE)}')
+    return parsed
+
+
+def _check(stage: str, name: str):
+    # Names are checked once their module registered them
+    if stage in _registry and name not in _registry[stage]:
+        raise ValueError(f'Unknown {stage} implementation: {name}. Available: {list(_registry[stage])}')
+
+
+def set_implementation(stage_or_selection: str | dict[str, str], name: str | None = None):
+    """
+    Select implementations for the whole process.
+        set_implementation('reconstruction', 'dilation')
+        set_implementation('reference')
+        set_implementation({'reconstruction': 'dilation', 'intensity': 'per_edge'})
+    """
+    selection = _parse(stage_or_selection) if name is None else _parse({stage_or_selection: name})
+    for stage, impl in selection.items():
+        _check(stage, impl)
+    _selected.update(selection)
+
+
+@contextmanager
+def use_implementations(selection: str | dict[str, str] | None = None, **stages: str):
+    """
+    Select implementations inside a with block, for the current thread or asyncio task only
+    (and the tasks it submits to the executors of superccm, see the module docstring).
+        with use_implementations('reference'): ...
+        with use_implementations(reconstruction='dilation'): ...
+    """
+    parsed = {**(_parse(selection) if selection is not None else {}), **_parse(stages)}
+    for stage, impl in parsed.items():
+        _check(stage, impl)
+    token = _overrides.set({**(_overrides.get() or {}), **parsed})
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
+
+
+def current_implementations() -> dict[str, str]:
+    """ The implementation name in effect for every stage """
+    return {**_selected, **(_overrides.get() or {})}
+
+
+def get_implementation(stage: str, name: str | None = None) -> Callable:
+    """
+    The implementation of a stage.
+    :param name: An explicit choice, None means the one in effect (see current_implementations)
+    """
+    name = name or current_implementations()[stage]
+    implementations = _registry.get(stage, {})
+    if name not in implementations:
+        raise ValueError(f'Unknown {stage} implementation: {name}. Available: {list(implementations)}')
+    return implementations[name]
+
+
+def warmup():
+    """ Compile the selected JIT kernels, or load them from the disk cache, e.g. when a worker process starts """
+    if 'numba' in (current_implementations()[stage] for stage in JIT_STAGES):
+        from superccm.impl.utils.numba_kernels import warmup as warmup_numba
+        warmup_numba()
+
+
+if os.environ.get(ENV_VAR):
+    _selected.update(_parse(os.environ[ENV_VAR]))
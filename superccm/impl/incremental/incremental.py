@@ -0,0 +1,215 @@
+"""
+Incremental re-analysis after local edits of the binary mask.
+
+Every stage after segmentation works independently on each 8-connected region of the mask:
+the skeleton of a region lies inside it, graph components and trunk paths never cross regions,
+and the intensity map only depends on the image.
+So after an edit, only the regions touching the edited pixels are re-analyzed, each on a crop around it,
+and the metrics are recomposed from cached per-region contributions.
+"""
+import cv2
+import numpy as np
+import networkx as nx
+
+from superccm.impl.skeleton.skeletonize import get_skeleton
+from superccm.impl.graph.graphify import skeleton_to_graph, get_intensity_map, assign_intensity, translate_graph
+from superccm.impl.trunk.extract_trunks import extract_trunks
+from superccm.impl.metircs.metrics import cal_total_length, compose_metrics
+from superccm.impl.metircs.extract_trunk import get_trunk_objs
+from superccm.impl.metircs.fracdim import fractal_dimension
+from superccm.impl.metircs.tc import get_tc
+from superccm.impl.metircs.utils import graph_to_skeleton
+from superccm.impl.utils.tools import get_canvas, get_split_label
+
+DILATE_KERNEL = np.ones((3, 3), dtype=np.uint8)
+# Background kept around a region when it is cropped, wider than the 3*3 neighbourhoods of the pipeline
+CROP_MARGIN = 2
+
+
+class ComponentRecord:
+    """ Analysis results and metric contributions of one connected region of the mask """
+
+    def __init__(self, area_pixels: int, graph: nx.MultiGraph, skeleton: np.ndarray, trunk_image: np.ndarray,
+                 origin: tuple[int, int] = (0, 0)):
+        """
+        :param graph: The graph of the region, in image coordinates
+        :param origin: (x, y) of skeleton and trunk_image in the image, when they are crops
+        """
+        x, y = origin
+        self.graph = graph
+        ys, xs = np.nonzero(skeleton)
+        self.skeleton_coords = (ys + y, xs + x)
+        ys, xs = np.nonzero(trunk_image)
+        self.trunk_coords = (ys + y, xs + x)
+
+        trunks = get_trunk_objs(graph)
+        self.total_length = cal_total_length(graph)
+        self.n_trunks = len(trunks)
+        self.n_trunk_branches = sum([n.type == 'Branch' for trunk in trunks for n in trunk['node_objs']])
+        self.n_branches = sum([data['obj'].type == 'Branch' for _, data in graph.nodes(data=True)])
+        self.tortuosities = [get_tc(label) for label in get_split_label(trunk_image)]
+        # The region is kept by the reconstruction only if the skeleton reaches it
+        self.kept = graph.number_of_nodes() > 0 and bool(np.any(graph_to_skeleton(graph)))
+        self.area_pixels = area_pixels if self.kept else 0
+
+
+class AnalysisState:
+    """ Cached analysis of one image, updated in place by update_analysis """
+
+    def __init__(self, image: np.ndarray, binary: np.ndarray, intensity_map: np.ndarray,
+                 labels: np.ndarray, records: dict[int, ComponentRecord], decimal=3):
+        self.image = image
+        self.binary = binary
+        self.intensity_map = intensity_map
+        self.labels = labels
+        self.records = records
+        self.decimal = decimal
+        self.metrics = self.compose()
+
+    @property
+    def skeleton(self) -> np.ndarray:
+        canvas = get_canvas(1, self.binary.shape)
+        for record in self.records.values():
+            canvas[record.skeleton_coords] = 255
+        return canvas
+
+    @property
+    def trunk_image(self) -> np.ndarray:
+        canvas = get_canvas(1, self.binary.shape)
+        for record in self.records.values():
+            canvas[record.trunk_coords] = 255
+        return canvas
+
+    @property
+    def reconstructed(self) -> np.ndarray:
+        kept = [label for label, record in self.records.items() if record.kept]
+        return np.isin(self.labels, kept).astype(np.uint8) * 255
+
+    @property
+    def graph(self) -> nx.MultiGraph:
+        """ The graph of the whole image (node ids are renumbered) """
+        graphs = [record.graph for record in self.records.values()]
+        if not graphs:
+            return nx.MultiGraph()
+        return nx.disjoint_union_all(graphs)
+
+    def compose(self) -> dict[str, float]:
+        records = self.records.values()
+        return compose_metrics(
+            total_length=sum(r.total_length for r in records),
+            n_trunks=sum(r.n_trunks for r in records),
+            n_trunk_branches=sum(r.n_trunk_branches for r in records),
+            n_branches=sum(r.n_branches for r in records),
+            area_pixels=sum(r.area_pixels for r in records),
+            fractal_dim=fractal_dimension(self.reconstructed),
+            tortuosities=[tc for r in records for tc in r.tortuosities],
+            decimal=self.decimal,
+        )
+
+
+def _label_components(binary: np.ndarray) -> tuple[int, np.ndarray]:
+    return cv2.connectedComponents((binary > 0).astype(np.uint8), connectivity=8)
+
+
+def _analyze_component(component: np.ndarray, intensity_map: np.ndarray) -> ComponentRecord:
+    """ Run skeleton -> graph -> trunks on a single region, cropped to its bounding box and a margin """
+    x, y, w, h = cv2.boundingRect(component.astype(np.uint8))
+    x0, y0 = max(x - CROP_MARGIN, 0), max(y - CROP_MARGIN, 0)
+    x1, y1 = min(x + w + CROP_MARGIN, component.shape[1]), min(y + h + CROP_MARGIN, component.shape[0])
+    window = (x0, y0, x1 - x0, y1 - y0)
+
+    binary = component[y0:y1, x0:x1].astype(np.uint8) * 255
+    skeleton = get_skeleton(binary, window=window)
+    graph = skeleton_to_graph(skeleton)
+    assign_intensity(graph, intensity_map[y0:y1, x0:x1])
+    graph, trunk_image = extract_trunks(graph, window)
+    translate_graph(graph, x0, y0, component.shape)
+    return ComponentRecord(int(np.count_nonzero(binary)), graph, skeleton, trunk_image, (x0, y0))
+
+
+def _split_by_component(labels: np.ndarray, num: int, graph: nx.MultiGraph,
+                        skeleton: np.ndarray, trunk_image: np.ndarray) -> dict[int, ComponentRecord]:
+    """ Split a whole-image analysis into per-region records """
+    areas = np.bincount(labels.ravel(), minlength=num)
+    graphs = {label: [] for label in range(1, num)}
+    for nodes in nx.connected_components(graph):
+        x, y = graph.nodes[next(iter(nodes))]['obj'].coords[0]
+        graphs[int(labels[y, x])].append(nodes)
+
+    records = {}
+    for label in range(1, num):
+        region = labels == label
+        sub = graph.subgraph([n for nodes in graphs[label] for n in nodes]).copy()
+        records[label] = ComponentRecord(
+            int(areas[label]), sub,
+            np.where(region, skeleton, 0), np.where(region, trunk_image, 0),
+        )
+    return records
+
+
+def init_analysis(image: np.ndarray, binary: np.ndarray, graph: nx.MultiGraph | None = None,
+                  trunk_image: np.ndarray | None = None, decimal=3) -> AnalysisState:
+    """
+    Analyze an image once and keep the state for incremental updates.
+
+    :param image: The CCM image
+    :param binary: The binary mask (0/255)
+    :param graph: The trunk-labelled graph, if the image has already been analyzed
+    :param trunk_image: The trunk image, if the image has already been analyzed
+    """
+    intensity_map = get_intensity_map(image)
+    if graph is None or trunk_image is None:
+        skeleton = get_skeleton(binary)
+        graph = assign_intensity(skeleton_to_graph(skeleton), intensity_map)
+        graph, trunk_image = extract_trunks(graph)
+    else:
+        skeleton = graph_to_skeleton(graph)
+
+    num, labels = _label_components(binary)
+    records = _split_by_component(labels, num, graph, skeleton, trunk_image)
+    return AnalysisState(image, binary.copy(), intensity_map, labels, records, decimal)
+
+
+def update_analysis(
+        state: AnalysisState,
+        binary: np.ndarray,
+        region: tuple[int, int, int, int] | None = None,
+) -> dict[str, float]:
+    """
+    Update the analysis after the mask has been edited.
+    Only the regions of the mask touching edited pixels are re-analyzed.
+
+    :param state: The state returned by init_analysis, updated in place
+    :param binary: The edited binary mask (0/255)
+    :param region: (x, y, w, h) of the edited area. If None, the edit is found by comparing with the previous mask
+    :return: The updated metrics
+    """
+    changed = (state.binary > 0) != (binary > 0)
+    if region is not None:
+        x, y, w, h = region
+        window = np.zeros_like(changed)
+        window[max(y, 0):y + h, max(x, 0):x + w] = True
+        changed &= window
+    if not np.any(changed):
+        return state.metrics
+
+    # Pixels whose region may have changed: the edited pixels and their 8-neighbours
+    touched = cv2.dilate(changed.astype(np.uint8), DILATE_KERNEL) > 0
+
+    num, labels = _label_components(binary)
+    affected = np.unique(labels[touched])
+    affected = affected[affected > 0]
+
+    # Untouched regions are identical to a region of the previous mask, reuse their records
+    reused = (labels > 0) & ~np.isin(labels, affected)
+    pairs = np.unique(np.stack([labels[reused], state.labels[reused]], axis=1), axis=0)
+    records = {int(new): state.records[int(old)] for new, old in pairs}
+
+    for label in affected:
+        records[int(label)] = _analyze_component(labels == label, state.intensity_map)
+
+    state.binary = binary.copy()
+    state.labels = labels
+    state.records = records
+    state.metrics = state.compose()
+    return state.metrics
@@ -0,0 +1,167 @@
+"""
+Frame sources: stream (key, image) pairs lazily from multi-frame containers, without exploding them to disk.
+
+    for key, image in iter_frames('exam.zip'):
+        ...
+    for key, metrics in batch_analysis(iter_frames('P001_OD.tif')):
+        ...
+
+Keys are '<name>' for a single image and '<name>#<frame index>' for the frames of a multipage TIFF or a video.
+<name> is the file name without its suffix, or in a directory, the path relative to it without the suffix.
+Inside an archive, <name> is the member path.
+Only one frame (or one archive member) is held in memory at a time.
+"""
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+import numpy as np
+import cv2
+from PIL import Image, ImageSequence
+from pathlib import Path
+from typing import Iterator, Literal, Callable
+
+from superccm.impl.io.read import read_image
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+TIFF_SUFFIXES = ('.tif', '.tiff')
+VIDEO_SUFFIXES = ('.avi', '.mp4', '.mov', '.mkv', '.wmv')
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def _suffix(name: str) -> str:
+    name = name.lower()
+    for suffix in TAR_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return os.path.splitext(name)[1]
+
+
+def _pil_to_gray(frame: Image.Image) -> Image.Image:
+    """ 16-bit frames are rescaled to 8 bits instead of being clipped by PIL, 32-bit and float ones by their maximum """
+    if frame.mode in ('I;16', 'I;16B', 'I;16L'):
+        array = np.asarray(frame, dtype=np.float64) / 257
+    elif frame.mode in ('I', 'F'):
+        array = np.asarray(frame, dtype=np.float64)
+        high = array.max()
+        array = array * (255.0 / high) if high > 0 else array
+    else:
+        return frame
+    return Image.fromarray(np.round(array).clip(0, 255).astype(np.uint8))
+
+
+def iter_tiff(
+        file: str | Path | io.BytesIO,
+        name: str | None = None,
+        image_type: Literal['gray', 'color'] = 'gray',
+) -> Iterator[tuple[str, np.ndarray]]:
+    """ Frames of a (multipage) TIFF, decoded one page at a time """
+    name = name or Path(str(file)).stem
+    with Image.open(file) as tiff:
+        n_frames = getattr(tiff, 'n_frames', 1)
+        for index, frame in enumerate(ImageSequence.Iterator(tiff)):
+            key = name if n_frames == 1 else f'{name}#{index}'
+            yield key, read_image(_pil_to_gray(frame), image_type)
+
+
+def iter_video(
+        path: str | Path,
+        name: str | None = None,
+        step: int = 1,
+        image_type: Literal['gray', 'color'] = 'gray',
+) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    Frames of a video (e.g. an HRT AVI sequence), decoded one by one.
+    :param step: Keep one frame out of 'step'
+    """
+    name = name or Path(str(path)).stem
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise IOError(f'Unable to open video: {path}')
+    try:
+        index = 0
+        while True:
+            if index % step:
+                ok = capture.grab()
+            else:
+                ok, frame = capture.read()
+                if ok:
+                    yield f'{name}#{index}', read_image(frame, image_type)
+            if not ok:
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def _iter_member(name: str, read: Callable[[], bytes],
+                 image_type: Literal['gray', 'color']) -> Iterator[tuple[str, np.ndarray]]:
+    """ Frames of one archive member, given a function returning its content """
+    suffix = _suffix(name)
+    if suffix in TIFF_SUFFIXES:
+        yield from iter_tiff(io.BytesIO(read()), name, image_type)
+    elif suffix in IMAGE_SUFFIXES:
+        yield name, read_image(read(), image_type)
+    elif suffix in VIDEO_SUFFIXES:
+        # OpenCV only decodes videos from files: spool this member to a temporary file
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'member' + suffix)
+            with open(path, 'wb') as f:
+                f.write(read())
+            yield from iter_video(path, name, image_type=image_type)
+
+
+def iter_zip(path: str | Path, image_type: Literal['gray', 'color'] = 'gray') -> Iterator[tuple[str, np.ndarray]]:
+    """ Frames of the images, TIFFs and videos stored in a zip file, read member by member """
+    with zipfile.ZipFile(path) as archive:
+        for info in sorted(archive.infolist(), key=lambda i: i.filename):
+            if info.is_dir():
+                continue
+            yield from _iter_member(info.filename, lambda: archive.read(info), image_type)
+
+
+def iter_tar(path: str | Path, image_type: Literal['gray', 'color'] = 'gray') -> Iterator[tuple[str, np.ndarray]]:
+    """ Frames of the images, TIFFs and videos stored in a (compressed) tar file, read as a stream in archive order """
+    with tarfile.open(path, 'r|*') as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            member = archive.extractfile(info)
+            yield from _iter_member(info.name, member.read, image_type)
+
+
+def iter_frames(
+        source: str | Path,
+        image_type: Literal['gray', 'color'] = 'gray',
+) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    (key, image) pairs of any source: a directory (walked recursively, in name order), a zip or tar archive,
+    a multipage TIFF, a video or a single image file. The pairs can be given directly to batch_analysis.
+    """
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(p for p in source.rglob('*') if p.is_file()):
+            suffix = _suffix(path.name)
+            name = path.relative_to(source).with_suffix('').as_posix()
+            # Files are decoded from disk, a multipage TIFF one page at a time
+            if suffix in TIFF_SUFFIXES:
+                yield from iter_tiff(path, name, image_type)
+            elif suffix in VIDEO_SUFFIXES:
+                yield from iter_video(path, name, image_type=image_type)
+            elif suffix in IMAGE_SUFFIXES:
+                yield name, read_image(path, image_type)
+        return
+
+    suffix = _suffix(source.name)
+    if suffix in ZIP_SUFFIXES:
+        yield from iter_zip(source, image_type)
+    elif suffix in TAR_SUFFIXES:
+        yield from iter_tar(source, image_type)
+    elif suffix in TIFF_SUFFIXES:
+        yield from iter_tiff(source, image_type=image_type)
+    elif suffix in VIDEO_SUFFIXES:
+        yield from iter_video(source, image_type=image_type)
+    else:
+        yield source.stem, read_image(source, image_type)
@@ -0,0 +1,132 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import cv2
+import networkx as nx
+
+from superccm.impl.graph.vis import render_ACCM
+
+
+def montage(images: Sequence[np.ndarray], cols: int = 4, pad: int = 2, pad_value: int = 255) -> np.ndarray:
+    """
+    Tile images into one contact sheet. Grayscale images are converted to BGR, smaller images are padded to the largest tile.
+
+    :param images: The images to tile
+    :param cols: Number of tiles per row
+    :param pad: Gap between tiles (pixels)
+    :param pad_value: Gap color
+    :return: The montage sheet (BGR)
+    """
+    if not len(images):
+        raise ValueError('At least one image is required to build a montage.')
+    tiles = [cv2.cvtColor(im, cv2.COLOR_GRAY2BGR) if im.ndim == 2 else im for im in images]
+    tile_h = max(t.shape[0] for t in tiles)
+    tile_w = max(t.shape[1] for t in tiles)
+    cols = min(cols, len(tiles))
+    rows = (len(tiles) + cols - 1) // cols
+
+    sheet = np.full((rows * (tile_h + pad) + pad, cols * (tile_w + pad) + pad, 3), pad_value, dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        r, c = divmod(i, cols)
+        y, x = pad + r * (tile_h + pad), pad + c * (tile_w + pad)
+        sheet[y:y + tile.shape[0], x:x + tile.shape[1]] = tile.astype(np.uint8)
+    return sheet
+
+
+class OverlayWriter:
+    """
+    Encode and write overlays on a thread pool, so that the analysis loop only pays for submitting them.
+    OpenCV releases the GIL while encoding, so several images are encoded in parallel.
+    Images are copied when they are submitted, so the caller can reuse its frame buffers right away.
+
+    Usage:
+        with OverlayWriter('out', ext='.jpg', params=[cv2.IMWRITE_JPEG_QUALITY, 90]) as writer:
+            for key, image in frames:
+                ...
+                writer.render(key, graph, image)
+    """
+
+    def __init__(
+            self,
+            out_dir: str | Path,
+            ext: str = '.png',
+            params: Sequence[int] | None = None,
+            max_workers: int = 4,
+            max_pending: int = 64,
+    ):
+        """
+        :param out_dir: Output directory. Keys are used as file names relative to it
+        :param ext: Encoding format, e.g. '.png' or '.jpg'
+        :param params: Extra parameters for cv2.imencode
+        :param max_workers: Number of encoding threads
+        :param max_pending: Submitting blocks once this many images are waiting, which bounds memory
+        """
+        self.out_dir = Path(out_dir)
+        self.ext = ext if ext.startswith('.') else '.' + ext
+        self.params = list(params) if params else []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='superccm-writer')
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._futures: list[Future] = []
+
+    def _path(self, key) -> Path:
+        return self.out_dir / f'{key}{self.ext}'
+
+    def _encode_and_write(self, path: Path, image: np.ndarray) -> Path:
+        retval, buffer = cv2.imencode(self.ext, image.astype('uint8'), self.params)
+        if not retval:
+            raise IOError(f'Unable to encode image as {self.ext}: {path}')
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(buffer)
+        return path
+
+    def _submit(self, function, *args) -> Future:
+        self._pending.acquire()
+        future = self._executor.submit(contextvars.copy_context().run, function, *args)
+        future.add_done_callback(lambda _: self._pending.release())
+        self._futures.append(future)
+        return future
+
+    def write(self, key, image: np.ndarray) -> Future:
+        """ Write a rendered overlay. Returns a Future resolving to the written path. """
+        return self._submit(self._encode_and_write, self._path(key), np.array(image, copy=True))
+
+    def render(self, key, graph: nx.MultiGraph, background: np.ndarray | None = None) -> Future:
+        """ Render the ACCMetrics-style overlay in the pool and write it. """
+        background = None if background is None else np.array(background, copy=True)
+
+        def task():
+            return self._encode_and_write(self._path(key), render_ACCM(graph, background))
+
+        return self._submit(task)
+
+    def write_montage(self, key, images: Sequence[np.ndarray], cols: int = 4) -> Future:
+        """ Tile the images into a contact sheet and write it. """
+        images = [np.array(image, copy=True) for image in images]
+
+        def task():
+            return self._encode_and_write(self._path(key), montage(images, cols))
+
+        return self._submit(task)
+
+    def wait(self) -> list[Path]:
+        """ Block until everything submitted so far is written, re-raising the first error. """
+        futures, self._futures = self._futures, []
+        return [future.result() for future in futures]
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
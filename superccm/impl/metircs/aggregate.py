@@ -0,0 +1,133 @@
+import math
+from typing import Iterable, Iterator, Callable, Hashable
+
+from superccm.impl.metircs.metrics import METRIC_NAMES
+
+
+class RunningStats:
+    """ Running count / mean / variance / min / max of a stream of numbers (Welford's algorithm) """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float | None):
+        """ Add a value. None (e.g. CNFT without trunks) is skipped. """
+        if value is None:
+            return
+        value = float(value)
+        if math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def variance(self) -> float | None:
+        """ Sample variance (ddof=1) """
+        if self.count < 2:
+            return None
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self) -> float | None:
+        variance = self.variance
+        return None if variance is None else math.sqrt(variance)
+
+    def to_dict(self) -> dict[str, float | None]:
+        empty = self.count == 0
+        return {
+            'count': self.count,
+            'mean': None if empty else self.mean,
+            'var': self.variance,
+            'std': self.std,
+            'min': None if empty else self.min,
+            'max': None if empty else self.max,
+        }
+
+
+class MetricsAggregator:
+    """
+    Online per-subject (per-eye / per-patient) aggregation of the metrics of several frames.
+    Memory only depends on the number of open subjects, not on the number of frames.
+    """
+
+    def __init__(self, fields: Iterable[str] = METRIC_NAMES):
+        self.fields = tuple(fields)
+        self._stats: dict[Hashable, dict[str, RunningStats]] = {}
+        self._frames: dict[Hashable, int] = {}
+
+    def update(self, subject: Hashable, metrics: dict[str, float | None]):
+        """ Add the metrics of one frame of the subject """
+        if subject not in self._stats:
+            self._stats[subject] = {field: RunningStats() for field in self.fields}
+            self._frames[subject] = 0
+        self._frames[subject] += 1
+        stats = self._stats[subject]
+        for field in self.fields:
+            stats[field].update(metrics.get(field))
+
+    def summary(self, subject: Hashable) -> dict:
+        """
+        :return: {'n_frames': n, 'CNFL': {'count', 'mean', 'var', 'std', 'min', 'max'}, ...}
+        """
+        summary = {'n_frames': self._frames[subject]}
+        for field, stats in self._stats[subject].items():
+            summary[field] = stats.to_dict()
+        return summary
+
+    def pop(self, subject: Hashable) -> dict:
+        """ Return the summary of the subject and forget it """
+        summary = self.summary(subject)
+        del self._stats[subject]
+        del self._frames[subject]
+        return summary
+
+    @property
+    def subjects(self) -> list[Hashable]:
+        return list(self._stats)
+
+    def __contains__(self, subject) -> bool:
+        return subject in self._stats
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+
+def aggregate_stream(
+        stream: Iterable[tuple[str, dict[str, float | None]]],
+        subject_of: Callable[[str], Hashable],
+        grouped: bool = True,
+        fields: Iterable[str] = METRIC_NAMES,
+) -> Iterator[tuple[Hashable, dict]]:
+    """
+    Aggregate a (key, metrics) stream, e.g. from batch_analysis, into per-subject summaries.
+
+    :param stream: (key, metrics) pairs
+    :param subject_of: Maps a frame key to its subject, e.g. lambda key: key.rsplit('_', 1)[0]
+    :param grouped: If the frames of a subject are contiguous, a summary is emitted as soon as the subject changes,
+                    and only one subject is held in memory. A subject that shows up again after its summary was
+                    emitted raises ValueError. With grouped=False, all summaries are emitted at the end.
+    :return: (subject, summary) pairs
+    """
+    aggregator = MetricsAggregator(fields)
+    current = None
+    emitted = set()
+    for key, metrics in stream:
+        subject = subject_of(key)
+        if grouped and current is not None and subject != current and current in aggregator:
+            yield current, aggregator.pop(current)
+            emitted.add(current)
+        if subject in emitted:
+            raise ValueError(f'The frames of {subject!r} are not contiguous (at {key!r}), use grouped=False.')
+        current = subject
+        aggregator.update(subject, metrics)
+
+    for subject in aggregator.subjects:
+        yield subject, aggregator.pop(subject)
@@ -0,0 +1,170 @@
+"""
+Per-edge and per-trunk feature tables, as NumPy structured arrays.
+
+    edges, trunks = graph_features(graph, key='P001_OD#3', trunk_image=trunk_image)
+    edges[edges['is_trunk']]['length']
+
+Tables of several images are stacked with stack_features, and written to Parquet with write_parquet (needs pyarrow).
+Lengths are in pixels, intensities in (0, 1], NaN where undefined.
+"""
+import numpy as np
+import networkx as nx
+
+from superccm.impl.metircs.tc import get_tc
+from superccm.impl.metircs.extract_trunk import get_trunk_objs
+from superccm.impl.utils.tools import get_label_map, split_label_map
+
+from typing import Iterable
+
+NODE_TYPE_DTYPE = 'U6'
+
+EDGE_DTYPE = np.dtype([
+    ('u', 'i4'),
+    ('v', 'i4'),
+    ('key', 'i4'),
+    ('length', 'f8'),
+    ('intensity_mean', 'f8'),
+    ('intensity_median', 'f8'),
+    ('is_trunk', '?'),
+    ('trunk', 'i4'),  # Row of the trunk table, -1 for non-trunk edges
+    ('u_type', NODE_TYPE_DTYPE),  # 'End' or 'Branch'
+    ('v_type', NODE_TYPE_DTYPE),
+    ('tortuosity', 'f8'),  # Arc length / chord length between the two ends of the edge
+    ('centroid_x', 'f8'),
+    ('centroid_y', 'f8'),
+])
+
+TRUNK_DTYPE = np.dtype([
+    ('trunk', 'i4'),
+    ('n_edges', 'i4'),
+    ('n_nodes', 'i4'),
+    ('n_branches', 'i4'),
+    ('length', 'f8'),  # Sum of the lengths of its edges and nodes
+    ('intensity_mean', 'f8'),  # Mean intensity of its edges, weighted by their length
+    ('tortuosity', 'f8'),  # Tortuosity coefficient (Kallinikos et al., see tc.py) of its region of the trunk image
+])
+
+
+def _arc_chord(lengths: np.ndarray, endpoints: list[list[tuple[int, int]]]) -> np.ndarray:
+    """ Arc / chord ratio of the edges, NaN when the edge has no two distinct ends """
+    ends = np.full((len(endpoints), 4), np.nan)
+    for i, points in enumerate(endpoints):
+        if len(points) >= 2:
+            ends[i] = (*points[0], *points[-1])
+    chord = np.hypot(ends[:, 2] - ends[:, 0], ends[:, 3] - ends[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = lengths / chord
+    ratio[~(chord > 0)] = np.nan
+    return ratio
+
+
+def _trunk_tortuosities(trunk_groups: list[dict], trunk_image: np.ndarray) -> list[float]:
+    """
+    Tortuosity of each trunk, computed like CNFT: get_tc on the 8-connected regions of the trunk image (0/255 uint8).
+    A trunk takes the region that most of its edge pixels fall in.
+    """
+    labels, num = get_label_map(trunk_image)
+    regions = split_label_map(labels, num)
+    tcs = {}
+    result = []
+    for group in trunk_groups:
+        pixels = sum(obj.canvas > 0 for obj in group['edge_objs'])
+        overlap = np.bincount(labels[pixels > 0], minlength=num + 1)[1:] if num else np.zeros(0)
+        if not np.any(overlap):
+            result.append(np.nan)
+            continue
+        region = int(np.argmax(overlap))
+        if region not in tcs:
+            tcs[region] = get_tc(regions[region])
+        result.append(tcs[region])
+    return result
+
+
+def graph_features(graph: nx.MultiGraph, key: str | None = None,
+                   trunk_image: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Feature tables of a graph (after trunk extraction, otherwise no edge is a trunk).
+
+    :param key: If given, an 'image' column holding it is added in front of both tables
+    :param trunk_image: The trunk image returned by extract_trunks, for the tortuosity of the trunks (NaN without it).
+                        Their mean is then the CNFT of get_metrics
+    :return: (edges, trunks) structured arrays of EDGE_DTYPE and TRUNK_DTYPE
+    """
+    node_types = {n: data['obj'].type for n, data in graph.nodes(data=True)}
+    trunk_groups = get_trunk_objs(graph)
+    trunk_of = {}
+    for i, group in enumerate(trunk_groups):
+        for edge_obj in group['edge_objs']:
+            trunk_of[id(edge_obj)] = i
+
+    edge_data = list(graph.edges(keys=True, data=True))
+    edges = np.zeros(len(edge_data), dtype=EDGE_DTYPE)
+    objs = [data['obj'] for _, _, _, data in edge_data]
+    if edge_data:
+        u, v, k, _ = zip(*edge_data)
+        edges['u'], edges['v'], edges['key'] = u, v, k
+        edges['length'] = [obj.length for obj in objs]
+        edges['intensity_mean'] = [np.nan if obj.intensity_mean is None else obj.intensity_mean for obj in objs]
+        edges['intensity_median'] = [np.nan if obj.intensity_median is None else obj.intensity_median for obj in objs]
+        edges['is_trunk'] = [obj.is_trunk for obj in objs]
+        edges['trunk'] = [trunk_of.get(id(obj), -1) for obj in objs]
+        edges['u_type'] = [node_types[n] for n in u]
+        edges['v_type'] = [node_types[n] for n in v]
+        edges['tortuosity'] = _arc_chord(edges['length'], [obj.endpoints for obj in objs])
+        edges['centroid_x'], edges['centroid_y'] = np.array([obj.centroid for obj in objs], dtype=np.float64).T
+
+    trunks = np.zeros(len(trunk_groups), dtype=TRUNK_DTYPE)
+    if trunk_groups:
+        in_trunk = edges['trunk'] >= 0
+        ids = edges['trunk'][in_trunk]
+        weights = edges['length'][in_trunk]
+        intensity = np.nan_to_num(edges['intensity_mean'][in_trunk])
+        n = len(trunk_groups)
+        edge_length = np.bincount(ids, weights=weights, minlength=n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trunks['intensity_mean'] = np.bincount(ids, weights=weights * intensity, minlength=n) / edge_length
+        trunks['trunk'] = np.arange(n)
+        trunks['n_edges'] = np.bincount(ids, minlength=n)
+        trunks['n_nodes'] = [len(group['node_objs']) for group in trunk_groups]
+        trunks['n_branches'] = [sum(node.type == 'Branch' for node in group['node_objs']) for group in trunk_groups]
+        trunks['length'] = edge_length + [sum(node.length for node in group['node_objs']) for group in trunk_groups]
+        trunks['tortuosity'] = np.nan if trunk_image is None else _trunk_tortuosities(trunk_groups, trunk_image)
+
+    if key is not None:
+        edges, trunks = stack_features([(key, edges)]), stack_features([(key, trunks)])
+    return edges, trunks
+
+
+def stack_features(tables: Iterable[tuple[str, np.ndarray]]) -> np.ndarray:
+    """
+    Concatenate the tables of several images (of the same kind) into one, with an 'image' column holding their key.
+    :param tables: (key, table) pairs, e.g. (key, graph_features(graph)[0])
+    """
+    tables = list(tables)
+    if not tables:
+        raise ValueError('No table to stack.')
+    width = max(1, *(len(str(key)) for key, _ in tables))
+    fields = [(name, dt) for name, (dt, _) in tables[0][1].dtype.fields.items() if name != 'image']
+    stacked = np.zeros(sum(len(table) for _, table in tables), dtype=[('image', f'U{width}'), *fields])
+    start = 0
+    for key, table in tables:
+        rows = stacked[start:start + len(table)]
+        rows['image'] = key
+        for name, _ in fields:
+            rows[name] = table[name]
+        start += len(table)
+    return stacked
+
+
+def to_arrow(table: np.ndarray):
+    """ Convert a feature table to a pyarrow.Table """
+    import pyarrow as pa
+
+    return pa.table({name: table[name] for name in table.dtype.names})
+
+
+def write_parquet(table: np.ndarray, path: str, **kwargs):
+    """ Write a feature table to a Parquet file, kwargs are passed to pyarrow.parquet.write_table """
+    import pyarrow.parquet as pq
+
+    pq.write_table(to_arrow(table), path, **kwargs)
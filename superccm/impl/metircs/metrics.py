@@ -9,7 +9,7 @@ from superccm.impl.metircs.extract_trunk import get_trunk_objs
 from superccm.impl.metircs.utils import check_connectivity, graph_to_skeleton
 from superccm.impl.metircs.reconstruction_binary import reconstruct_binary
 
-from typing import Literal
+from typing import Literal, Iterable, get_args
 
 METRICS = Literal[
     'CNFL',
@@ -21,6 +21,21 @@ METRICS = Literal[
     'CNFT',
     'CNFrD'
 ]
+METRIC_NAMES: tuple[str, ...] = get_args(METRICS)
+
+# Stages each metric depends on, besides the graph which every metric needs
+# 'trunks': extract_trunks (trunk flags of the edges and the trunk image)
+# 'reconstruction': reconstruct_binary
+METRIC_DEPENDENCIES = {
+    'CNFL': set(),
+    'CNFD': {'trunks'},
+    'CNBD': {'trunks'},
+    'CNFA': {'reconstruction'},
+    'CNFW': {'reconstruction'},
+    'CTBD': set(),
+    'CNFT': {'trunks'},
+    'CNFrD': {'reconstruction'},
+}
 
 # Image shape
 CCM_IMAGE_SHAPE = (384, 384)
@@ -59,7 +74,51 @@ def cal_total_length(graph: nx.MultiGraph) -> float:
     return total_length
 
 
-def get_metrics(graph: nx.MultiGraph, binary_image: np.ndarray, trunk_image: np.ndarray, decimal=3) -> dict[str, float]:
+def resolve_metrics(include: Iterable[METRICS] | None = None) -> tuple[str, ...]:
+    """ Validate the requested metrics and put them in the standard order. None means all metrics. """
+    if include is None:
+        return METRIC_NAMES
+    include = set(include)
+    unknown = include - set(METRIC_NAMES)
+    if unknown:
+        raise ValueError(f'Unknown metrics: {sorted(unknown)}. Available: {list(METRIC_NAMES)}')
+    return tuple(name for name in METRIC_NAMES if name in include)
+
+
+def required_stages(include: Iterable[METRICS] | None = None) -> set[str]:
+    """ The optional stages ('trunks', 'reconstruction') needed to compute the requested metrics """
+    stages = set()
+    for name in resolve_metrics(include):
+        stages |= METRIC_DEPENDENCIES[name]
+    return stages
+
+
+def compose_metrics(
+        total_length: float | None = None,
+        n_trunks: int | None = None,
+        n_trunk_branches: int | None = None,
+        n_branches: int | None = None,
+        area_pixels: int | None = None,
+        fractal_dim: float | None = None,
+        tortuosities: list[float] | None = None,
+        decimal=3,
+        include: Iterable[METRICS] | None = None,
+) -> dict[str, float]:
+    """
+    Convert the pixel-level measurements of an image into the metrics.
+    Only the measurements of the requested metrics are needed.
+
+    :param total_length: Total skeleton length (pixels)
+    :param n_trunks: Number of trunks
+    :param n_trunk_branches: Number of branching points on the trunks
+    :param n_branches: Number of branching points of the whole graph
+    :param area_pixels: Number of pixels of the reconstructed binary image
+    :param fractal_dim: Fractal dimension of the reconstructed binary image
+    :param tortuosities: Tortuosity of every connected trunk segment
+    :param decimal: Number of decimal places
+    :param include: The metrics to compute, None means all
+    """
+    include = resolve_metrics(include)
     metrics = {
         'CNFL': None,  # mm/mm2
         'CNFD': None,  # n/mm2
@@ -70,54 +129,103 @@ def get_metrics(graph: nx.MultiGraph, binary_image: np.ndarray, trunk_image: np.
         'CNFT': None,
         'CNFrD': None,
     }
-    total_length = cal_total_length(graph)
-    trunks = get_trunk_objs(graph)
-    skeleton = graph_to_skeleton(graph)
-    binary = reconstruct_binary(binary_image, skeleton)
     # CNFL
-    length = total_length * length_per_pix
-    CNFL = np.round(length / view_area, decimal)
-    metrics['CNFL'] = CNFL
+    if 'CNFL' in include or 'CNFW' in include:
+        length = total_length * length_per_pix
+        CNFL = np.round(length / view_area, decimal)
+        metrics['CNFL'] = CNFL
 
     # CNFD
-    x = len(trunks)
-    CNFD = np.round(x / view_area, decimal)
-    metrics['CNFD'] = CNFD
+    if 'CNFD' in include:
+        CNFD = np.round(n_trunks / view_area, decimal)
+        metrics['CNFD'] = CNFD
 
     # CNBD
-    x = sum([n.type == 'Branch' for trunk in trunks for n in trunk['node_objs']])
-    CNBD = np.round(x / view_area, decimal)
-    metrics['CNBD'] = CNBD
+    if 'CNBD' in include:
+        CNBD = np.round(n_trunk_branches / view_area, decimal)
+        metrics['CNBD'] = CNBD
 
     # CNFA
-    x = cv2.countNonZero(binary)
-    area = x * area_per_pix
-    CNFA = np.round(area / view_area, decimal)
-    metrics['CNFA'] = CNFA
+    if 'CNFA' in include or 'CNFW' in include:
+        area = area_pixels * area_per_pix
+        CNFA = np.round(area / view_area, decimal)
+        metrics['CNFA'] = CNFA
 
     # CNFW
-    width = area / length
-    CNFW = np.round(width / view_area, decimal)
-    metrics['CNFW'] = CNFW
+    if 'CNFW' in include:
+        width = area / length
+        CNFW = np.round(width / view_area, decimal)
+        metrics['CNFW'] = CNFW
 
     # CTBD
-    x = sum([data['obj'].type == 'Branch' for _, data in graph.nodes(data=True)])
-    CTBD = np.round(x / view_area, decimal)
-    metrics['CTBD'] = CTBD
+    if 'CTBD' in include:
+        CTBD = np.round(n_branches / view_area, decimal)
+        metrics['CTBD'] = CTBD
 
     # CNFrD
-    x = fractal_dimension(binary)
-    CFracDim = np.round(x, decimal)
-    metrics['CNFrD'] = CFracDim
+    if 'CNFrD' in include:
+        CFracDim = np.round(fractal_dim, decimal)
+        metrics['CNFrD'] = CFracDim
 
     # CNFT
-    trunk_canvas = trunk_image
-    trunk_labels = get_split_label(trunk_canvas)
-    if len(trunk_labels):
-        x = sum(get_tc(label) for label in trunk_labels) / len(trunk_labels)
-        x = np.round(x, decimal)
-    else:
-        x = None
-    metrics['CNFT'] = x
-
-    return metrics
+    if 'CNFT' in include:
+        if len(tortuosities):
+            x = sum(tortuosities) / len(tortuosities)
+            x = np.round(x, decimal)
+        else:
+            x = None
+        metrics['CNFT'] = x
+
+    return {name: metrics[name] for name in include}
+
+
+def empty_metrics(decimal=3, include: Iterable[METRICS] | None = None, measured: bool = True) -> dict[str, float]:
+    """
+    Metrics of a frame without any nerve: 0 for every metric and None for CNFT (no trunk).
+    :param measured: False for frames that were not analyzed (e.g. rejected by a quality gate): every metric is None
+    """
+    return {
+        name: np.round(0.0, decimal) if measured and name != 'CNFT' else None
+        for name in resolve_metrics(include)
+    }
+
+
+def get_metrics(
+        graph: nx.MultiGraph,
+        binary_image: np.ndarray,
+        trunk_image: np.ndarray | None,
+        decimal=3,
+        include: Iterable[METRICS] | None = None,
+) -> dict[str, float]:
+    """
+    Compute the requested metrics (all by default). Only the measurements they depend on are computed.
+    trunk_image (and the trunk flags of the graph) may be None / unset if no trunk metric is requested.
+    """
+    include = resolve_metrics(include)
+    stages = required_stages(include)
+    measurements = {}
+
+    if {'CNFL', 'CNFW'} & set(include):
+        measurements['total_length'] = cal_total_length(graph)
+
+    if {'CNFD', 'CNBD'} & set(include):
+        trunks = get_trunk_objs(graph)
+        measurements['n_trunks'] = len(trunks)
+        measurements['n_trunk_branches'] = sum([n.type == 'Branch' for trunk in trunks for n in trunk['node_objs']])
+
+    if 'CTBD' in include:
+        measurements['n_branches'] = sum([data['obj'].type == 'Branch' for _, data in graph.nodes(data=True)])
+
+    if 'reconstruction' in stages:
+        skeleton = graph_to_skeleton(graph)
+        binary = reconstruct_binary(binary_image, skeleton)
+        measurements['area_pixels'] = cv2.countNonZero(binary)
+        if 'CNFrD' in include:
+            measurements['fractal_dim'] = fractal_dimension(binary)
+
+    if 'CNFT' in include:
+        if trunk_image is None:
+            raise ValueError('CNFT requires the trunk image.')
+        measurements['tortuosities'] = [get_tc(label) for label in get_split_label(trunk_image)]
+
+    return compose_metrics(**measurements, decimal=decimal, include=include)
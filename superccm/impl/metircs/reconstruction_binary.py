@@ -2,8 +2,54 @@ import cv2
 import numpy as np
 from skimage.morphology import reconstruction
 
+from typing import Literal
 
-def reconstruct_binary(binary: np.ndarray, skeleton: np.ndarray, max_radius=None):
+from superccm.impl.implementations import register_implementation, get_implementation
+
+
+def _reconstruct_dilation(mask_bin: np.ndarray, skeleton_bin: np.ndarray, max_radius=None) -> np.ndarray:
+    """ Reference implementation: float64 grayscale morphological reconstruction """
+    # 2️⃣ 计算距离变换（原mask的厚度）
+    dist = cv2.distanceTransform(mask_bin, cv2.DIST_L2, 5)
+
+    # 3️⃣ 构造重建种子
+    seed = np.zeros_like(dist, dtype=float)
+    seed[skeleton_bin > 0] = dist[skeleton_bin > 0]
+
+    # 4️⃣ 限制最大扩张半径（可选）
+    if max_radius is not None:
+        seed = np.minimum(seed, max_radius)
+
+    # 5️⃣ 灰度形态学重建
+    reconstructed = reconstruction(seed, dist, method='dilation')
+
+    return reconstructed > 0
+
+
+def _reconstruct_label(mask_bin: np.ndarray, skeleton_bin: np.ndarray, max_radius=None) -> np.ndarray:
+    """
+    Fast implementation on uint8 data.
+    The distance transform is positive on every mask pixel, so the reconstruction by dilation is non-zero exactly on
+    the 8-connected mask regions that contain a seeded skeleton pixel. Labelling the mask once gives the same result.
+    """
+    num, labels = cv2.connectedComponents(mask_bin, connectivity=8)
+    seeds = labels[(skeleton_bin > 0) & (mask_bin > 0)]
+    keep = np.zeros(num, dtype=bool)
+    keep[seeds] = True
+    keep[0] = False
+    return keep[labels]
+
+
+register_implementation('reconstruction', 'dilation', _reconstruct_dilation)
+register_implementation('reconstruction', 'label', _reconstruct_label)
+
+
+def reconstruct_binary(
+        binary: np.ndarray,
+        skeleton: np.ndarray,
+        max_radius=None,
+        method: Literal['label', 'dilation'] | None = None,
+):
     """
     根据骨架和原始掩膜，通过距离变换进行区域重建。
 
@@ -15,32 +61,24 @@ def reconstruct_binary(binary: np.ndarray, skeleton: np.ndarray, max_radius=None
         处理后的骨架图像（0/1 或 0/255），类型 uint8。
     max_radius : float, 可选
         限制最大重建半径（单位：像素）。None 表示不限制。
+        The seeds stay positive after clipping, so it does not change the binary result.
+    method : 'label' or 'dilation'
+        'label' labels the mask once (fast); 'dilation' runs skimage's grayscale reconstruction (reference).
+        Both give identical masks. None means the selected one (see superccm.impl.implementations).
 
     返回：
     ----------
     reconstructed_mask : np.ndarray
-        从骨架重建的掩膜图像（二值，0/1）。
+        从骨架重建的掩膜图像（二值，0/255）。
     """
 
     # 1️⃣ 统一二值格式
     mask_bin = (binary > 0).astype(np.uint8)
     skeleton_bin = (skeleton > 0).astype(np.uint8)
 
-    # 2️⃣ 计算距离变换（原mask的厚度）
-    dist = cv2.distanceTransform(mask_bin, cv2.DIST_L2, 5)
-
-    # 3️⃣ 构造重建种子
-    seed = np.zeros_like(dist, dtype=float)
-    seed[skeleton_bin > 0] = dist[skeleton_bin > 0]
-
-    # 4️⃣ 限制最大扩张半径（可选）
-    if max_radius is not None:
-        seed = np.minimum(seed, max_radius)
-
-    # 5️⃣ 灰度形态学重建
-    reconstructed = reconstruction(seed, dist, method='dilation')
+    reconstructed = get_implementation('reconstruction', method)(mask_bin, skeleton_bin, max_radius)
 
     # 6️⃣ 转为二值输出
-    reconstructed_mask = (reconstructed > 0).astype(np.uint8) * 255
+    reconstructed_mask = reconstructed.astype(np.uint8) * 255
 
     return reconstructed_mask
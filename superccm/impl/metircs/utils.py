@@ -1,7 +1,7 @@
 import numpy as np
 import networkx as nx
 from scipy.ndimage import binary_dilation
-from superccm.impl.utils.tools import get_canvas
+from superccm.impl.utils.tools import get_canvas, CCM_IMAGE_SHAPE
 
 
 def check_connectivity(mask1: np.ndarray, mask2: np.ndarray) -> str:
@@ -29,8 +29,9 @@ def check_connectivity(mask1: np.ndarray, mask2: np.ndarray) -> str:
         return 'disconnected'
 
 
-def graph_to_skeleton(graph: nx.MultiGraph) -> np.ndarray:
-    canvas = get_canvas(1)
+def graph_to_skeleton(graph: nx.MultiGraph, shape: tuple[int, int] = CCM_IMAGE_SHAPE) -> np.ndarray:
+    """ :param shape: Shape of the canvases of the graph components """
+    canvas = get_canvas(1, shape)
     for u, v, k, data in graph.edges(keys=True, data=True):
         edge_obj = data['obj']
         canvas = canvas + edge_obj.canvas
@@ -4,7 +4,7 @@ from superccm.impl.io.read import read_image
 from superccm.impl.segment.segment import CornealNerveSegmenter
 from superccm.impl.skeleton.skeletonize import get_skeleton
 from superccm.impl.trunk.extract_trunks import extract_trunks
-from superccm.impl.graph.graphify import graphify
+from superccm.impl.graph.graphify import graphify, get_intensity_map, build_graph
 from superccm.impl.metircs.metrics import get_metrics
 
 
@@ -12,33 +12,63 @@ class ReadModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = read_image
+    Inputs = ('image_or_path',)
+    Outputs = ('image',)
 
 
 class SegModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = CornealNerveSegmenter
+    Inputs = ('image',)
+    Outputs = ('binary',)
 
 
 class SkelModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = get_skeleton
+    Inputs = ('binary',)
+    Outputs = ('skeleton',)
 
 
 class TrunkModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = extract_trunks
+    Inputs = ('graph',)
+    Outputs = ('trunk_graph', 'trunks')
 
 
 class GraphifyModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = graphify
+    Inputs = ('image', 'skeleton')
+    Outputs = ('graph',)
 
 
 class MeasureModule(Module):
     Author = 'default'
     Version = '1.0.0'
     Function = get_metrics
+    Inputs = ('trunk_graph', 'binary', 'trunks')
+    Outputs = ('metrics',)
+
+
+class IntensityModule(Module):
+    """ The intensity half of graphify, independent of the skeleton """
+    Author = 'default'
+    Version = '1.0.0'
+    Function = get_intensity_map
+    Inputs = ('image',)
+    Outputs = ('intensity_map',)
+
+
+class BuildGraphModule(Module):
+    """ The graph half of graphify, using a precomputed intensity map """
+    Author = 'default'
+    Version = '1.0.0'
+    Function = build_graph
+    Inputs = ('skeleton', 'intensity_map')
+    Outputs = ('graph',)
@@ -0,0 +1,251 @@
+"""
+Parity harness: runs the pipeline after segmentation with the reference implementations and with a candidate
+selection side by side (see superccm.impl.implementations), and reports the differences and the speedups.
+
+    report = run_parity(candidate='default')                                   # synthetic corpus
+    report = run_parity(iter_frames('cohort/'), candidate={'reconstruction': 'label'})
+    print(format_report(report))
+
+or from the command line:
+    python -m superccm.impl.parity cohort/ exam.zip --candidate reconstruction=label
+
+Both selections run get_skeleton, graphify, extract_trunks and get_metrics on the same mask: the mask given with
+the image (the synthetic corpus comes with its masks), otherwise the image is segmented once.
+An image passes when the skeletons have the same topology, the graphs the same numbers of nodes and edges,
+the reconstructed masks agree (IoU >= min_iou) and every metric is within tolerance.
+
+Only the registered kernels differ between the two runs (report['compared'] lists the stages whose implementation
+differs). The code around them, and the stages without an alternative (e.g. thinning), is the same in both runs,
+so the harness checks the kernels against their references, it does not validate the pipeline itself.
+"""
+import time
+import numpy as np
+import cv2
+
+from superccm.impl.implementations import use_implementations, current_implementations, warmup, REFERENCE
+from superccm.impl.io.read import read_image
+from superccm.impl.segment.segment import CornealNerveSegmenter
+from superccm.impl.skeleton.skeletonize import get_skeleton
+from superccm.impl.skeleton.thinning import topology
+from superccm.impl.graph.graphify import graphify
+from superccm.impl.trunk.extract_trunks import extract_trunks
+from superccm.impl.metircs.metrics import get_metrics, resolve_metrics, METRICS
+from superccm.impl.metircs.reconstruction_binary import reconstruct_binary
+from superccm.impl.metircs.utils import graph_to_skeleton
+from superccm.impl.utils.tools import cal_iou
+
+from typing import Any, Iterable, Iterator, Mapping
+
+STAGES = ('skeleton', 'graph', 'trunks', 'metrics')
+
+
+def synthetic_corpus(n: int = 8, seed: int = 0, masks: bool = False) -> Iterator[tuple]:
+    """
+    Synthetic 384*384 CCM-like frames: long wavy bright fibers and short branches on a noisy background.
+    :param masks: Also yield the mask of the drawn fibers, as (key, image, mask)
+    """
+    rng = np.random.default_rng(seed)
+    for index in range(n):
+        image = rng.normal(40, 10, (384, 384)).clip(0, 255).astype(np.uint8)
+        mask = np.zeros((384, 384), dtype=np.uint8)
+        xs = np.arange(-10, 394)
+        for _ in range(6):
+            y0, amp, freq, phase = rng.uniform(20, 364), rng.uniform(5, 30), rng.uniform(0.005, 0.03), rng.uniform(0, 6)
+            ys = y0 + amp * np.sin(freq * xs + phase) + rng.uniform(-0.3, 0.3) * xs
+            points = np.stack([xs, ys], 1).astype(np.int32)
+            intensity, thickness = int(rng.uniform(150, 250)), int(rng.integers(2, 5))
+            cv2.polylines(image, [points], False, intensity, thickness)
+            cv2.polylines(mask, [points], False, 255, thickness)
+        for _ in range(6):
+            (x0, y0), length, angle = rng.uniform(0, 384, 2), rng.uniform(20, 90), rng.uniform(0, 2 * np.pi)
+            end = (int(x0 + length * np.cos(angle)), int(y0 + length * np.sin(angle)))
+            cv2.line(image, (int(x0), int(y0)), end, int(rng.uniform(150, 250)), 2)
+            cv2.line(mask, (int(x0), int(y0)), end, 255, 2)
+        image = cv2.GaussianBlur(image, (3, 3), 0)
+        yield (f'synthetic#{index}', image, mask) if masks else (f'synthetic#{index}', image)
+
+
+def _run(image: np.ndarray, binary: np.ndarray, include, repeat: int) -> tuple[dict, dict]:
+    """ Outputs and best-of-repeat time of each stage with the implementations in effect """
+    times = {stage: float('inf') for stage in STAGES}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        skeleton = get_skeleton(binary)
+        times['skeleton'] = min(times['skeleton'], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        graph = graphify(image, skeleton)
+        times['graph'] = min(times['graph'], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        graph, trunks = extract_trunks(graph)
+        times['trunks'] = min(times['trunks'], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        metrics = get_metrics(graph, binary, trunks, include=include)
+        times['metrics'] = min(times['metrics'], time.perf_counter() - start)
+
+    outputs = {
+        'skeleton': skeleton,
+        'nodes': graph.number_of_nodes(),
+        'edges': graph.number_of_edges(),
+        'mask': reconstruct_binary(binary, graph_to_skeleton(graph)),
+        'metrics': metrics,
+    }
+    return outputs, times
+
+
+def _close(a: float | None, b: float | None, rtol: float, atol: float) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    return abs(float(a) - float(b)) <= atol + rtol * abs(float(a))
+
+
+def run_parity(
+        items: Mapping[str, Any] | Iterable[tuple[str, Any]] | None = None,
+        candidate: str | dict[str, str] = 'default',
+        reference: str | dict[str, str] = 'reference',
+        include: Iterable[METRICS] | None = None,
+        rtol: float = 0.0,
+        atol: float = 1e-3,
+        min_iou: float = 1.0,
+        repeat: int = 1,
+) -> dict:
+    """
+    Compare a candidate selection of implementations with the reference on a corpus.
+
+    :param items: (key, image_or_path) or (key, image_or_path, mask) tuples, or a mapping of images,
+                  the synthetic corpus with its masks by default. Images without a mask are segmented
+    :param candidate: Selection to check, as accepted by use_implementations ('default', 'stage=name,...' or a dict)
+    :param reference: Selection to compare with, every reference implementation by default
+    :param include: The metrics to compare, None means all
+    :param rtol: Relative tolerance of the metrics
+    :param atol: Absolute tolerance of the metrics, one unit of the 3rd decimal by default
+    :param min_iou: Minimum IoU of the reconstructed masks
+    :param repeat: Timing runs per image (the best one is kept)
+    :return: {
+        'passed', 'n_images', 'n_failed',
+        'reference': {stage: name}, 'candidate': {stage: name}, 'compared': [stages whose implementation differs],
+        'time': {'reference': {stage: seconds}, 'candidate': {...}}, 'speedup': {stage: x, 'total': x},
+        'max_metric_diff': {metric: value},
+        'images': [{'key', 'passed', 'skeleton_identical', 'same_topology', 'nodes': (ref, cand), 'edges',
+                    'mask_iou', 'metrics': {metric: (ref, cand)}, 'failed_metrics': [...]}, ...]
+    }
+    """
+    items = synthetic_corpus(masks=True) if items is None else items
+    entries = items.items() if isinstance(items, Mapping) else items
+    include = resolve_metrics(include)
+    segmenter = None
+
+    # JIT kernels are loaded before timing
+    with use_implementations(reference):
+        reference_names = current_implementations()
+        warmup()
+    with use_implementations(candidate):
+        candidate_names = current_implementations()
+        warmup()
+
+    total = {'reference': dict.fromkeys(STAGES, 0.0), 'candidate': dict.fromkeys(STAGES, 0.0)}
+    max_diff = dict.fromkeys(include, 0.0)
+    rows = []
+    for key, image_or_path, *mask in entries:
+        image = read_image(image_or_path)
+        if mask:
+            binary = (np.asarray(mask[0]) > 0).astype(np.uint8) * 255
+        else:
+            # The model is only loaded for images that come without a mask
+            segmenter = segmenter or CornealNerveSegmenter()
+            binary = segmenter(image)
+        with use_implementations(reference):
+            ref, ref_times = _run(image, binary, include, repeat)
+        with use_implementations(candidate):
+            cand, cand_times = _run(image, binary, include, repeat)
+        for stage in STAGES:
+            total['reference'][stage] += ref_times[stage]
+            total['candidate'][stage] += cand_times[stage]
+
+        failed = []
+        for name in include:
+            a, b = ref['metrics'][name], cand['metrics'][name]
+            if not _close(a, b, rtol, atol):
+                failed.append(name)
+            if a is not None and b is not None:
+                max_diff[name] = max(max_diff[name], abs(float(a) - float(b)))
+        same_topology = topology(ref['skeleton']) == topology(cand['skeleton'])
+        mask_iou = cal_iou(ref['mask'], cand['mask'])
+        rows.append({
+            'key': key,
+            'passed': (same_topology and not failed and mask_iou >= min_iou
+                       and ref['nodes'] == cand['nodes'] and ref['edges'] == cand['edges']),
+            'skeleton_identical': bool(np.array_equal(ref['skeleton'], cand['skeleton'])),
+            'same_topology': same_topology,
+            'nodes': (ref['nodes'], cand['nodes']),
+            'edges': (ref['edges'], cand['edges']),
+            'mask_iou': mask_iou,
+            'metrics': {name: (ref['metrics'][name], cand['metrics'][name]) for name in include},
+            'failed_metrics': failed,
+        })
+
+    speedup = {}
+    for stage in (*STAGES, 'total'):
+        ref_time = sum(total['reference'].values()) if stage == 'total' else total['reference'][stage]
+        cand_time = sum(total['candidate'].values()) if stage == 'total' else total['candidate'][stage]
+        speedup[stage] = ref_time / cand_time if cand_time > 0 else float('nan')
+    n_failed = sum(not row['passed'] for row in rows)
+    return {
+        'passed': n_failed == 0,
+        'n_images': len(rows),
+        'n_failed': n_failed,
+        'reference': reference_names,
+        'candidate': candidate_names,
+        'compared': [stage for stage in REFERENCE if reference_names[stage] != candidate_names[stage]],
+        'time': total,
+        'speedup': speedup,
+        'max_metric_diff': max_diff,
+        'images': rows,
+    }
+
+
+def format_report(report: dict) -> str:
+    """ Human-readable summary of a run_parity report """
+    lines = [
+        f"{'PASSED' if report['passed'] else 'FAILED'}: {report['n_images'] - report['n_failed']}"
+        f"/{report['n_images']} images",
+        'stage        reference (s)  candidate (s)  speedup',
+    ]
+    for stage in (*STAGES, 'total'):
+        if stage == 'total':
+            ref_time, cand_time = sum(report['time']['reference'].values()), sum(report['time']['candidate'].values())
+        else:
+            ref_time, cand_time = report['time']['reference'][stage], report['time']['candidate'][stage]
+        lines.append(f"{stage:<12} {ref_time:13.3f}  {cand_time:13.3f}  x{report['speedup'][stage]:.2f}")
+    lines.append('compared: ' + (', '.join(
+        f'{stage}={report["reference"][stage]}->{report["candidate"][stage]}' for stage in report['compared'])
+        or 'nothing, both selections are the same'))
+    lines.append('max metric difference: ' + ', '.join(f'{k}={v:.4g}' for k, v in report['max_metric_diff'].items()))
+    for row in report['images']:
+        if not row['passed']:
+            lines.append(f"  {row['key']}: topology={row['same_topology']} nodes={row['nodes']} "
+                         f"edges={row['edges']} mask_iou={row['mask_iou']:.4f} metrics={row['failed_metrics']}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import itertools
+    from superccm.impl.io.sources import iter_frames
+
+    parser = argparse.ArgumentParser(description='Compare implementations of the pipeline kernels on a corpus.')
+    parser.add_argument('sources', nargs='*', help='Directories, archives, TIFFs, videos or images. '
+                                                   'The synthetic corpus is used if none is given')
+    parser.add_argument('--candidate', default='default', help='"default", "reference" or "stage=name,..."')
+    parser.add_argument('--reference', default='reference')
+    parser.add_argument('--synthetic', type=int, default=8, help='Number of synthetic frames added to the corpus')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = itertools.chain(synthetic_corpus(args.synthetic, masks=True),
+                             *(iter_frames(source) for source in args.sources))
+    result = run_parity(corpus, args.candidate, args.reference, repeat=args.repeat)
+    print(format_report(result))
+    raise SystemExit(0 if result['passed'] else 1)
@@ -0,0 +1,123 @@
+from functools import cached_property
+
+import numpy as np
+import networkx as nx
+
+from superccm.impl.graph.vis import render_ACCM
+from superccm.impl.metircs.features import graph_features
+from superccm.impl.metircs.density import density_maps
+
+
+class AnalysisResult:
+    """
+    Everything produced by one run of a workflow. Workflows return it instead of keeping state.
+
+    Optional artifacts (overlay, edge_table, graph_data, features, density) are computed on first access and cached.
+    In batch mode, call drop() once the artifacts you need are taken, so that only the metrics stay in memory.
+    """
+    # Stage outputs and cached artifacts released by drop() by default
+    HEAVY = ('image', 'binary', 'skeleton', 'graph', 'trunks', 'overlay', 'edge_table', 'graph_data', 'features', 'density')
+
+    def __init__(
+            self,
+            image: np.ndarray,
+            binary: np.ndarray,
+            skeleton: np.ndarray,
+            graph: nx.MultiGraph,
+            trunks: np.ndarray | None,
+            metrics: dict[str, float],
+            quality: dict | None = None,
+    ):
+        """
+        :param graph: The graph after trunk extraction (edges marked with is_trunk), if trunks were extracted
+        :param trunks: Trunk image, None if trunk extraction was skipped
+        :param quality: Report of the quality gate (see QualityGate), if one was used
+        """
+        self.image = image
+        self.binary = binary
+        self.skeleton = skeleton
+        self.graph = graph
+        self.trunks = trunks
+        self.metrics = metrics
+        self.quality = quality
+        self.dropped: set[str] = set()
+
+    def _require(self, name: str):
+        value = getattr(self, name)
+        if value is None and name in self.dropped:
+            raise ValueError(f'"{name}" was dropped from this result.')
+        return value
+
+    @cached_property
+    def overlay(self) -> np.ndarray:
+        """ ACCM visualization (see render_ACCM) """
+        return render_ACCM(self._require('graph'), self._require('image'))
+
+    @cached_property
+    def edge_table(self) -> list[dict]:
+        """ One row per edge: u, v, key, length (pixels), intensity_mean, intensity_median, is_trunk, centroid """
+        rows = []
+        for u, v, key, data in self._require('graph').edges(keys=True, data=True):
+            edge_obj = data['obj']
+            rows.append({
+                'u': u,
+                'v': v,
+                'key': key,
+                'length': edge_obj.length,
+                'intensity_mean': edge_obj.intensity_mean,
+                'intensity_median': edge_obj.intensity_median,
+                'is_trunk': edge_obj.is_trunk,
+                'centroid': edge_obj.centroid,
+            })
+        return rows
+
+    @cached_property
+    def graph_data(self) -> dict:
+        """ JSON-serializable export of the graph: {'nodes': [...], 'edges': [...]} with pixel coordinates (x, y) """
+        graph = self._require('graph')
+        nodes = []
+        for n, data in graph.nodes(data=True):
+            node_obj = data['obj']
+            nodes.append({
+                'id': n,
+                'type': node_obj.type,
+                'centroid': list(node_obj.centroid),
+                'coords': [list(coord) for coord in node_obj.coords],
+            })
+        edges = []
+        for row, (_, _, data) in zip(self.edge_table, graph.edges(data=True)):
+            edge = {k: row[k] for k in ('u', 'v', 'key', 'is_trunk')}
+            edge['length'] = float(row['length'])
+            edge['intensity_mean'] = None if row['intensity_mean'] is None else float(row['intensity_mean'])
+            edge['intensity_median'] = None if row['intensity_median'] is None else float(row['intensity_median'])
+            edge['coords'] = [list(coord) for coord in data['obj'].coords]
+            edges.append(edge)
+        return {'nodes': nodes, 'edges': edges}
+
+    @cached_property
+    def features(self) -> tuple[np.ndarray, np.ndarray]:
+        """ (edges, trunks) feature tables as structured arrays (see graph_features) """
+        return graph_features(self._require('graph'), trunk_image=self._require('trunks'))
+
+    @cached_property
+    def density(self) -> dict:
+        """ CNFL and CNFA maps in 50 µm sliding windows (see density_maps) """
+        return density_maps(self._require('graph'), self._require('binary'))
+
+    def drop(self, *names: str) -> 'AnalysisResult':
+        """
+        Release stage outputs and cached artifacts to bound memory. The metrics are always kept.
+        :param names: Attributes to release, all of HEAVY by default
+        """
+        for name in names or self.HEAVY:
+            if name not in self.HEAVY:
+                raise ValueError(f'Unknown artifact: {name}. Available: {list(self.HEAVY)}')
+            if name in type(self).__dict__ and isinstance(type(self).__dict__[name], cached_property):
+                self.__dict__.pop(name, None)
+            else:
+                setattr(self, name, None)
+            self.dropped.add(name)
+        return self
+
+    def __repr__(self):
+        return f'<AnalysisResult> {self.metrics}'
@@ -0,0 +1,379 @@
+"""
+Process pool for long batch runs with bounded memory.
+
+    for key, record in run_batch(iter_frames('cohort.zip'), workers=4, rss_limit_mb=1500):
+        record['metrics'], record['peak_rss_mb']
+
+- Each worker is retired after 'max_tasks_per_worker' images, or as soon as its RSS exceeds 'rss_limit_mb'
+  after an image, and replaced by a fresh process. This returns the memory held by onnxruntime arenas,
+  allocator fragmentation and leaked graphs to the system.
+- Each record reports the memory high-water mark of its image.
+- An image whose worker dies (e.g. OOM kill, segfault) is retried alone in a fresh process,
+  so that it cannot take other images down with it. If it fails again, its record holds the error.
+- Workers use the implementations in effect when run_batch is called (see superccm.impl.implementations),
+  including a use_implementations block around it.
+- With transport='shm', a pool of reader threads in the calling process decodes the paths and writes the images
+  into a shared-memory ring (see shm.py) ahead of the workers, and arrays in the results come back through it,
+  instead of being pickled through the pipes. The slots are sized from the first image.
+  Segmentation and post-processing run one after the other in the same worker, so there is no ring between them:
+  the probability maps and masks do not leave the worker.
+"""
+import os
+import time
+import itertools
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from multiprocessing.connection import wait
+from typing import Any, Callable, Iterable, Iterator, Literal, Mapping
+
+import numpy as np
+
+from superccm.impl.implementations import current_implementations
+from superccm.impl.io.read import read_image
+from superccm.impl.runner.shm import SharedRing, ShmArray, pack, unpack
+
+# A slot holds the image and the arrays of its result up to this many times the size of the first image
+SLOT_FRAMES = 16
+# Slot size when the first item is not an image
+DEFAULT_SLOT_MB = 16
+# Images decoded ahead of the workers, per reader thread
+READ_AHEAD = 2
+
+
+def _status_mb(field: str) -> float | None:
+    """ A memory field (VmRSS, VmHWM) of /proc/self/status, in MB """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """ Reset the high-water mark of the process (Linux), so that it can be measured per image """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def current_rss_mb() -> float | None:
+    return _status_mb('VmRSS')
+
+
+def peak_rss_mb() -> float | None:
+    """ High-water mark since the last reset, or since the start of the process """
+    peak = _status_mb('VmHWM')
+    if peak is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+def _default_function(image_or_path, **kwargs):
+    from superccm.api.api import analysis
+    return analysis(image_or_path, **kwargs)
+
+
+def _decode(item: Any) -> Any:
+    """ Paths and encoded images are decoded by the reader, so that they can go through shared memory """
+    if isinstance(item, (str, Path, bytes, bytearray)):
+        try:
+            return read_image(item)
+        except Exception:
+            # Left to the worker, which reports the error in the record of the image
+            return item
+    return item
+
+
+class _Reader:
+    """
+    Decodes the items on a thread pool and writes the images into free slots of the ring, ahead of the workers.
+    Iterating it yields (key, image, slot, ref) in the input order; slot and ref are None when the image was not
+    written (no free slot, too large, or not an image), in which case the worker is sent the image as usual.
+    """
+
+    def __init__(self, pairs: Iterator[tuple[str, Any]], ring: SharedRing, threads: int, ahead: int):
+        self.pairs = pairs
+        self.ring = ring
+        self.ahead = ahead
+        self.pending: deque = deque()
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='superccm-reader')
+
+    def _read(self, item: Any) -> tuple[Any, int | None, ShmArray | None]:
+        item = _decode(item)
+        if not isinstance(item, np.ndarray):
+            return item, None, None
+        slot = self.ring.acquire()
+        refs = self.ring.write(slot, [item]) if slot is not None else None
+        if refs is None:
+            self.ring.release(slot)
+            return item, None, None
+        return item, slot, refs[0]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple[str, Any, int | None, ShmArray | None]:
+        # The input iterator itself is consumed here, on the calling thread
+        while len(self.pending) < self.ahead:
+            try:
+                key, item = next(self.pairs)
+            except StopIteration:
+                break
+            self.pending.append((key, self.executor.submit(self._read, item)))
+        if not self.pending:
+            raise StopIteration
+        key, future = self.pending.popleft()
+        return key, *future.result()
+
+    def close(self):
+        """ Stop reading ahead; waits for the decodes in progress, which may still write into the ring """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _slot_bytes(item: Any, slot_mb: float | None) -> int:
+    if slot_mb is not None:
+        return int(slot_mb * 2 ** 20)
+    if isinstance(item, np.ndarray):
+        return SLOT_FRAMES * item.nbytes
+    return DEFAULT_SLOT_MB * 2 ** 20
+
+
+def _worker_main(conn, function: Callable, max_tasks: int | None, rss_limit_mb: float | None, kwargs: dict,
+                 ring: SharedRing | None, implementations: dict[str, str]):
+    from superccm.impl.implementations import set_implementation, warmup
+
+    # The implementations in effect where run_batch was called, instead of SUPERCCM_IMPL only
+    set_implementation(implementations)
+    # Load the JIT kernels from their cache before the first image, so that it is not charged to it
+    warmup()
+    done = 0
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        key, item, slot = message
+        if isinstance(item, ShmArray):
+            item = ring.read(item)
+        per_image = _reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            metrics, error = function(item, **kwargs), None
+        except Exception as e:
+            metrics, error = None, f'{type(e).__name__}: {e}'
+        del item
+        if slot is not None:
+            # The input was copied out: the slot now carries the arrays of the result
+            metrics = pack(metrics, ring, slot)
+        done += 1
+        rss = current_rss_mb()
+        retire = bool((max_tasks and done >= max_tasks) or (rss_limit_mb and rss and rss > rss_limit_mb))
+        info = {
+            'seconds': time.perf_counter() - start,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_scope': 'image' if per_image else 'process',
+            'rss_mb': rss,
+            'worker': os.getpid(),
+        }
+        conn.send((key, metrics, error, info, retire))
+        if retire:
+            return
+
+
+class _Worker:
+    def __init__(self, ctx, function, max_tasks, rss_limit_mb, kwargs, implementations, ring=None, isolated=False):
+        self.conn, child = ctx.Pipe()
+        args = (child, function, max_tasks, rss_limit_mb, kwargs, ring, implementations)
+        self.process = ctx.Process(target=_worker_main, args=args, daemon=True)
+        self.process.start()
+        child.close()
+        self.isolated = isolated
+        self.ring = ring
+        self.task = None  # (key, item, attempts)
+        self.slot = None
+
+    def submit(self, key, item, attempts, slot=None, ref=None):
+        """ Send an image, written into the ring by the reader if ref is given, otherwise here if it fits """
+        self.task = (key, item, attempts)
+        self.slot = slot
+        if ref is not None:
+            item = ref
+        elif self.ring is not None and isinstance(item, np.ndarray):
+            self.slot = self.ring.acquire()
+            refs = self.ring.write(self.slot, [item]) if self.slot is not None else None
+            if refs is not None:
+                item = refs[0]
+        self.conn.send((key, item, self.slot))
+
+    def done(self):
+        """ Forget the task and free its slot """
+        self.task = None
+        if self.ring is not None:
+            self.ring.release(self.slot)
+        self.slot = None
+
+    def stop(self, timeout: float = 5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+def run_batch(
+        items: Mapping[str, Any] | Iterable[tuple[str, Any]],
+        function: Callable | None = None,
+        workers: int | None = None,
+        max_tasks_per_worker: int | None = 200,
+        rss_limit_mb: float | None = None,
+        isolated_retries: int = 1,
+        start_method: str = 'spawn',
+        transport: Literal['pipe', 'shm'] = 'pipe',
+        slot_mb: float | None = None,
+        readers: int = 2,
+        **kwargs,
+) -> Iterator[tuple[str, dict]]:
+    """
+    Analyze a batch in worker processes, in completion order.
+
+    :param items: (key, image_or_path) pairs or a mapping. Items are sent to the workers, so they must be picklable;
+                  paths are cheaper than arrays. They are consumed lazily, one per idle worker.
+    :param function: Called as function(item, **kwargs) in the workers, api.analysis by default.
+                     Must be importable (defined at module level).
+    :param workers: Number of worker processes, os.cpu_count() by default
+    :param max_tasks_per_worker: Recycle a worker after this many images. None never recycles
+    :param rss_limit_mb: Retire a worker once its resident memory exceeds this after an image. None disables it
+    :param isolated_retries: How many times an image that killed its worker is retried alone in a fresh process
+    :param start_method: multiprocessing start method. 'spawn' avoids forking a process that already runs inference threads
+    :param transport: 'shm' decodes paths and encoded images on reader threads of this process (function receives
+                      the image), and passes the images and the arrays of the results through shared memory.
+                      'pipe' pickles them. Arrays larger than a slot are pickled anyway
+    :param slot_mb: Size of one shared-memory slot, for transport='shm'.
+                    None sizes them from the first image, SLOT_FRAMES times its size
+    :param readers: Reader threads decoding the images into the ring, for transport='shm' (cv2 releases the GIL)
+    :param kwargs: Passed to the function, e.g. include=['CNFL']. gate=QualityGate(...) reaches api.analysis and rejects
+                   frames, but the gate reports are not returned: use a function around api.analysis_full for them
+    :return: (key, record) pairs, record = {
+        'metrics', 'error': None or a message, 'attempts',
+        'seconds', 'peak_rss_mb', 'peak_rss_scope': 'image' or 'process', 'rss_mb', 'worker': pid
+    }
+    """
+    # Captured now: the generator body runs later, in the context of whoever iterates it
+    return _run_batch(items, function, workers, max_tasks_per_worker, rss_limit_mb, isolated_retries, start_method,
+                      transport, slot_mb, readers, current_implementations(), kwargs)
+
+
+def _run_batch(items, function, workers, max_tasks_per_worker, rss_limit_mb, isolated_retries, start_method,
+               transport, slot_mb, readers, implementations, kwargs) -> Iterator[tuple[str, dict]]:
+    ctx = mp.get_context(start_method)
+    function = function or _default_function
+    n_workers = workers or os.cpu_count() or 1
+    pairs = iter(items.items() if isinstance(items, Mapping) else items)
+    retries: deque = deque()
+    ring = reader = None
+    # (key, item, slot, ref): the slot and ref of an image already written into the ring
+    tasks = ((key, item, None, None) for key, item in pairs)
+    if transport == 'shm':
+        first = next(pairs, None)
+        if first is None:
+            return
+        key, item = first[0], _decode(first[1])
+        # One slot per worker and per image read ahead.
+        # Isolated retries get a slot if one is free, otherwise their arrays go through the pipe
+        ahead = max(1, readers) * READ_AHEAD
+        ring = SharedRing(n_workers + ahead + 1, _slot_bytes(item, slot_mb))
+        reader = _Reader(pairs, ring, max(1, readers), ahead)
+        tasks = itertools.chain([(key, item, None, None)], reader)
+
+    def spawn(isolated=False):
+        if isolated:
+            return _Worker(ctx, function, 1, None, kwargs, implementations, ring, isolated=True)
+        return _Worker(ctx, function, max_tasks_per_worker, rss_limit_mb, kwargs, implementations, ring)
+
+    pool = [spawn() for _ in range(n_workers)]
+    exhausted = False
+    try:
+        while True:
+            for i, worker in enumerate(pool):
+                if worker.isolated or worker.task is not None:
+                    continue
+                if not worker.process.is_alive():
+                    worker.stop()
+                    pool[i] = worker = spawn()
+                try:
+                    key, item, slot, ref = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                worker.submit(key, item, 1, slot, ref)
+            while retries:
+                key, item, attempts = retries.popleft()
+                worker = spawn(isolated=True)
+                worker.submit(key, item, attempts)
+                pool.append(worker)
+
+            busy = [worker for worker in pool if worker.task is not None]
+            if not busy:
+                if exhausted:
+                    return
+                continue
+            wait([w.conn for w in busy] + [w.process.sentinel for w in busy])
+
+            for worker in busy:
+                key, item, attempts = worker.task
+                message = None
+                if worker.conn.poll():
+                    try:
+                        message = worker.conn.recv()
+                    except (EOFError, OSError):
+                        message = None
+                if message is not None:
+                    key, metrics, error, info, retire = message
+                    if ring is not None:
+                        metrics = unpack(metrics, ring)
+                    worker.done()
+                    yield key, {'metrics': metrics, 'error': error, 'attempts': attempts, **info}
+                    if retire or worker.isolated:
+                        worker.stop()
+                        pool.remove(worker)
+                        if not worker.isolated:
+                            pool.append(spawn())
+                elif not worker.process.is_alive():
+                    # The worker died during the image: retry it alone, or report it
+                    exitcode = worker.process.exitcode
+                    worker.done()
+                    worker.stop()
+                    pool.remove(worker)
+                    if not worker.isolated:
+                        pool.append(spawn())
+                    if attempts <= isolated_retries:
+                        retries.append((key, item, attempts + 1))
+                    else:
+                        yield key, {
+                            'metrics': None, 'error': f'Worker died (exit code {exitcode})', 'attempts': attempts,
+                            'seconds': None, 'peak_rss_mb': None, 'peak_rss_scope': None, 'rss_mb': None,
+                            'worker': worker.process.pid,
+                        }
+    finally:
+        for worker in pool:
+            worker.stop(timeout=1)
+        if reader is not None:
+            reader.close()
+        if ring is not None:
+            ring.close()
+            ring.unlink()
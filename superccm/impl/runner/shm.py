@@ -0,0 +1,187 @@
+"""
+Shared-memory transport for arrays between processes.
+
+A SharedRing is one multiprocessing.shared_memory block cut into fixed-size slots. The owner process assigns a slot
+to a task, the arrays of the task (decoded image, probability map, mask...) are written into it once,
+and only small ShmArray descriptors travel through pipes and queues. The slot is released when the task is done.
+
+    ring = SharedRing(slots=4, slot_bytes=64 << 20)
+    slot = ring.acquire()
+    refs = ring.write(slot, [image])            # None if the arrays do not fit: send them by value instead
+    ...                                         # in another process, which received the ring at start
+    image = ring.read(refs[0])
+    ring.release(slot)
+    ring.close(); ring.unlink()
+
+run_batch(..., transport='shm') uses it between its reader threads, which decode the images into free slots,
+and the workers. acquire and release may be called from several threads of the owner.
+"""
+import copy
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Any, Callable, NamedTuple, Sequence
+
+# Offset alignment of the arrays inside a slot
+ALIGNMENT = 64
+
+
+class ShmArray(NamedTuple):
+    """ Descriptor of an array stored in a slot of a SharedRing """
+    slot: int
+    offset: int
+    shape: tuple[int, ...]
+    dtype: str
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """ Attach to an existing block, leaving its unlinking to the owner """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        # Child processes share the resource tracker of their parent, where the block is already registered
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedRing:
+    def __init__(self, slots: int, slot_bytes: int):
+        """
+        Create the shared block. The ring can be passed to child processes (as a Process argument),
+        which attach to the same block.
+        :param slots: Number of slots, i.e. tasks in flight
+        :param slot_bytes: Capacity of one slot
+        """
+        self.slots = slots
+        self.slot_bytes = -(-slot_bytes // ALIGNMENT) * ALIGNMENT
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self.owner = True
+        self._free = list(range(slots - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'slots': self.slots, 'slot_bytes': self.slot_bytes}
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.slot_bytes = state['slot_bytes']
+        self.shm = _attach(state['name'])
+        self.owner = False
+        self._free = []
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def acquire(self) -> int | None:
+        """ A free slot (owner only), None if all are in use """
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, slot: int | None):
+        """ Give a slot back (owner only) """
+        with self._lock:
+            if slot is not None and slot not in self._free:
+                self._free.append(slot)
+
+    def write(self, slot: int, arrays: Sequence[np.ndarray]) -> list[ShmArray] | None:
+        """ Copy arrays into a slot, one after the other. None (nothing written) if they do not fit """
+        refs, offset = [], 0
+        for array in arrays:
+            end = offset + array.nbytes
+            if end > self.slot_bytes:
+                return None
+            refs.append(ShmArray(slot, offset, tuple(array.shape), array.dtype.str))
+            offset = -(-end // ALIGNMENT) * ALIGNMENT
+        for ref, array in zip(refs, arrays):
+            self.view(ref)[...] = array
+        return refs
+
+    def view(self, ref: ShmArray) -> np.ndarray:
+        """ Array backed by the shared block: only valid while its slot is not reused """
+        start = ref.slot * self.slot_bytes + ref.offset
+        return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=self.shm.buf, offset=start)
+
+    def read(self, ref: ShmArray) -> np.ndarray:
+        """ Copy of an array, independent of the slot """
+        return self.view(ref).copy()
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        """ Free the block (owner only), once every process closed it """
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        self.unlink()
+
+
+def _map_values(mapping: dict, function: Callable[[Any], Any]) -> dict:
+    """ Copy of a mapping of any dict type (defaultdict, OrderedDict...) with the function applied to its values """
+    result = copy.copy(mapping)
+    for k, v in mapping.items():
+        result[k] = function(v)
+    return result
+
+
+def pack(obj: Any, ring: SharedRing, slot: int) -> Any:
+    """
+    Move the arrays of a result (an array, or arrays inside dicts, lists and tuples) into a slot,
+    replacing them with descriptors. Arrays that do not fit are left in place, to be sent by value.
+    """
+    arrays = []
+
+    def collect(o):
+        if isinstance(o, np.ndarray):
+            if o.dtype != object and all(a is not o for a in arrays):
+                arrays.append(o)
+        elif isinstance(o, dict):
+            for v in o.values():
+                collect(v)
+        elif isinstance(o, (list, tuple)):
+            for v in o:
+                collect(v)
+
+    collect(obj)
+    # Largest first: they gain the most from skipping the pipe. Those left over are pickled
+    refs, offset = {}, 0
+    for array in sorted(arrays, key=lambda a: -a.nbytes):
+        if offset + array.nbytes > ring.slot_bytes:
+            continue
+        ref = ShmArray(slot, offset, tuple(array.shape), array.dtype.str)
+        ring.view(ref)[...] = array
+        refs[id(array)] = ref
+        offset = -(-(offset + array.nbytes) // ALIGNMENT) * ALIGNMENT
+
+    def replace(o):
+        if isinstance(o, np.ndarray):
+            return refs.get(id(o), o)
+        if isinstance(o, dict):
+            return _map_values(o, replace)
+        if isinstance(o, tuple) and not isinstance(o, ShmArray):
+            return type(o)(*map(replace, o)) if hasattr(o, '_fields') else tuple(map(replace, o))
+        if isinstance(o, list):
+            return [replace(v) for v in o]
+        return o
+
+    return replace(obj) if refs else obj
+
+
+def unpack(obj: Any, ring: SharedRing) -> Any:
+    """ Replace the descriptors of a packed result with copies of their arrays """
+    if isinstance(obj, ShmArray):
+        return ring.read(obj)
+    if isinstance(obj, dict):
+        return _map_values(obj, lambda v: unpack(v, ring))
+    if isinstance(obj, tuple):
+        return type(obj)(*(unpack(v, ring) for v in obj)) if hasattr(obj, '_fields') else \
+            tuple(unpack(v, ring) for v in obj)
+    if isinstance(obj, list):
+        return [unpack(v, ring) for v in obj]
+    return obj
@@ -0,0 +1,151 @@
+"""
+Inference backends of the segmentation model.
+
+'onnxruntime'   onnxruntime, CPU provider (default)
+'opencv'        OpenCV DNN (cv2.dnn.readNetFromONNX), no extra native runtime needed
+
+Select one per segmenter with CornealNerveSegmenter(backend='opencv'),
+or for every workflow with CornealNerveSegmenter.backend = 'opencv'.
+Use compare_backends to measure latency, throughput and mask agreement on your hosts.
+Engines are created once per (backend, model) and shared by the whole process.
+"""
+import os
+import threading
+import time
+import numpy as np
+from typing import Sequence
+
+
+class InferenceBackend:
+    """ Backend Interface: runs the model on a preprocessed (N, 1, H, W) float32 tensor """
+    name: str
+
+    def __init__(self, onnx_path: str):
+        self.onnx_path = onnx_path
+
+    def run(self, input_tensor: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def max_batch(self) -> int | None:
+        """ Largest batch accepted in one call, None if unlimited """
+        return 1
+
+
+class OrtBackend(InferenceBackend):
+    name = 'onnxruntime'
+
+    def __init__(self, onnx_path: str):
+        super().__init__(onnx_path)
+        import onnxruntime
+
+        sess_options = onnxruntime.SessionOptions()
+        # If you want to use the GPU, please install onnxruntime-gpu and modify it as follows:
+        # providers = ['CUDAExecutionProvider']
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, sess_options=sess_options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def run(self, input_tensor: np.ndarray) -> np.ndarray:
+        # A session can be run from several threads at once
+        return self.session.run([self.output_name], {self.input_name: input_tensor})[0]
+
+    def max_batch(self) -> int | None:
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        return batch_dim if isinstance(batch_dim, int) else None
+
+
+class OpenCVBackend(InferenceBackend):
+    name = 'opencv'
+
+    def __init__(self, onnx_path: str):
+        super().__init__(onnx_path)
+        import cv2
+
+        self.net = cv2.dnn.readNetFromONNX(onnx_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        # A Net keeps its input between setInput and forward: one call at a time
+        self._lock = threading.Lock()
+
+    def run(self, input_tensor: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self.net.setInput(input_tensor)
+            return self.net.forward().copy()
+
+
+BACKENDS: dict[str, type[InferenceBackend]] = {
+    'onnxruntime': OrtBackend,
+    'opencv': OpenCVBackend,
+}
+
+_engines: dict[tuple[str, str], InferenceBackend] = {}
+_engines_lock = threading.Lock()
+
+
+def get_backend(name: str, onnx_path: str) -> InferenceBackend:
+    """ The shared engine of a model for a backend, created on first use """
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown inference backend: {name}. Available: {list(BACKENDS)}')
+    key = (name, os.path.abspath(onnx_path))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = BACKENDS[name](key[1])
+            _engines[key] = engine
+        return engine
+
+
+def clear_backends():
+    """ Release the shared engines, e.g. after replacing a model file """
+    with _engines_lock:
+        _engines.clear()
+
+
+def compare_backends(
+        images: Sequence,
+        backends: Sequence[str] = tuple(BACKENDS),
+        batch_size: int = 8,
+        onnx_path: str | None = None,
+) -> dict:
+    """
+    Benchmark the backends on CPU with the same model.
+
+    :param images: Images or paths accepted by read_image
+    :param batch_size: Batch size of the throughput run (backends without dynamic batch run image by image)
+    :return: {
+        backend: {'latency_ms': mean time of one image, 'throughput': images / s with seg_batch},
+        'agreement': {backend: {'iou_mean', 'iou_min', 'pixel_agreement'}} against the first backend
+    }
+    """
+    from superccm.impl.segment.segment import CornealNerveSegmenter
+    from superccm.impl.io.read import read_image
+    from superccm.impl.utils.tools import cal_iou
+
+    images = [read_image(image) for image in images]
+    report = {'agreement': {}}
+    masks = {}
+    for backend in backends:
+        segmenter = CornealNerveSegmenter(onnx_path=onnx_path, backend=backend)
+        segmenter(images[0])  # warm up
+
+        start = time.perf_counter()
+        masks[backend] = [segmenter(image) for image in images]
+        latency = (time.perf_counter() - start) / len(images)
+
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            segmenter.seg_batch(images[i:i + batch_size])
+        throughput = len(images) / (time.perf_counter() - start)
+        report[backend] = {'latency_ms': latency * 1000, 'throughput': throughput}
+
+    reference = backends[0]
+    for backend in backends[1:]:
+        ious = [cal_iou(a, b) for a, b in zip(masks[reference], masks[backend])]
+        same = [np.mean(a == b) for a, b in zip(masks[reference], masks[backend])]
+        report['agreement'][backend] = {
+            'iou_mean': float(np.mean(ious)),
+            'iou_min': float(np.min(ious)),
+            'pixel_agreement': float(np.mean(same)),
+        }
+    return report
@@ -0,0 +1,157 @@
+"""
+Produce and validate quantized variants of the segmentation model.
+
+    from superccm.impl.segment.quantize import quantize_static_int8, validate_quantized
+    quantize_static_int8(calibration_images)          # writes ccm.int8.onnx next to ccm.onnx
+    report = validate_quantized(images, precision='int8')
+
+Then load it with CornealNerveSegmenter(precision='int8'),
+or set CornealNerveSegmenter.precision = 'int8' to use it in every workflow.
+"""
+import time
+import numpy as np
+from typing import Iterable, Sequence, Literal
+
+from superccm.impl.segment.segment import CornealNerveSegmenter, MODEL_PATHS, preprocess
+from superccm.impl.io.read import read_image
+from superccm.impl.utils.tools import cal_iou
+
+
+def quantize_dynamic_int8(src: str = MODEL_PATHS['fp32'], dst: str = MODEL_PATHS['int8']) -> str:
+    """ INT8 weights, activations quantized at run time. No calibration data needed. """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    return dst
+
+
+def quantize_static_int8(
+        calibration_images: Iterable,
+        src: str = MODEL_PATHS['fp32'],
+        dst: str = MODEL_PATHS['int8'],
+        per_channel: bool = True,
+) -> str:
+    """
+    INT8 weights and activations (QDQ format), with activation ranges calibrated on CCM images.
+    A few dozen representative images are usually enough.
+
+    :param calibration_images: Images or paths accepted by read_image
+    """
+    import onnxruntime
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType, CalibrationDataReader
+
+    class CalibrationReader(CalibrationDataReader):
+        """ Feeds preprocessed CCM images to the calibrator """
+
+        def __init__(self, input_name: str, images: Iterable):
+            self.input_name = input_name
+            self._images = iter(images)
+
+        def get_next(self):
+            image = next(self._images, None)
+            if image is None:
+                return None
+            return {self.input_name: preprocess(read_image(image))}
+
+    input_name = onnxruntime.InferenceSession(src, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = CalibrationReader(input_name, calibration_images)
+    quantize_static(
+        src, dst, reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+    )
+    return dst
+
+
+def convert_fp16(src: str = MODEL_PATHS['fp32'], dst: str = MODEL_PATHS['fp16']) -> str:
+    """ FP16 weights and compute, FP32 inputs and outputs. Requires onnx and onnxconverter-common. """
+    try:
+        import onnx
+        from onnxconverter_common import float16
+    except ImportError:
+        raise ImportError('FP16 conversion requires: pip install onnx onnxconverter-common')
+
+    model = onnx.load(src)
+    model = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model, dst)
+    return dst
+
+
+def _metrics_from_binary(image: np.ndarray, binary: np.ndarray) -> dict[str, float]:
+    from superccm.impl.skeleton.skeletonize import get_skeleton
+    from superccm.impl.graph.graphify import graphify
+    from superccm.impl.trunk.extract_trunks import extract_trunks
+    from superccm.impl.metircs.metrics import get_metrics
+
+    graph = graphify(image, get_skeleton(binary))
+    graph, trunks = extract_trunks(graph)
+    return get_metrics(graph, binary, trunks)
+
+
+def validate_quantized(
+        images: Sequence,
+        precision: Literal['int8', 'fp16'] = 'int8',
+        onnx_path: str | None = None,
+        with_metrics: bool = True,
+) -> dict:
+    """
+    Compare a quantized model with the FP32 model on a corpus.
+
+    :param images: Images or paths accepted by read_image
+    :param precision: The variant to validate
+    :param onnx_path: Explicit path of the variant
+    :param with_metrics: Also run the whole analysis on both masks and report the metric drift
+    :return: {
+        'n_images', 'iou_mean', 'iou_min', 'latency_fp32', 'latency_quantized', 'speedup',
+        'metric_drift': {metric: {'mean_abs', 'max_abs'}},
+        'per_image': [{'iou', 'metrics_fp32', 'metrics_quantized'}, ...]
+    }
+    """
+    reference = CornealNerveSegmenter(precision='fp32')
+    candidate = CornealNerveSegmenter(precision=precision, onnx_path=onnx_path)
+
+    per_image = []
+    t_reference = t_candidate = 0.0
+    for image in images:
+        image = read_image(image)
+
+        start = time.perf_counter()
+        mask_reference = reference(image)
+        t_reference += time.perf_counter() - start
+
+        start = time.perf_counter()
+        mask_candidate = candidate(image)
+        t_candidate += time.perf_counter() - start
+
+        row = {'iou': cal_iou(mask_reference, mask_candidate)}
+        if with_metrics:
+            row['metrics_fp32'] = _metrics_from_binary(image, mask_reference)
+            row['metrics_quantized'] = _metrics_from_binary(image, mask_candidate)
+        per_image.append(row)
+
+    n = len(per_image)
+    ious = [row['iou'] for row in per_image]
+    report = {
+        'n_images': n,
+        'iou_mean': float(np.mean(ious)) if n else None,
+        'iou_min': float(np.min(ious)) if n else None,
+        'latency_fp32': t_reference / n if n else None,
+        'latency_quantized': t_candidate / n if n else None,
+        'speedup': t_reference / t_candidate if t_candidate else None,
+        'metric_drift': {},
+        'per_image': per_image,
+    }
+    if with_metrics and n:
+        for metric in per_image[0]['metrics_fp32']:
+            diffs = [
+                abs(row['metrics_quantized'][metric] - row['metrics_fp32'][metric])
+                for row in per_image
+                if row['metrics_fp32'][metric] is not None and row['metrics_quantized'][metric] is not None
+            ]
+            report['metric_drift'][metric] = {
+                'mean_abs': float(np.mean(diffs)) if diffs else None,
+                'max_abs': float(np.max(diffs)) if diffs else None,
+            }
+    return report
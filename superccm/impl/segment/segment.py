@@ -1,44 +1,109 @@
-import onnxruntime
 import numpy as np
 import cv2
 import os
 
+from typing import Literal, Sequence
+
+from superccm.impl.segment.backends import get_backend, clear_backends, InferenceBackend
+
 CCM_IMAGE_SHAPE = (384, 384)
+MODEL_DIR = os.path.abspath(os.path.dirname(__file__))
+MODEL_PATHS = {
+    'fp32': os.path.join(MODEL_DIR, 'ccm.onnx'),
+    'int8': os.path.join(MODEL_DIR, 'ccm.int8.onnx'),
+    'fp16': os.path.join(MODEL_DIR, 'ccm.fp16.onnx'),
+}
+
+
+def preprocess(image: np.ndarray) -> np.ndarray:
+    """ Image -> input tensor with shape (1, 1, H, W) """
+    image_resized = cv2.resize(image, CCM_IMAGE_SHAPE)
+
+    input_tensor = image_resized.astype(np.float32) / 255.0
+    input_tensor = np.expand_dims(input_tensor, axis=0)  # 添加批次维度
+    input_tensor = np.expand_dims(input_tensor, axis=0)  # 添加通道维度
+    return input_tensor
+
+
+def postprocess(output_data: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    """ Output probability map -> binary mask (0/255) """
+    mask = (output_data > threshold).squeeze()
+    mask = (mask * 255).astype(np.uint8)
+    return mask
 
 
 class CornealNerveSegmenter:
-    onnx_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'ccm.onnx')
+    onnx_path = MODEL_PATHS['fp32']
+    # 'fp32', or a quantized variant produced by superccm.impl.segment.quantize
+    precision: Literal['fp32', 'int8', 'fp16'] = 'fp32'
+    # Inference backend, see superccm.impl.segment.backends
+    backend: Literal['onnxruntime', 'opencv'] = 'onnxruntime'
 
-    def __init__(self):
-        self.sess_options = onnxruntime.SessionOptions()
-        # If you want to use the GPU, please install onnxruntime-gpu and modify it as follows:
-        # providers = ['CUDAExecutionProvider']
-        self.ort_session = onnxruntime.InferenceSession(
-            self.onnx_path, sess_options=self.sess_options, providers=['CPUExecutionProvider'])
+    def __init__(
+            self,
+            precision: Literal['fp32', 'int8', 'fp16'] | None = None,
+            onnx_path: str | None = None,
+            backend: Literal['onnxruntime', 'opencv'] | None = None,
+    ):
+        """
+        :param precision: Model variant to load. Defaults to the class attribute 'precision'
+        :param onnx_path: Explicit model path, overrides 'precision'
+        :param backend: Inference backend. Defaults to the class attribute 'backend'
+        """
+        precision = precision or self.precision
+        if onnx_path is None:
+            if precision not in MODEL_PATHS:
+                raise ValueError("Unknown precision: %s" % precision)
+            onnx_path = self.onnx_path if precision == 'fp32' else MODEL_PATHS[precision]
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"Model not found: {onnx_path}. "
+                f"Quantized variants are produced by superccm.impl.segment.quantize."
+            )
+        self.precision = precision
+        self.onnx_path = onnx_path
+        self.backend = backend or self.backend
+
+        # One engine per model and per backend, shared by all the instances of the process (workflows, api, threads)
+        self.engine: InferenceBackend = get_backend(self.backend, self.onnx_path)
+        if self.backend == 'onnxruntime':
+            self.ort_session = self.engine.session
+            self.sess_options = self.ort_session.get_session_options()
+
+    @classmethod
+    def get_session(cls, onnx_path: str):
+        """ The shared onnxruntime session of a model, created on first use """
+        return get_backend('onnxruntime', onnx_path).session
+
+    @classmethod
+    def clear_sessions(cls):
+        """ Release the shared sessions and engines, e.g. after replacing a model file """
+        clear_backends()
 
     def seg(self, image: np.ndarray) -> np.ndarray:
         """
         Perform segmentation prediction on the input single image.
         """
-        input_name = self.ort_session.get_inputs()[0].name
-        output_name = self.ort_session.get_outputs()[0].name
-
-        image_resized = cv2.resize(image, CCM_IMAGE_SHAPE)
+        input_tensor = preprocess(image)
 
-        input_tensor = image_resized.astype(np.float32) / 255.0
-        input_tensor = np.expand_dims(input_tensor, axis=0)  # 添加批次维度
-        input_tensor = np.expand_dims(input_tensor, axis=0)  # 添加通道维度
+        output_data = self.engine.run(input_tensor)
 
-        ort_inputs = {input_name: input_tensor}
-        ort_outputs = self.ort_session.run([output_name], ort_inputs)
+        mask = postprocess(output_data)
 
-        output_data = ort_outputs[0]
+        return mask
 
-        threshold = 0.5
-        mask = (output_data > threshold).squeeze()
-        mask = (mask * 255).astype(np.uint8)
+    def seg_batch(self, images: Sequence[np.ndarray]) -> list[np.ndarray]:
+        """
+        Segment several images. They are stacked into one inference call if the model has a dynamic batch dimension,
+        otherwise they are run one by one.
+        """
+        max_batch = self.engine.max_batch()
+        if len(images) <= 1 or (max_batch is not None and max_batch != len(images)):
+            return [self.seg(image) for image in images]
 
-        return mask
+        input_tensor = np.concatenate([preprocess(image) for image in images], axis=0)
+        output_data = self.engine.run(input_tensor)
+        return [postprocess(output) for output in output_data]
 
     def __call__(self, image: np.ndarray) -> np.ndarray:
         binary = self.seg(image)
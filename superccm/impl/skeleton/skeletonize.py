@@ -1,8 +1,7 @@
-from skimage.morphology import skeletonize
 import numpy as np
 import cv2
 
-from superccm.impl.utils.tools import get_split_label, get_canvas
+from superccm.impl.utils.tools import get_split_label, get_canvas, skeletonize_255
 from superccm.impl.utils.prune import prune
 
 CCM_IMAGE_SHAPE = (384, 384)
@@ -12,14 +11,6 @@ CENTER_MIN_LENGTH = 75
 PRUNE_THRESH = 5
 
 
-def _skeletonize_255(image: np.ndarray) -> np.ndarray:
-    image = image > 0
-    skeleton = skeletonize(image)
-    skeleton = skeleton.astype('uint8')
-    skeleton = skeleton * 255
-    return skeleton
-
-
 def _set_edge(canvas: np.ndarray, x: int, value: int) -> np.ndarray:
     canvas[:x, :] = value  # up
     canvas[-x:, :] = value  # down
@@ -29,6 +20,7 @@ def _set_edge(canvas: np.ndarray, x: int, value: int) -> np.ndarray:
 
 
 EDGE_CANVAS = _set_edge(get_canvas(1), EDGE_THRESH, 255)
+BORDER_CANVAS = _set_edge(get_canvas(1), 1, 255)
 
 
 def get_skeleton(
@@ -36,13 +28,23 @@ def get_skeleton(
         min_length: int = CENTER_MIN_LENGTH,
         min_length_edge: int = EDGE_MIN_LENGTH,
         prune_thresh: int = PRUNE_THRESH,
+        backend: str | None = None,
+        window: tuple[int, int, int, int] | None = None,
 ) -> np.ndarray:
-    skeleton = _skeletonize_255(binary_image)
+    """
+    :param backend: Thinning backend, see superccm.impl.skeleton.thinning. None means the default one
+    :param window: (x, y, w, h) of the CCM image that binary_image is a crop of, so that the rules at the border
+                   of the image still apply. None means binary_image is the whole image
+    """
+    x, y, w, h = window or (0, 0, *CCM_IMAGE_SHAPE[::-1])
+    edge_canvas = EDGE_CANVAS[y:y + h, x:x + w]
+
+    skeleton = skeletonize_255(binary_image, backend)
     # Filter discrete short segments/过滤离散短小片段
     for label in get_split_label(skeleton, 2):
         # If one is at the periphery/如果处于边缘
         length = cv2.countNonZero(label)
-        in_edge = np.any(cv2.bitwise_and(label, EDGE_CANVAS))
+        in_edge = np.any(cv2.bitwise_and(label, edge_canvas))
         if in_edge and length < min_length_edge:
             skeleton -= label
         # If not/如果不是
@@ -50,9 +52,12 @@ def get_skeleton(
             skeleton -= label
 
     # Remove burrs/去除毛刺
-    skeleton = prune(skeleton, prune_thresh)
+    skeleton = prune(skeleton, prune_thresh, backend)
 
     # Set the edge pixels to 0 by 1 unit/设置边缘1像素为 0
-    skeleton = _set_edge(skeleton, 1, 0)
+    if window is None:
+        skeleton = _set_edge(skeleton, 1, 0)
+    else:
+        skeleton[BORDER_CANVAS[y:y + h, x:x + w] > 0] = 0
 
     return skeleton
@@ -0,0 +1,90 @@
+"""
+Thinning backends used to skeletonize binary images.
+
+'skimage'     skimage.morphology.skeletonize (Zhang-Suen, compiled lookup table). The reference and the default.
+
+Other backends can be registered with register_implementation('thinning', name, function)
+(see superccm.impl.implementations) and selected with set_default_backend, or with the 'backend' argument of
+get_skeleton / prune.
+Check them with check_topology and benchmark first: a backend is only worth selecting if it is faster than
+skimage (about 2 ms per 384*384 mask) and gives the same topology (components, endpoints and branching pixels).
+get_skeleton thins once, then prune thins again only after the passes that removed pixels.
+"""
+import time
+import numpy as np
+import cv2
+from skimage.morphology import skeletonize
+from typing import Callable, Sequence
+
+from superccm.impl.implementations import register_implementation, set_implementation, get_implementation
+
+CLASSIFY_KERNEL = np.array([
+    [1, 1, 1],
+    [1, 10, 1],
+    [1, 1, 1]
+], dtype='uint8')
+
+
+def thin_skimage(image: np.ndarray) -> np.ndarray:
+    return skeletonize(image > 0)
+
+
+BACKENDS: dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'skimage': thin_skimage,
+}
+for _name, _function in BACKENDS.items():
+    register_implementation('thinning', _name, _function)
+
+
+def set_default_backend(backend: str):
+    """ Select the thinning backend used by get_skeleton and prune """
+    set_implementation('thinning', backend)
+
+
+def thin(image: np.ndarray, backend: str | None = None) -> np.ndarray:
+    """
+    Thin a binary image to a one pixel wide skeleton.
+    :param image: Binary image, any non-zero pixel is foreground
+    :param backend: One of BACKENDS, None means the selected one (see superccm.impl.implementations)
+    :return: Boolean skeleton
+    """
+    return get_implementation('thinning', backend)(image)
+
+
+def topology(skeleton: np.ndarray) -> dict[str, int]:
+    """ Number of connected components, endpoints and branching pixels of a skeleton """
+    skeleton = (skeleton > 0).astype(np.uint8)
+    cls = cv2.filter2D(skeleton, -1, CLASSIFY_KERNEL, borderType=cv2.BORDER_CONSTANT)
+    num, _ = cv2.connectedComponents(skeleton, connectivity=8)
+    return {
+        'components': num - 1,
+        'endpoints': int(np.count_nonzero(cls == 11)),
+        'branch_points': int(np.count_nonzero(cls >= 13)),
+    }
+
+
+def check_topology(images: Sequence[np.ndarray], backend: str, reference: str = 'skimage') -> list[dict]:
+    """
+    Compare the skeletons of a backend with the reference on a set of binary images.
+    :return: One row per image: {'identical', 'same_topology', 'reference': topology, 'backend': topology}
+    """
+    rows = []
+    for image in images:
+        a, b = thin(image, reference), thin(image, backend)
+        ta, tb = topology(a), topology(b)
+        rows.append({'identical': bool(np.array_equal(a, b)), 'same_topology': ta == tb,
+                     'reference': ta, 'backend': tb})
+    return rows
+
+
+def benchmark(images: Sequence[np.ndarray], backends: Sequence[str] = tuple(BACKENDS), repeat: int = 3) -> dict:
+    """ Mean time (seconds per image) of each backend """
+    result = {}
+    for backend in backends:
+        thin(images[0], backend)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for image in images:
+                thin(image, backend)
+        result[backend] = (time.perf_counter() - start) / (repeat * len(images))
+    return result
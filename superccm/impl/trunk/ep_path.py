@@ -1,6 +1,8 @@
 from collections import deque
 import numpy as np
 
+from superccm.impl.implementations import register_implementation, get_implementation
+
 
 def shortest_path(img, start, goal, connectivity=8):
     """
@@ -38,6 +40,21 @@ def shortest_path(img, start, goal, connectivity=8):
         return None  # goal on background
     if (sr, sc) == (gr, gc):
         return [(sr, sc)]
+    # neighbor offsets (in r,c) to iterate
+    if connectivity == 4:
+        neigh = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    elif connectivity == 8:
+        neigh = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+    else:
+        raise ValueError("connectivity must be 4 or 8")
+    return get_implementation('shortest_path')(mask, start, goal, neigh)
+
+
+def _shortest_path_python(mask, start, goal, neigh):
+    """ BFS from start to goal (distinct foreground pixels), visiting the neighbours in the order of neigh """
+    H, W = mask.shape
+    sr, sc = start
+    gr, gc = goal
     # flattened indexing for speed
     N = H * W
     start_idx = sr * W + sc
@@ -48,13 +65,6 @@ def shortest_path(img, start, goal, connectivity=8):
     dq.append(start_idx)
     visited[start_idx] = True
     parent[start_idx] = -2  # sentinel for start
-    # neighbor offsets (in r,c) to iterate
-    if connectivity == 4:
-        neigh = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-    elif connectivity == 8:
-        neigh = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-    else:
-        raise ValueError("connectivity must be 4 or 8")
     # BFS loop
     while dq:
         idx = dq.popleft()
@@ -87,3 +97,15 @@ def shortest_path(img, start, goal, connectivity=8):
             dq.append(nidx)
     # no path found
     return None
+
+
+def _shortest_path_numba(mask, start, goal, neigh):
+    from superccm.impl.utils.numba_kernels import bfs_path
+
+    path = bfs_path(np.ascontiguousarray(mask), int(start[0]), int(start[1]), int(goal[0]), int(goal[1]),
+                    np.array(neigh, dtype=np.int64))
+    return [(r, c) for r, c in path.tolist()] or None
+
+
+register_implementation('shortest_path', 'python', _shortest_path_python)
+register_implementation('shortest_path', 'numba', _shortest_path_numba)
@@ -38,9 +38,9 @@ def nodes_to_edges(nodes):
     return list(zip(nodes[:-1], nodes[1:]))
 
 
-def nodes_to_canvas(G: nx.Graph, nodes):
+def nodes_to_canvas(G: nx.Graph, nodes, shape: tuple[int, int] = CCM_IMAGE_SHAPE):
     """ Draw the path nodes as Canvas """
-    canvas = get_canvas()
+    canvas = get_canvas(1, shape)
     for u, v in nodes_to_edges(nodes):
         canvas += G[u][v]['obj'].canvas
     for n in nodes:
@@ -48,8 +48,11 @@ def nodes_to_canvas(G: nx.Graph, nodes):
     return canvas
 
 
-def get_ep_pairs(graph: nx.Graph, img_shape):
-    """ Obtain possible endpoint pairs (excluding boundary endpoints) """
+def get_ep_pairs(graph: nx.Graph, img_shape, origin: tuple[int, int] = (0, 0)):
+    """
+    Obtain possible endpoint pairs (excluding boundary endpoints)
+    :param origin: (x, y) of the graph coordinates in the image, when the graph was built on a crop
+    """
     h, w = img_shape
     thresh = (h + w) / 20
     component_map = {n: idx for idx, comp in enumerate(nx.connected_components(graph)) for n in comp}
@@ -58,6 +61,7 @@ def get_ep_pairs(graph: nx.Graph, img_shape):
     eps_edge = []
     for n, obj in eps:
         x, y = obj.centroid
+        x, y = x + origin[0], y + origin[1]
         distances = [x, y, w - x, h - y]
         ds = {f'd{i}' for i, d in enumerate(distances) if d <= thresh}
         if ds:
@@ -73,7 +77,7 @@ def get_ep_pairs(graph: nx.Graph, img_shape):
     return ep_pairs
 
 
-def get_paths(graph, ep_pairs):
+def get_paths(graph, ep_pairs, shape: tuple[int, int] = CCM_IMAGE_SHAPE):
     """ Generate a list of paths for the endpoint pairs """
     path_list = []
     for (n1, obj1), (n2, obj2) in ep_pairs:
@@ -81,7 +85,7 @@ def get_paths(graph, ep_pairs):
         x2, y2 = map(int, obj2.centroid)
 
         for i, nodes in enumerate(nx.shortest_simple_paths(graph, n1, n2, weight=lambda u, v, d: d['obj'].length)):
-            skeleton_p = nodes_to_canvas(graph, nodes)
+            skeleton_p = nodes_to_canvas(graph, nodes, shape)
             edges = nodes_to_edges(nodes)
             intensities = np.array([graph[u][v]['obj'].intensity_mean for u, v in edges])
             lengths = np.array([max(50, graph[u][v]['obj'].length) for u, v in edges])
@@ -115,12 +119,12 @@ def sort_key(item):
 def get_trunks(paths, skeleton):
     canvas_list = sorted(paths, key=sort_key)
 
-    canvas_all = get_canvas(1)
+    canvas_all = get_canvas(1, skeleton.shape)
     nodes_records = set()
 
     for path, stats, nodes in canvas_list:
         xs, ys = zip(*path)
-        canvas = get_canvas(1)
+        canvas = get_canvas(1, skeleton.shape)
         canvas[xs, ys] = skeleton[xs, ys]
 
         if not nodes & nodes_records:
@@ -131,12 +135,20 @@ def get_trunks(paths, skeleton):
     return canvas_all
 
 
-def extract_trunks(graph: nx.MultiGraph) -> tuple[nx.MultiGraph, np.ndarray]:
+def extract_trunks(
+        graph: nx.MultiGraph,
+        window: tuple[int, int, int, int] | None = None,
+) -> tuple[nx.MultiGraph, np.ndarray]:
+    """
+    :param window: (x, y, w, h) of the CCM image that the graph was built on, if it is a crop.
+                   Endpoints are still classified by their distance to the border of the whole image
+    """
+    x, y, w, h = window or (0, 0, *CCM_IMAGE_SHAPE[::-1])
     graph_: nx.MultiGraph = graph.copy()
     graph_nm = multigraph_to_graph(graph, lambda u, v, k, d: d['obj'].intensity_mean)
-    ep_pairs = get_ep_pairs(graph_nm, CCM_IMAGE_SHAPE)
-    paths = get_paths(graph_nm, ep_pairs)
-    trunk_canvas = get_trunks(paths, graph_to_skeleton(graph_))
+    ep_pairs = get_ep_pairs(graph_nm, CCM_IMAGE_SHAPE, (x, y))
+    paths = get_paths(graph_nm, ep_pairs, (h, w))
+    trunk_canvas = get_trunks(paths, graph_to_skeleton(graph_, (h, w)))
     for _, _, _, data in graph_.edges(keys=True, data=True):
         edge_obj = data['obj']
         if np.any(cv2.bitwise_and(edge_obj.canvas, trunk_canvas)):
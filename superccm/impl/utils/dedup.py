@@ -0,0 +1,77 @@
+import numpy as np
+import cv2
+
+# Number of set bits of every byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def frame_signature(image: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """
+    Compact perceptual signature (difference hash) of a frame.
+    The frame is shrunk to (hash_size + 1) * hash_size and each bit tells whether a pixel is brighter than its right neighbour.
+
+    :param image: Grayscale image
+    :param hash_size: The signature has hash_size ** 2 bits
+    :return: Packed bits (uint8 array)
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits, axis=None)
+
+
+class FrameDeduplicator:
+    """
+    Index of frame signatures for one batch (or one patient), used to skip near-duplicate frames.
+    A frame is a duplicate if its signature differs from an indexed frame by at most 'threshold' bits.
+    Small signatures mostly capture the vignetting and the illumination of a CCM frame, so that distinct frames of
+    a burst can be within a few bits of each other: the defaults only match frames with identical 256-bit signatures.
+
+    Usage:
+        dedup = FrameDeduplicator()
+        for key, metrics in batch_analysis(items, dedup=dedup):
+            ...
+        print(dedup.n_duplicates, dedup.duplicates)  # key -> key of the frame whose metrics were reused
+    """
+
+    def __init__(self, threshold: int = 0, hash_size: int = 16):
+        """
+        :param threshold: Maximum Hamming distance (bits) between near-duplicate signatures. 0 only matches identical signatures
+        :param hash_size: See frame_signature
+        """
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.reset()
+
+    def reset(self):
+        """ Clear the index, e.g. when moving to the next patient """
+        self._keys = []
+        # Grown geometrically, the first len(self._keys) rows are in use
+        self._signatures = np.zeros((64, (self.hash_size ** 2 + 7) // 8), dtype=np.uint8)
+        self.n_frames = 0
+        self.duplicates = {}  # key -> key of the frame it duplicates
+
+    @property
+    def n_duplicates(self) -> int:
+        return len(self.duplicates)
+
+    def match(self, key, image: np.ndarray):
+        """
+        Look up a frame. Returns the key of the nearest indexed frame within the threshold,
+        otherwise indexes the frame and returns None.
+        """
+        self.n_frames += 1
+        signature = frame_signature(image, self.hash_size)
+        n = len(self._keys)
+        if n:
+            distances = POPCOUNT[self._signatures[:n] ^ signature].sum(axis=1, dtype=np.int64)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.threshold:
+                self.duplicates[key] = self._keys[nearest]
+                return self._keys[nearest]
+        if n == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.zeros_like(self._signatures)])
+        self._signatures[n] = signature
+        self._keys.append(key)
+        return None
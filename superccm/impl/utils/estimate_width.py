@@ -14,9 +14,11 @@ def get_conv2d(image, kernel):
     return output
 
 
-def estimate_width(image, skeleton):
+def estimate_width(image, skeleton=None):
+    """ Smoothed intensity on the skeleton pixels. If skeleton is None, the whole map is returned. """
     conv_result = get_conv2d(image, get_gaussian_kernel(ksize=5))
-    conv_result[skeleton == 0] = 0
+    if skeleton is not None:
+        conv_result[skeleton == 0] = 0
     # result = image.copy()
     # result[skeleton == 0] = 0
     return conv_result
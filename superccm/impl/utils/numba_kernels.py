@@ -0,0 +1,191 @@
+"""
+Numba-compiled versions of the pixel-walking loops (optional: pip install superccm[numba]).
+
+Each kernel reproduces its Python reference step by step (same visiting order, same tie-breaking),
+so the results are identical. They are selected automatically when numba is installed,
+see superccm.impl.implementations (stages 'shortest_path', 'branch_points', 'redundant_pixels').
+
+The machine code is cached on disk (cache=True, next to this file or in NUMBA_CACHE_DIR),
+so only the first process ever compiles. Call warmup() when a worker starts to load it before the first image.
+"""
+import numpy as np
+from numba import njit
+
+# Neighbour offsets (dr, dc) in the visiting order of the Python references
+EP_PATH_OFFSETS_4 = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)], dtype=np.int64)
+EP_PATH_OFFSETS_8 = np.array([(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)], dtype=np.int64)
+
+
+@njit(cache=True)
+def bfs_path(mask, sr, sc, gr, gc, offsets):
+    """
+    Unweighted shortest path between two foreground pixels of a boolean mask.
+    :return: (n, 2) array of (row, col) from start to goal, empty if there is no path
+    """
+    h, w = mask.shape
+    parent = np.full(h * w, -1, dtype=np.int64)
+    queue = np.empty(h * w, dtype=np.int64)
+    start, goal = sr * w + sc, gr * w + gc
+    parent[start] = start
+    queue[0] = start
+    head, tail = 0, 1
+    while head < tail:
+        idx = queue[head]
+        head += 1
+        r, c = idx // w, idx % w
+        for k in range(offsets.shape[0]):
+            nr, nc = r + offsets[k, 0], c + offsets[k, 1]
+            if nr < 0 or nr >= h or nc < 0 or nc >= w:
+                continue
+            nidx = nr * w + nc
+            if parent[nidx] != -1 or not mask[nr, nc]:
+                continue
+            parent[nidx] = idx
+            if nidx == goal:
+                n = 1
+                cur = nidx
+                while cur != start:
+                    cur = parent[cur]
+                    n += 1
+                path = np.empty((n, 2), dtype=np.int64)
+                cur = nidx
+                for i in range(n - 1, -1, -1):
+                    path[i, 0], path[i, 1] = cur // w, cur % w
+                    cur = parent[cur]
+                return path
+            queue[tail] = nidx
+            tail += 1
+    return np.empty((0, 2), dtype=np.int64)
+
+
+@njit(cache=True)
+def _degree(skel, y, x):
+    h, w = skel.shape
+    count = 0
+    for dy in range(-1, 2):
+        for dx in range(-1, 2):
+            if dy == 0 and dx == 0:
+                continue
+            ny, nx_ = y + dy, x + dx
+            if 0 <= ny < h and 0 <= nx_ < w and skel[ny, nx_] > 0:
+                count += 1
+    return count
+
+
+@njit(cache=True)
+def true_branch_points(skel, ys, xs, bounds, cy, cx):
+    """
+    Kernel of prune.extract_true_branch_points.
+    :param ys, xs: Pixels of the branch clusters, grouped by cluster, in row-major order inside each cluster
+    :param bounds: Cluster i holds the pixels bounds[i]:bounds[i + 1]
+    :param cy, cx: Centre of mass of each cluster
+    :return: (n, 2) array of (y, x)
+    """
+    h, w = skel.shape
+    out = np.empty((ys.shape[0], 2), dtype=np.int64)
+    n_out = 0
+    for i in range(bounds.shape[0] - 1):
+        lo, hi = bounds[i], bounds[i + 1]
+
+        # Pixels with both a horizontal and a vertical 4-neighbour are all true branch points
+        n_multi = 0
+        for j in range(lo, hi):
+            y, x = ys[j], xs[j]
+            has_vert = (y > 0 and skel[y - 1, x] > 0) or (y < h - 1 and skel[y + 1, x] > 0)
+            has_horz = (x > 0 and skel[y, x - 1] > 0) or (x < w - 1 and skel[y, x + 1] > 0)
+            if has_vert and has_horz:
+                out[n_out, 0], out[n_out, 1] = y, x
+                n_out += 1
+                n_multi += 1
+        if n_multi:
+            continue
+
+        # Most 4-neighbours, then largest degree sum of the 8-neighbours, then closest to the centre of mass
+        four = np.zeros(hi - lo, dtype=np.int64)
+        for j in range(lo, hi):
+            y, x = ys[j], xs[j]
+            four[j - lo] = ((y > 0 and skel[y - 1, x] > 0) + (y < h - 1 and skel[y + 1, x] > 0)
+                            + (x > 0 and skel[y, x - 1] > 0) + (x < w - 1 and skel[y, x + 1] > 0))
+        max4 = four.max()
+
+        deg = np.full(hi - lo, -1, dtype=np.int64)
+        for j in range(lo, hi):
+            if four[j - lo] != max4:
+                continue
+            y, x = ys[j], xs[j]
+            total = 0
+            for dy in range(-1, 2):
+                for dx in range(-1, 2):
+                    if dy == 0 and dx == 0:
+                        continue
+                    ny, nx_ = y + dy, x + dx
+                    if 0 <= ny < h and 0 <= nx_ < w:
+                        total += _degree(skel, ny, nx_)
+            deg[j - lo] = total
+        max_deg = deg.max()
+
+        best, best_dist = -1, np.inf
+        for j in range(lo, hi):
+            if four[j - lo] != max4 or deg[j - lo] != max_deg:
+                continue
+            dist = np.hypot(ys[j] - cy[i], xs[j] - cx[i])
+            if dist < best_dist:
+                best, best_dist = j, dist
+        out[n_out, 0], out[n_out, 1] = ys[best], xs[best]
+        n_out += 1
+    return out[:n_out]
+
+
+@njit(cache=True)
+def redundant_pixels(skel, xs, ys):
+    """
+    Kernel of the pruning of redundant junction pixels: in order, a pixel is removed if its skeleton 8-neighbours
+    (in the current state of the skeleton) are all 4-connected to each other, see tools.is_4_connected.
+    Modifies skel in place.
+    """
+    h, w = skel.shape
+    ox = np.empty(8, dtype=np.int64)
+    oy = np.empty(8, dtype=np.int64)
+    stack = np.empty(8, dtype=np.int64)
+    visited = np.empty(8, dtype=np.bool_)
+    for i in range(xs.shape[0]):
+        x, y = xs[i], ys[i]
+        n = 0
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                if dx == 0 and dy == 0:
+                    continue
+                # Neighbours outside the image are background
+                ny, nx_ = y + dy, x + dx
+                if 0 <= ny < h and 0 <= nx_ < w and skel[ny, nx_]:
+                    ox[n], oy[n] = dx, dy
+                    n += 1
+        if n == 0:
+            continue
+        visited[:n] = False
+        visited[0] = True
+        stack[0] = 0
+        top, seen = 1, 1
+        while top:
+            top -= 1
+            a = stack[top]
+            for b in range(n):
+                if not visited[b] and abs(ox[a] - ox[b]) + abs(oy[a] - oy[b]) == 1:
+                    visited[b] = True
+                    stack[top] = b
+                    top += 1
+                    seen += 1
+        if seen == n:
+            skel[y, x] = 0
+    return skel
+
+
+def warmup():
+    """ Compile the kernels, or load them from the cache, with the argument types used by the pipeline """
+    mask = np.ones((3, 3), dtype=np.bool_)
+    bfs_path(mask, 0, 0, 2, 2, EP_PATH_OFFSETS_8)
+    skel = np.full((3, 3), 255, dtype=np.uint8)
+    coords = np.array([1], dtype=np.int64)
+    true_branch_points(skel, coords, coords, np.array([0, 1], dtype=np.int64),
+                       np.array([1.0]), np.array([1.0]))
+    redundant_pixels(skel, coords, coords)
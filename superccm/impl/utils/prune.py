@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 from scipy.ndimage import label, center_of_mass
 from .tools import get_split_label, get_coordinates, get_conv2d, get_8_neighbors, is_4_connected, skeletonize_255
+from superccm.impl.implementations import register_implementation, get_implementation
 
 CLASSIFY_KERNEL = np.array([
     [1, 1, 1],
@@ -40,6 +41,10 @@ def degree(img, y, x):
 def extract_true_branch_points(skel, branch_candidates):
     """在每个分支簇中挑选真正分支点（可能多个）"""
     labeled, n = label(branch_candidates)
+    return get_implementation('branch_points')(skel, labeled, n)
+
+
+def _true_branch_points_python(skel, labeled, n):
     true_branches = []
 
     for i in range(1, n + 1):
@@ -85,24 +90,75 @@ def extract_true_branch_points(skel, branch_candidates):
     return true_branches
 
 
-def _prune(skeleton_image, length_thresh=5):
+def _true_branch_points_numba(skel, labeled, n):
+    from superccm.impl.utils.numba_kernels import true_branch_points
+
+    ys, xs = np.nonzero(labeled)
+    ids = labeled[ys, xs]
+    order = np.argsort(ids, kind='stable')
+    count = np.bincount(ids, minlength=n + 1)[1:]
+    bounds = np.concatenate(([0], np.cumsum(count))).astype(np.int64)
+    # Sums of integer coordinates are exact: same centres of mass as scipy
+    cy = np.bincount(ids, weights=ys, minlength=n + 1)[1:] / count
+    cx = np.bincount(ids, weights=xs, minlength=n + 1)[1:] / count
+    return true_branch_points(np.ascontiguousarray(skel), ys[order].astype(np.int64), xs[order].astype(np.int64),
+                              bounds, cy, cx)
+
+
+def remove_redundant_pixels(skeleton, coords):
+    """
+    In order, remove the pixels whose skeleton neighbours are all 4-connected to each other.
+    :param skeleton: Skeleton image, modified in place
+    :param coords: (x, y) candidates
+    """
+    return get_implementation('redundant_pixels')(skeleton, coords)
+
+
+def _redundant_pixels_python(skeleton, coords):
+    height, width = skeleton.shape
+    for coord in coords:
+        neighbors = get_8_neighbors(*coord)
+        # 周围骨架像素全部4连通 (neighbours outside the image are background)
+        neighbors = [(x, y) for x, y in neighbors if 0 <= x < width and 0 <= y < height and skeleton[y, x]]
+        if is_4_connected(neighbors):
+            x, y = coord
+            skeleton[y, x] = 0
+    return skeleton
+
+
+def _redundant_pixels_numba(skeleton, coords):
+    from superccm.impl.utils.numba_kernels import redundant_pixels
+
+    if not len(coords):
+        return skeleton
+    xs, ys = np.array(coords, dtype=np.int64).T
+    return redundant_pixels(skeleton, np.ascontiguousarray(xs), np.ascontiguousarray(ys))
+
+
+register_implementation('branch_points', 'python', _true_branch_points_python)
+register_implementation('branch_points', 'numba', _true_branch_points_numba)
+register_implementation('redundant_pixels', 'python', _redundant_pixels_python)
+register_implementation('redundant_pixels', 'numba', _redundant_pixels_numba)
+
+
+def _prune(skeleton_image, length_thresh=5, backend=None):
     skeleton_image = skeleton_image.copy()
     skeleton_cls = get_conv2d(skeleton_image / 255, CLASSIFY_KERNEL)
 
     # 查找真分支点像素
     branch_points = extract_true_branch_points(skeleton_image, skeleton_cls >= 13)
-    canvas_bp = superccm.api.get_canvas(1)
+    canvas_bp = superccm.api.get_canvas(1, skeleton_image.shape)
     for r, c in branch_points:
         canvas_bp[r, c] = 255
 
     # 端点像素
-    canvas_ep = superccm.api.get_canvas(1)
+    canvas_ep = superccm.api.get_canvas(1, skeleton_image.shape)
     canvas_ep[skeleton_cls == 11] = 255
     # coords_ep = get_coordinates(skeleton_cls, 11)
 
     # 去除短分支
     skeleton_ = skeleton_image.copy()
-    canvas = superccm.api.get_canvas(1)
+    canvas = superccm.api.get_canvas(1, skeleton_image.shape)
     canvas[skeleton_cls == 12] = 255
     canvas[skeleton_cls == 11] = 255
     canvas[canvas_bp > 0] = 0
@@ -115,24 +171,21 @@ def _prune(skeleton_image, length_thresh=5):
             skeleton_[label > 0] = 0
 
     # 中间像素判定(degree >= 3 and not a true branch point)
-    canvas_mid = superccm.api.get_canvas(1)
+    canvas_mid = superccm.api.get_canvas(1, skeleton_image.shape)
     canvas_mid[skeleton_cls >= 13] = 255
     canvas_mid = canvas_mid - canvas_bp
-    for coord in get_coordinates(canvas_mid):
-        neighbors = get_8_neighbors(*coord)
-        # 周围骨架像素全部4连通
-        neighbors = [(x, y) for x, y in neighbors if skeleton_[y, x]]
-        if is_4_connected(neighbors):
-            x, y = coord
-            skeleton_[y, x] = 0
+    remove_redundant_pixels(skeleton_, get_coordinates(canvas_mid))
 
-    return skeletonize_255(skeleton_)
+    # Nothing removed: the input skeleton is already thin, skip thinning it again
+    if np.array_equal(skeleton_, skeleton_image):
+        return skeleton_
+    return skeletonize_255(skeleton_, backend)
 
 
-def prune(skeleton_image, length_thresh=5):
-    """ Remove burrs from the skeleton """
+def prune(skeleton_image, length_thresh=5, backend=None):
+    """ Remove burrs from the skeleton (a thinned image, e.g. from skeletonize_255) """
     while True:
-        skeleton_ = _prune(skeleton_image, length_thresh=length_thresh)
+        skeleton_ = _prune(skeleton_image, length_thresh=length_thresh, backend=backend)
         if np.sum(skeleton_) == np.sum(skeleton_image):
             break
         else:
@@ -0,0 +1,90 @@
+import numpy as np
+import cv2
+
+
+def quality_measures(image: np.ndarray, size: int = 128) -> dict[str, float]:
+    """
+    Cheap image-quality measures, computed on a downsampled frame.
+
+    focus:      variance of the Laplacian (low for blurred frames)
+    contrast:   standard deviation of the gray levels
+    entropy:    Shannon entropy of the gray-level histogram, in bits (low for blank or washed-out frames)
+    saturated:  fraction of pixels at 250 or more
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    p = hist[hist > 0] / small.size
+    return {
+        'focus': float(cv2.Laplacian(small, cv2.CV_64F).var()),
+        'contrast': float(small.std()),
+        'entropy': max(0.0, float(-(p * np.log2(p)).sum())),
+        'saturated': float(hist[250:].sum() / small.size),
+    }
+
+
+class QualityGate:
+    """
+    Rejects unusable frames before segmentation, and empty masks after it.
+    Every decision is returned as a report so that it can be audited:
+        {'passed': bool, 'stage': 'image' | 'mask', 'reasons': [...], 'measures': {...}}
+
+    Usage:
+        gate = QualityGate(min_focus=20)
+        result = analysis_full(image, gate=gate)
+        result.quality
+
+    The report is kept out of the metrics. Gates are accepted by api.analysis / analysis_full / batch_analysis
+    (reports=...), DefaultWorkFlow.run / run_full, aio.analysis_async / batch_analysis_async (reports=...),
+    and through the kwargs of run_batch (without the reports). DefaultDAGWorkFlow has no gate.
+    """
+
+    def __init__(
+            self,
+            min_focus: float | None = 10.0,
+            min_contrast: float | None = 8.0,
+            min_entropy: float | None = 3.0,
+            max_saturated: float | None = 0.2,
+            min_mask_pixels: int = 50,
+            size: int = 128,
+    ):
+        """
+        :param min_focus: Minimum variance of the Laplacian. None disables the check
+        :param min_contrast: Minimum standard deviation of the gray levels. None disables the check
+        :param min_entropy: Minimum histogram entropy (bits). None disables the check
+        :param max_saturated: Maximum fraction of saturated pixels. None disables the check
+        :param min_mask_pixels: Masks with fewer foreground pixels are considered empty
+        :param size: Side of the downsampled frame used by the measures
+        """
+        self.min_focus = min_focus
+        self.min_contrast = min_contrast
+        self.min_entropy = min_entropy
+        self.max_saturated = max_saturated
+        self.min_mask_pixels = min_mask_pixels
+        self.size = size
+
+    def check_image(self, image: np.ndarray) -> dict:
+        """ Decision before segmentation """
+        measures = quality_measures(image, self.size)
+        reasons = []
+        if self.min_focus is not None and measures['focus'] < self.min_focus:
+            reasons.append('blurred')
+        if self.min_contrast is not None and measures['contrast'] < self.min_contrast:
+            reasons.append('low_contrast')
+        if self.min_entropy is not None and measures['entropy'] < self.min_entropy:
+            reasons.append('low_entropy')
+        if self.max_saturated is not None and measures['saturated'] > self.max_saturated:
+            reasons.append('saturated')
+        return {'passed': not reasons, 'stage': 'image', 'reasons': reasons, 'measures': measures}
+
+    def check_mask(self, binary: np.ndarray, report: dict | None = None) -> dict:
+        """ Decision after segmentation, added to the report of check_image if given """
+        report = dict(report) if report is not None else {'passed': True, 'reasons': [], 'measures': {}}
+        mask_pixels = cv2.countNonZero(binary)
+        report['measures'] = {**report['measures'], 'mask_pixels': mask_pixels}
+        report['stage'] = 'mask'
+        if mask_pixels < self.min_mask_pixels:
+            report['passed'] = False
+            report['reasons'] = [*report['reasons'], 'empty_mask']
+        return report
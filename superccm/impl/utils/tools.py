@@ -1,11 +1,12 @@
-import onnxruntime
 import numpy as np
 import cv2
 from skimage.measure import label
-from skimage.morphology import skeletonize
+from scipy.ndimage import find_objects
 
 from typing import Union, Sequence
 
+from superccm.impl.skeleton.thinning import thin
+
 CCM_IMAGE_SHAPE = (384, 384)
 
 
@@ -33,9 +34,9 @@ def get_canvas(channels=1, hw: tuple[int, int] = CCM_IMAGE_SHAPE):
     return np.zeros(hw, dtype='uint8')
 
 
-def skeletonize_255(image: np.ndarray) -> np.ndarray:
-    image = image > 0
-    skeleton = skeletonize(image)
+def skeletonize_255(image: np.ndarray, backend: str | None = None) -> np.ndarray:
+    """ :param backend: Thinning backend, see superccm.impl.skeleton.thinning """
+    skeleton = thin(image, backend)
     skeleton = skeleton.astype('uint8')
     skeleton = skeleton * 255
     return skeleton
@@ -47,26 +48,38 @@ def get_conv2d(image, kernel):
     return output
 
 
-def get_split_label(image, connectivity=2):
+def get_label_map(image, connectivity=2) -> tuple[np.ndarray, int]:
     """
     :param image: Binary image
     :param connectivity: connectivity=1 uses 4-connectivity; connectivity=2 uses 8-connectivity
-    :return: A list consisting of N binary images, where N represents the number of connected regions.
+    :return: Label map (0 is the background, regions are 1..N) and N
     """
     image_ = image.copy()
     image_[image > 0] = 1
     labels, num = label(image_, connectivity=connectivity, return_num=True)
+    return labels, num
+
 
+def split_label_map(labels: np.ndarray, num: int) -> list[np.ndarray]:
+    """ Label map -> a list of N binary images (0/255), one per region """
     segments = []
-    for i in range(1, num + 1):
-        component_image = np.where(labels == i, 1, 0)
-        component_image = component_image * 255
-        component_image = component_image.astype('uint8')
+    for i, sl in enumerate(find_objects(labels, num), start=1):
+        component_image = np.zeros(labels.shape, dtype='uint8')
+        if sl is not None:
+            component_image[sl][labels[sl] == i] = 255
         segments.append(component_image)
-
     return segments
 
 
+def get_split_label(image, connectivity=2):
+    """
+    :param image: Binary image
+    :param connectivity: connectivity=1 uses 4-connectivity; connectivity=2 uses 8-connectivity
+    :return: A list consisting of N binary images, where N represents the number of connected regions.
+    """
+    return split_label_map(*get_label_map(image, connectivity))
+
+
 def get_coordinates(image, value: Union[int, Sequence] = 255) -> list[tuple[int, int]]:
     """
     Get the coordinate group in the image whose value is the specified value
@@ -142,3 +155,12 @@ def cal_length(canvas: np.ndarray) -> float:
     for c in contours:
         length += cv2.arcLength(c, True) / 2
     return length
+
+
+def cal_iou(a: np.ndarray, b: np.ndarray) -> float:
+    """ Intersection over union of the foregrounds (non-zero pixels) of two masks, 1.0 if both are empty """
+    a, b = a > 0, b > 0
+    union = np.count_nonzero(a | b)
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(a & b) / union
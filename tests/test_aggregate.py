@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from superccm.impl.metircs.aggregate import RunningStats, MetricsAggregator, aggregate_stream
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).normal(20, 5, 1000)
+    stats = RunningStats()
+    for value in values:
+        stats.update(value)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(np.mean(values), rel=1e-12)
+    assert stats.variance == pytest.approx(np.var(values, ddof=1), rel=1e-10)
+    assert stats.std == pytest.approx(np.std(values, ddof=1), rel=1e-10)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_running_stats_skip_missing_values():
+    stats = RunningStats()
+    assert stats.to_dict() == {'count': 0, 'mean': None, 'var': None, 'std': None, 'min': None, 'max': None}
+    for value in (None, float('nan'), 3.0):
+        stats.update(value)
+    assert stats.to_dict() == {'count': 1, 'mean': 3.0, 'var': None, 'std': None, 'min': 3.0, 'max': 3.0}
+
+
+def test_aggregator_per_subject():
+    rng = np.random.default_rng(1)
+    frames = {subject: rng.uniform(0, 30, (5, 2)) for subject in 'AB'}
+    aggregator = MetricsAggregator(fields=('CNFL', 'CNFT'))
+    for i in range(5):
+        for subject, values in frames.items():
+            aggregator.update(subject, {'CNFL': values[i, 0], 'CNFT': values[i, 1]})
+    assert aggregator.subjects == ['A', 'B']
+
+    summary = aggregator.pop('A')
+    assert summary['n_frames'] == 5
+    assert summary['CNFL']['mean'] == pytest.approx(frames['A'][:, 0].mean())
+    assert summary['CNFT']['var'] == pytest.approx(frames['A'][:, 1].var(ddof=1))
+    assert 'A' not in aggregator and len(aggregator) == 1
+
+
+def stream(keys):
+    return [(key, {'CNFL': float(i)}) for i, key in enumerate(keys)]
+
+
+def test_aggregate_stream_grouped():
+    summaries = list(aggregate_stream(stream(['A_1', 'A_2', 'B_1']), lambda key: key[0], fields=('CNFL',)))
+    assert [subject for subject, _ in summaries] == ['A', 'B']
+    assert summaries[0][1]['CNFL']['mean'] == 0.5
+
+
+def test_aggregate_stream_interleaved():
+    keys = ['A_1', 'B_1', 'A_2']
+    with pytest.raises(ValueError):
+        list(aggregate_stream(stream(keys), lambda key: key[0], fields=('CNFL',)))
+
+    summaries = dict(aggregate_stream(stream(keys), lambda key: key[0], grouped=False, fields=('CNFL',)))
+    assert summaries['A']['n_frames'] == 2 and summaries['A']['CNFL']['mean'] == 1.0
+    assert summaries['B']['n_frames'] == 1
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from superccm.api import aio, api
+
+
+class FakeSegmenter:
+    def seg_batch(self, images):
+        return [np.where(image > 127, 255, 0).astype(np.uint8) for image in images]
+
+
+def test_segmenter_is_loaded_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def get_segmenter():
+        threads.append(threading.current_thread())
+        return FakeSegmenter()
+
+    monkeypatch.setattr(api, 'get_segmenter', get_segmenter)
+    aio.configure()
+    image = np.arange(384 * 384, dtype=np.uint32).reshape(384, 384).astype(np.uint8)
+
+    async def main():
+        return threading.current_thread(), await aio.seg_async(image)
+
+    try:
+        loop_thread, mask = asyncio.run(main())
+    finally:
+        aio.configure()
+    np.testing.assert_array_equal(mask, FakeSegmenter().seg_batch([image])[0])
+    assert threads and loop_thread not in threads
+
+
+def test_batch_reports_cancelled_images(monkeypatch):
+    async def analysis(image_or_path, include, gate):
+        if image_or_path == 'cancelled':
+            raise asyncio.CancelledError()
+        return {'CNFL': 1.0}, None
+
+    monkeypatch.setattr(aio, '_analysis', analysis)
+
+    async def main():
+        items = {'a': 'ok', 'b': 'cancelled', 'c': 'ok'}
+        return [pair async for pair in aio.batch_analysis_async(items, ordered=True)]
+
+    results = asyncio.run(main())
+    assert [key for key, _ in results] == ['a', 'b', 'c']
+    assert results[0][1] == {'CNFL': 1.0}
+    assert isinstance(results[1][1], asyncio.CancelledError)
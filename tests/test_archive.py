@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from superccm.impl.io.archive import MaskArchive
+
+
+def masks(n: int, seed: int = 0) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return [np.where(rng.random((384, 384)) > 0.9, 255, 0).astype(np.uint8) for _ in range(n)]
+
+
+def test_append_keeps_existing_masks(tmp_path):
+    path = tmp_path / 'cohort.masks'
+    old, new = masks(2), masks(1, seed=1)
+    with MaskArchive(path, 'w') as archive:
+        for i, binary in enumerate(old):
+            archive.add(f'old{i}', binary)
+
+    with MaskArchive(path, 'a') as archive:
+        archive.add('new0', new[0])
+        # Readable before closing
+        np.testing.assert_array_equal(archive['old1'], old[1])
+
+    archive = MaskArchive(path)
+    assert archive.keys() == ['old0', 'old1', 'new0']
+    for key, binary in zip(archive.keys(), old + new):
+        np.testing.assert_array_equal(archive[key], binary)
+
+
+def test_append_creates_a_missing_archive(tmp_path):
+    path = tmp_path / 'cohort.masks'
+    with MaskArchive(path, 'a') as archive:
+        archive.add('a', masks(1)[0])
+    assert MaskArchive(path).keys() == ['a']
+
+
+def test_append_refuses_data_without_index(tmp_path):
+    path = tmp_path / 'cohort.masks'
+    with MaskArchive(path, 'w') as archive:
+        archive.add('a', masks(1)[0])
+    size = path.stat().st_size
+    MaskArchive(path).index_path.unlink()
+
+    with pytest.raises(IOError):
+        MaskArchive(path, 'a')
+    assert path.stat().st_size == size
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+from superccm.impl.utils.dedup import FrameDeduplicator
+
+
+def vignetted_frame(seed: int) -> np.ndarray:
+    """ Faint nerves on a strong vignetting shared by every frame, like the frames of one burst """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:384, :384]
+    vignette = 170 * np.exp(-((xx - 192) ** 2 + (yy - 170) ** 2) / (2 * 150 ** 2))
+    nerves = np.zeros((384, 384), dtype=np.uint8)
+    for _ in range(6):
+        x0, x1 = rng.integers(0, 384, 2)
+        cv2.line(nerves, (int(x0), 0), (int(x1), 383), 60, 3)
+    return np.clip(vignette + nerves + rng.normal(0, 6, (384, 384)), 0, 255).astype(np.uint8)
+
+
+def test_distinct_frames_with_shared_vignetting_are_kept():
+    # Within 4 bits of each other with a 64-bit signature
+    first, second = vignetted_frame(4), vignetted_frame(5)
+    assert not np.array_equal(first, second)
+    dedup = FrameDeduplicator()
+    assert dedup.match('a', first) is None
+    assert dedup.match('b', second) is None
+    assert dedup.n_duplicates == 0
+
+
+def test_identical_frames_are_merged_and_recorded():
+    dedup = FrameDeduplicator()
+    frames = [vignetted_frame(seed) for seed in range(3)]
+    for i, frame in enumerate(frames):
+        assert dedup.match(f'f{i}', frame) is None
+    assert dedup.match('copy', frames[1].copy()) == 'f1'
+    assert dedup.duplicates == {'copy': 'f1'}
+    assert dedup.n_frames == 4
+
+
+def test_index_grows_past_its_initial_capacity():
+    dedup = FrameDeduplicator()
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (64, 64), dtype=np.uint8) for _ in range(100)]
+    for i, frame in enumerate(frames):
+        assert dedup.match(i, frame) is None
+    assert dedup.match('copy', frames[80]) == 80
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from superccm.api import api
+from superccm.impl.metircs.density import density_maps, length_map, window_sums
+from superccm.impl.metircs.metrics import cal_total_length, get_metrics, length_per_pix, CCM_IMAGE_SHAPE
+from superccm.impl.parity import synthetic_corpus
+
+# Wide enough for the window centred on any pixel to cover the whole image
+FULL_FRAME_UM = 2 * max(CCM_IMAGE_SHAPE) * length_per_pix * 1000 + 1
+
+CASES = [(key, image, mask, api.grfy(image, api.skel(mask))) for key, image, mask in synthetic_corpus(4, masks=True)]
+
+
+@pytest.mark.parametrize('case', CASES, ids=[case[0] for case in CASES])
+def test_full_frame_window_gives_the_metrics(case):
+    key, image, mask, graph = case
+    maps = density_maps(graph, mask, window_um=FULL_FRAME_UM, step=64)
+    metrics = get_metrics(graph, mask, None, decimal=12, include=['CNFL', 'CNFA'])
+    np.testing.assert_allclose(maps['CNFL'], metrics['CNFL'], rtol=1e-9)
+    np.testing.assert_allclose(maps['CNFA'], metrics['CNFA'], rtol=1e-9)
+
+
+def test_length_map_sums_to_the_total_length():
+    key, image, mask, graph = CASES[0]
+    values = length_map(graph)
+    assert values.shape == CCM_IMAGE_SHAPE
+    assert values.sum() == pytest.approx(cal_total_length(graph))
+
+
+def test_window_sums_match_a_direct_sum():
+    values = np.random.default_rng(0).random((37, 29))
+    sums, areas = window_sums(values, 5, step=3)
+    assert sums.shape == (13, 10)
+    y, x = 9, 6  # Window centred on pixel (27, 18)
+    window = values[25:30, 16:21]
+    assert sums[y, x] == pytest.approx(window.sum()) and areas[y, x] == window.size
+    assert areas[0, 0] == 3 * 3  # Clipped by the corner
+
+
+def test_shape_defaults_to_the_ccm_image():
+    key, image, mask, graph = CASES[0]
+    maps = density_maps(graph, include=['CNFL'])
+    assert maps['CNFL'].shape == CCM_IMAGE_SHAPE
+    with pytest.raises(ValueError):
+        density_maps(graph, include=['CNFA'])
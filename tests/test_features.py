@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from superccm.api import api
+from superccm.impl.metircs.features import EDGE_DTYPE, TRUNK_DTYPE, graph_features, stack_features
+from superccm.impl.metircs.metrics import get_metrics
+from superccm.impl.parity import synthetic_corpus
+from superccm.impl.result import AnalysisResult
+
+
+def analyzed(n: int = 4):
+    """ (key, image, mask, graph, trunk_image) of synthetic frames, without the model """
+    for key, image, mask in synthetic_corpus(n, masks=True):
+        graph, trunks = api.trunk(api.grfy(image, api.skel(mask)))
+        yield key, image, mask, graph, trunks
+
+
+CASES = list(analyzed())
+
+
+@pytest.mark.parametrize('case', CASES, ids=[case[0] for case in CASES])
+def test_trunk_tortuosity_matches_cnft(case):
+    key, image, mask, graph, trunks = case
+    _, table = graph_features(graph, trunk_image=trunks)
+    assert len(table) > 0
+    cnft = get_metrics(graph, mask, trunks, decimal=10, include=['CNFT'])['CNFT']
+    assert np.mean(table['tortuosity']) == pytest.approx(cnft, abs=1e-9)
+
+
+def test_layout():
+    key, image, mask, graph, trunks = CASES[0]
+    edges, table = graph_features(graph, trunk_image=trunks)
+    assert edges.dtype == EDGE_DTYPE and table.dtype == TRUNK_DTYPE
+    assert len(edges) == graph.number_of_edges()
+    assert table['trunk'].tolist() == list(range(len(table)))
+    assert table['n_edges'].sum() == np.count_nonzero(edges['is_trunk'])
+    assert set(edges['trunk'][edges['is_trunk']]) == set(table['trunk'])
+    assert np.all(edges['trunk'][~edges['is_trunk']] == -1)
+
+    # Without the trunk image, the tortuosity of the trunks is undefined
+    _, table = graph_features(graph)
+    assert np.all(np.isnan(table['tortuosity']))
+
+    edges, table = graph_features(graph, key=key, trunk_image=trunks)
+    assert edges.dtype.names == ('image', *EDGE_DTYPE.names)
+    assert table.dtype.names == ('image', *TRUNK_DTYPE.names)
+    assert set(edges['image']) == {key}
+
+
+def test_result_features_use_the_trunk_image():
+    key, image, mask, graph, trunks = CASES[1]
+    result = AnalysisResult(image, mask, None, graph, trunks, {})
+    np.testing.assert_array_equal(result.features[1], graph_features(graph, trunk_image=trunks)[1])
+
+
+def test_stack_features():
+    tables = [(key, graph_features(graph, trunk_image=trunks)[0]) for key, _, _, graph, trunks in CASES]
+    stacked = stack_features(tables)
+    assert len(stacked) == sum(len(table) for _, table in tables)
+    assert stacked.dtype.names == ('image', *EDGE_DTYPE.names)
+    start = 0
+    for key, table in tables:
+        rows = stacked[start:start + len(table)]
+        assert set(rows['image']) == {key}
+        np.testing.assert_array_equal(rows['length'], table['length'])
+        start += len(table)
+
+    # Tables that already have an 'image' column are restacked under the new keys
+    restacked = stack_features([('all', stacked)])
+    assert set(restacked['image']) == {'all'} and len(restacked) == len(stacked)
+
+    with pytest.raises(ValueError):
+        stack_features([])
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from superccm.impl.metircs.fracdim import fractal_dimension, fractal_dimension_batch
+
+ASSETS = Path(__file__).resolve().parents[1] / 'docs' / 'assets'
+FRAMES = ['vis/img.jpg', 'auto_analysis/img.jpg', 'web/img.jpg']
+
+
+def baseline_fractal_dimension(image):
+    """ The original box count: every scale reshaped from the full image, slope from a least squares fit """
+    image = image.astype(bool)
+    n = int(np.floor(np.log2(min(image.shape) / 2)))
+    counts = []
+    for size in 2 ** np.arange(1, n + 1):
+        h, w = image.shape[0] // size * size, image.shape[1] // size * size
+        boxes = image[:h, :w].reshape(h // size, size, w // size, size).any(axis=(1, 3))
+        if np.count_nonzero(boxes):
+            counts.append((size, np.count_nonzero(boxes)))
+    if len(counts) < 2:
+        return 0.0
+    counts = np.array(counts)
+    return np.polyfit(np.log(1.0 / counts[:, 0]), np.log(counts[:, 1]), 1)[0]
+
+
+def real_masks() -> dict[str, np.ndarray]:
+    """ The traced nerves of the overlay in the docs, and the CCM frames of the docs binarized """
+    overlay = cv2.imread(str(ASSETS / 'vis' / 'result.png'))
+    saturation = cv2.cvtColor(overlay, cv2.COLOR_BGR2HSV)[..., 1]
+    masks = {'vis/result.png': np.where(saturation > 100, 255, 0).astype(np.uint8)}
+    for name in FRAMES:
+        image = cv2.imread(str(ASSETS / name), cv2.IMREAD_GRAYSCALE)
+        masks[name] = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -10)
+    return masks
+
+
+MASKS = real_masks()
+
+
+@pytest.mark.parametrize('name', list(MASKS))
+def test_matches_baseline_box_count(name):
+    mask = MASKS[name]
+    assert np.count_nonzero(mask)
+    assert fractal_dimension(mask) == pytest.approx(baseline_fractal_dimension(mask), abs=1e-12)
+
+
+@pytest.mark.parametrize('shape', [(384, 384), (300, 257)])
+def test_matches_baseline_on_cropped_shapes(shape):
+    rng = np.random.default_rng(0)
+    mask = rng.random(shape) > 0.97
+    assert fractal_dimension(mask) == pytest.approx(baseline_fractal_dimension(mask), abs=1e-12)
+
+
+def test_batch_matches_single():
+    masks = np.stack(list(MASKS.values()) + [np.zeros((384, 384), dtype=np.uint8)])
+    expected = [fractal_dimension(mask) for mask in masks]
+    np.testing.assert_allclose(fractal_dimension_batch(masks), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('mask', [
+    np.zeros((384, 384), dtype=np.uint8),
+    np.zeros((3, 3), dtype=np.uint8),
+    np.pad(np.full((1, 1), 255, dtype=np.uint8), ((0, 2), (0, 2))),
+])
+def test_degenerate_masks_give_zero(mask):
+    result = fractal_dimension(mask)
+    assert isinstance(result, float) and result == 0.0
+    assert fractal_dimension_batch(mask).tolist() == [0.0]
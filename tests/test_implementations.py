@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from superccm.api import aio
+from superccm.core import DAGWorkFlow, Module
+from superccm.impl.implementations import current_implementations, use_implementations
+from superccm.impl.runner.pool import run_batch
+
+
+def selected_reconstruction(_=None):
+    return current_implementations()['reconstruction']
+
+
+class ReconstructionModule(Module):
+    Author = 'test'
+    Version = '1.0'
+    Function = selected_reconstruction
+    Inputs = ('image_or_path',)
+    Outputs = ('reconstruction',)
+
+
+class SelectionWorkFlow(DAGWorkFlow):
+    Author = 'test'
+    Version = '1.0'
+    Targets = ('reconstruction',)
+    ReconstructionModule = ReconstructionModule
+
+
+def test_dag_workflow_runs_in_the_callers_context():
+    workflow = SelectionWorkFlow()
+    try:
+        assert workflow.run(None) == 'label'
+        with use_implementations('reference'):
+            assert workflow.run(None) == 'dilation'
+    finally:
+        workflow.close()
+
+
+def test_aio_executors_run_in_the_callers_context():
+    async def main():
+        with use_implementations(reconstruction='dilation'):
+            return await aio._run('cpu', selected_reconstruction)
+
+    assert asyncio.run(main()) == 'dilation'
+
+
+@pytest.mark.parametrize('transport', ['pipe', 'shm'])
+def test_run_batch_workers_use_the_callers_selection(transport):
+    with use_implementations('reference'):
+        batch = run_batch({'a': 0}, selected_reconstruction, workers=1, transport=transport)
+    records = dict(batch)
+    assert records['a']['error'] is None
+    assert records['a']['metrics'] == 'dilation'
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+import pytest
+
+from superccm.impl.graph.graphify import graphify
+from superccm.impl.incremental.incremental import init_analysis, update_analysis
+from superccm.impl.metircs.metrics import get_metrics
+from superccm.impl.parity import synthetic_corpus
+from superccm.impl.skeleton.skeletonize import get_skeleton
+from superccm.impl.trunk.extract_trunks import extract_trunks
+
+
+def full_metrics(image, binary):
+    graph, trunks = extract_trunks(graphify(image, get_skeleton(binary)))
+    return get_metrics(graph, binary, trunks)
+
+
+def edits(binary, seed):
+    """ Cut a fiber, erase near the border, add an isolated region and a bridge """
+    rng = np.random.default_rng(seed)
+    edited = binary.copy()
+    ys, xs = np.nonzero(binary)
+    i = rng.integers(len(xs))
+    cv2.circle(edited, (int(xs[i]), int(ys[i])), 4, 0, -1)
+    cv2.rectangle(edited, (0, 150), (12, 230), 0, -1)
+    cv2.line(edited, (20, 360), (90, 330), 255, 3)
+    j = rng.integers(len(xs))
+    cv2.line(edited, (int(xs[i]), int(ys[i])), (int(xs[j]), int(ys[j])), 255, 2)
+    return edited
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_update_matches_full_run(seed):
+    key, image = list(synthetic_corpus(seed + 1))[seed]
+    binary = np.where(image > 120, 255, 0).astype(np.uint8)
+    state = init_analysis(image, binary)
+    assert state.metrics == full_metrics(image, binary)
+
+    edited = edits(binary, seed)
+    assert update_analysis(state, edited) == full_metrics(image, edited)
+    assert np.array_equal(state.skeleton, get_skeleton(edited))
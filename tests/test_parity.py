@@ -0,0 +1,16 @@
+from superccm.impl.implementations import NUMBA_AVAILABLE
+from superccm.impl.parity import format_report, run_parity, synthetic_corpus
+
+
+def test_defaults_match_the_references_without_the_model():
+    report = run_parity(synthetic_corpus(3, masks=True))
+    assert report['passed'], format_report(report)
+    assert {'reconstruction', 'geometry', 'intensity'} <= set(report['compared'])
+    assert ('branch_points' in report['compared']) == NUMBA_AVAILABLE
+    assert 'thinning' not in report['compared']
+
+
+def test_same_selection_compares_nothing():
+    report = run_parity(synthetic_corpus(1, masks=True), candidate='reference')
+    assert report['passed'] and report['compared'] == []
+    assert 'compared: nothing' in format_report(report)
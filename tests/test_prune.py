@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from scipy.ndimage import label
+
+from superccm.impl.implementations import NUMBA_AVAILABLE
+from superccm.impl.parity import synthetic_corpus
+from superccm.impl.utils.prune import CLASSIFY_KERNEL, _prune, prune, _redundant_pixels_python, \
+    _redundant_pixels_numba, _true_branch_points_python, _true_branch_points_numba
+from superccm.impl.utils.tools import get_conv2d, skeletonize_255
+
+requires_numba = pytest.mark.skipif(not NUMBA_AVAILABLE, reason='numba is not installed')
+
+REDUNDANT_PIXELS = [_redundant_pixels_python, pytest.param(_redundant_pixels_numba, marks=requires_numba)]
+
+
+def border_skeleton(seed: int) -> np.ndarray:
+    """ Random pixels, with dense junctions on the first and last rows and columns """
+    rng = np.random.default_rng(seed)
+    skeleton = np.where(rng.random((384, 384)) > 0.8, 255, 0).astype(np.uint8)
+    for index in (0, 1, 382, 383):
+        skeleton[index, ::3] = 255
+        skeleton[::3, index] = 255
+    return skeleton
+
+
+def coordinates(skeleton: np.ndarray) -> list[tuple[int, int]]:
+    ys, xs = np.nonzero(skeleton)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+@requires_numba
+@pytest.mark.parametrize('seed', range(4))
+def test_redundant_pixels_parity(seed):
+    skeleton = border_skeleton(seed)
+    coords = coordinates(skeleton)
+    expected = _redundant_pixels_python(skeleton.copy(), coords)
+    np.testing.assert_array_equal(_redundant_pixels_numba(skeleton.copy(), coords), expected)
+
+
+@pytest.mark.parametrize('implementation', REDUNDANT_PIXELS)
+def test_redundant_pixels_no_wrap_around(implementation):
+    # (0, 5) has the 4-connected neighbours (1, 4) and (1, 5), (7, 5) is on the opposite border
+    skeleton = np.zeros((8, 8), dtype=np.uint8)
+    skeleton[5, 0] = skeleton[4, 1] = skeleton[5, 1] = skeleton[5, 7] = 255
+    assert implementation(skeleton, [(0, 5)])[5, 0] == 0
+
+
+@pytest.mark.parametrize('implementation', REDUNDANT_PIXELS)
+def test_redundant_pixels_last_row_and_column(implementation):
+    skeleton = np.zeros((8, 8), dtype=np.uint8)
+    # Redundant corner, and a pixel of the last row whose neighbours are not 4-connected
+    skeleton[7, 7] = skeleton[6, 7] = skeleton[6, 6] = 255
+    skeleton[7, 3] = skeleton[6, 2] = skeleton[6, 4] = 255
+    result = implementation(skeleton, [(7, 7), (3, 7)])
+    assert result[7, 7] == 0
+    assert result[7, 3] == 255
+
+
+@requires_numba
+@pytest.mark.parametrize('seed', range(4))
+def test_branch_points_parity(seed):
+    skeleton = border_skeleton(seed)
+    labeled, n = label(get_conv2d(skeleton / 255, CLASSIFY_KERNEL) >= 13)
+    expected = sorted(map(tuple, _true_branch_points_python(skeleton, labeled, n).tolist()))
+    assert sorted(map(tuple, _true_branch_points_numba(skeleton, labeled, n).tolist())) == expected
+
+
+def reference_prune(skeleton: np.ndarray) -> np.ndarray:
+    """ prune as it was, thinning again after every pass """
+    while True:
+        pruned = skeletonize_255(_prune(skeleton))
+        if np.sum(pruned) == np.sum(skeleton):
+            return pruned
+        skeleton = pruned
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_prune_skips_thinning_without_changing_the_result(seed):
+    for _, _, mask in synthetic_corpus(2, seed=seed, masks=True):
+        skeleton = skeletonize_255(mask)
+        np.testing.assert_array_equal(prune(skeleton), reference_prune(skeleton))
@@ -0,0 +1,79 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from superccm.api import aio, api
+from superccm.default import DefaultWorkFlow
+from superccm.impl.modules import SegModule
+from superccm.impl.utils.quality import QualityGate
+
+BLANK = np.full((384, 384), 30, dtype=np.uint8)
+
+
+def textured(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (384, 384), dtype=np.uint8)
+
+
+class EmptySegmenter:
+    """ Segments nothing, without the model """
+    def __call__(self, image):
+        return np.zeros(image.shape, dtype=np.uint8)
+
+    def seg_batch(self, images):
+        return [self(image) for image in images]
+
+
+class EmptySegModule(SegModule):
+    Function = EmptySegmenter
+
+
+class EmptyWorkFlow(DefaultWorkFlow):
+    SegModule = EmptySegModule
+
+
+@pytest.fixture
+def empty_segmenter(monkeypatch):
+    monkeypatch.setattr(api, 'get_segmenter', EmptySegmenter)
+    aio.configure()
+    yield
+    aio.configure()
+
+
+def test_analysis_metrics_stay_flat():
+    metrics = api.analysis(BLANK, gate=QualityGate())
+    assert 'quality' not in metrics
+    assert all(value is None for value in metrics.values())
+    result = api.analysis_full(BLANK, gate=QualityGate())
+    assert result.quality['stage'] == 'image' and not result.quality['passed']
+
+
+def test_batch_analysis_reports(empty_segmenter):
+    reports = {}
+    results = dict(api.batch_analysis({'blank': BLANK, 'empty': textured()}, gate=QualityGate(), reports=reports))
+    assert all(isinstance(value, (float, type(None))) for metrics in results.values() for value in metrics.values())
+    assert reports['blank']['stage'] == 'image'
+    assert reports['empty']['reasons'] == ['empty_mask']
+    assert results['empty']['CNFL'] == 0.0
+
+
+def test_default_workflow_gate():
+    workflow = EmptyWorkFlow()
+    rejected = workflow.run_full(BLANK, gate=QualityGate())
+    assert rejected.binary is None and not rejected.quality['passed']
+    empty = workflow.run_full(textured(), gate=QualityGate())
+    assert empty.quality['reasons'] == ['empty_mask'] and empty.metrics['CNFL'] == 0.0
+    assert workflow.run(BLANK, gate=QualityGate())['CNFL'] is None
+
+
+def test_aio_gate(empty_segmenter):
+    async def main():
+        reports = {}
+        items = {'blank': BLANK, 'empty': textured()}
+        results = dict([pair async for pair in aio.batch_analysis_async(items, gate=QualityGate(), reports=reports)])
+        return await aio.analysis_async(BLANK, gate=QualityGate()), results, reports
+
+    metrics, results, reports = asyncio.run(main())
+    assert all(value is None for value in metrics.values())
+    assert results['empty']['CNFL'] == 0.0 and results['blank']['CNFL'] is None
+    assert reports['blank']['stage'] == 'image' and reports['empty']['reasons'] == ['empty_mask']
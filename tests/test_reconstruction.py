@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+from skimage.morphology import skeletonize
+
+from superccm.impl.metircs.reconstruction_binary import reconstruct_binary
+
+
+def synthetic_mask(seed: int) -> np.ndarray:
+    """ Thick wavy fibers and short branches, like a segmentation of a CCM frame """
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((384, 384), dtype=np.uint8)
+    xs = np.arange(-10, 394)
+    for _ in range(6):
+        y0, amp, freq, phase = rng.uniform(20, 364), rng.uniform(5, 30), rng.uniform(0.005, 0.03), rng.uniform(0, 6)
+        points = np.stack([xs, y0 + amp * np.sin(freq * xs + phase)], 1).astype(np.int32)
+        cv2.polylines(mask, [points], False, 255, int(rng.integers(2, 6)))
+    for _ in range(8):
+        (x0, y0), (x1, y1) = rng.uniform(0, 384, 2), rng.uniform(0, 384, 2)
+        cv2.line(mask, (int(x0), int(y0)), (int(x1), int(y1)), 255, int(rng.integers(1, 4)))
+    return mask
+
+
+def random_mask(seed: int) -> np.ndarray:
+    """ Speckle with many small components, some touching the border """
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random((384, 384)) > 0.7, 255, 0).astype(np.uint8)
+
+
+def seeds(mask: np.ndarray, seed: int) -> np.ndarray:
+    """ A thinned skeleton with gaps, so that some components get no seed, and a few pixels off the mask """
+    rng = np.random.default_rng(seed)
+    skeleton = skeletonize(mask > 0) & (rng.random(mask.shape) > 0.5)
+    skeleton |= rng.random(mask.shape) > 0.999
+    return skeleton.astype(np.uint8) * 255
+
+
+CASES = [('synthetic', synthetic_mask, i) for i in range(4)] + [('random', random_mask, i) for i in range(4)]
+
+
+@pytest.mark.parametrize('max_radius', [None, 1, 2.5, 10])
+@pytest.mark.parametrize('kind, make_mask, seed', CASES)
+def test_label_matches_dilation(kind, make_mask, seed, max_radius):
+    mask = make_mask(seed)
+    skeleton = seeds(mask, seed)
+    label = reconstruct_binary(mask, skeleton, max_radius=max_radius, method='label')
+    dilation = reconstruct_binary(mask, skeleton, max_radius=max_radius, method='dilation')
+    assert label.dtype == dilation.dtype == np.uint8
+    assert np.array_equal(label, dilation)
+
+
+@pytest.mark.parametrize('method', ['label', 'dilation'])
+def test_empty_inputs(method):
+    empty = np.zeros((64, 64), dtype=np.uint8)
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[10:20, 10:50] = 1
+    assert not reconstruct_binary(empty, empty, method=method).any()
+    assert not reconstruct_binary(mask, empty, method=method).any()
+    assert not reconstruct_binary(empty, mask, method=method).any()
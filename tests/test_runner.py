@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from superccm.impl.runner import pool
+from superccm.impl.runner.pool import SLOT_FRAMES, _slot_bytes, run_batch
+from superccm.impl.runner.shm import SharedRing, pack, unpack
+
+
+def echo(image):
+    """ The decoded image, in a defaultdict like the per-class results of some workflows """
+    counts = defaultdict(list)
+    counts['type'].append(type(image).__name__)
+    return {'image': image, 'counts': counts}
+
+
+def test_pack_keeps_mapping_types():
+    image = np.arange(64, dtype=np.uint8).reshape(8, 8)
+    result = defaultdict(list, {'image': image, 'nested': defaultdict(int, {'mask': image > 10})})
+    with SharedRing(1, 1 << 16) as ring:
+        packed = pack(result, ring, 0)
+        assert type(packed) is defaultdict and packed.default_factory is list
+        assert not isinstance(packed['image'], np.ndarray)
+        unpacked = unpack(packed, ring)
+    assert type(unpacked['nested']) is defaultdict and unpacked['nested'].default_factory is int
+    np.testing.assert_array_equal(unpacked['image'], image)
+    np.testing.assert_array_equal(unpacked['nested']['mask'], image > 10)
+
+
+def test_slot_size_follows_the_first_image():
+    image = np.zeros((384, 384), dtype=np.uint8)
+    assert _slot_bytes(image, None) == SLOT_FRAMES * image.nbytes
+    assert _slot_bytes(image, 1) == 2 ** 20
+
+
+def test_shm_transport_decodes_paths(tmp_path):
+    rng = np.random.default_rng(0)
+    images = {f'f{i}': rng.integers(0, 256, (384, 384), dtype=np.uint8) for i in range(3)}
+    paths = {}
+    for key, image in images.items():
+        paths[key] = str(tmp_path / f'{key}.png')
+        cv2.imwrite(paths[key], image)
+    paths['missing'] = str(tmp_path / 'missing.png')
+
+    records = dict(run_batch(paths, echo, workers=2, transport='shm'))
+    for key, image in images.items():
+        assert records[key]['error'] is None
+        assert records[key]['metrics']['counts']['type'] == ['ndarray']
+        np.testing.assert_array_equal(records[key]['metrics']['image'], image)
+    # Items that cannot be decoded reach the worker as they are, to report the error there
+    assert records['missing']['metrics'] == {'image': paths['missing'], 'counts': {'type': ['str']}}
+
+
+def test_reader_threads_keep_the_order(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    images, paths = {}, {}
+    for i in range(12):
+        images[f'f{i}'] = rng.integers(0, 256, (64, 64), dtype=np.uint8)
+        paths[f'f{i}'] = str(tmp_path / f'f{i}.png')
+        cv2.imwrite(paths[f'f{i}'], images[f'f{i}'])
+
+    threads = []
+
+    def read_image(path):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.01 * (len(threads) % 3))
+        return cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+
+    # The workers are other processes: only the decoding in this one is patched
+    monkeypatch.setattr(pool, 'read_image', read_image)
+    with SharedRing(8, 1 << 16) as ring:
+        reader = pool._Reader(iter(paths.items()), ring, threads=3, ahead=6)
+        keys = []
+        try:
+            for key, image, slot, ref in reader:
+                keys.append(key)
+                np.testing.assert_array_equal(image, images[key])
+                np.testing.assert_array_equal(ring.read(ref), images[key])
+                ring.release(slot)
+        finally:
+            reader.close()
+        assert keys == list(paths)
+
+        # Without a free slot, the image is passed by value
+        slots = [ring.acquire() for _ in range(8)]
+        reader = pool._Reader(iter(paths.items()), ring, threads=3, ahead=6)
+        try:
+            key, image, slot, ref = next(reader)
+        finally:
+            reader.close()
+        assert (key, slot, ref) == ('f0', None, None)
+        np.testing.assert_array_equal(image, images['f0'])
+        for slot in slots:
+            ring.release(slot)
+    assert all(name.startswith('superccm-reader') for name in threads)
+
+    records = dict(run_batch(paths, echo, workers=2, transport='shm', readers=3))
+    for key, image in images.items():
+        np.testing.assert_array_equal(records[key]['metrics']['image'], image)
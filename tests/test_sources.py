@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from superccm.impl.io.sources import iter_frames
+
+
+def write_tiff(path, n_frames):
+    pages = [Image.fromarray(np.full((32, 32), 10 * i, dtype=np.uint8)) for i in range(n_frames)]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+
+
+def test_directory_keys_match_single_files(tmp_path, monkeypatch):
+    (tmp_path / 'P001').mkdir()
+    write_tiff(tmp_path / 'P001' / 'OD.tif', 3)
+    write_tiff(tmp_path / 'single.tiff', 1)
+    cv2.imwrite(str(tmp_path / 'frame.png'), np.zeros((32, 32), dtype=np.uint8))
+
+    single = [key for path in ('P001/OD.tif', 'single.tiff', 'frame.png') for key, _ in iter_frames(tmp_path / path)]
+    assert single == ['OD#0', 'OD#1', 'OD#2', 'single', 'frame']
+
+    # Files of a directory are decoded from their paths, not read whole into memory
+    monkeypatch.setattr(Path, 'read_bytes', lambda self: (_ for _ in ()).throw(AssertionError(self)))
+    frames = list(iter_frames(tmp_path))
+    assert [key for key, _ in frames] == ['P001/OD#0', 'P001/OD#1', 'P001/OD#2', 'frame', 'single']
+    assert [int(image[0, 0]) for key, image in frames[:3]] == [0, 10, 20]
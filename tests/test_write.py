@@ -0,0 +1,25 @@
+import threading
+
+import cv2
+import networkx as nx
+import numpy as np
+
+from superccm.impl.io.write import OverlayWriter
+
+
+def test_submitted_images_are_copied(tmp_path):
+    frame = np.full((64, 64), 200, dtype=np.uint8)
+    with OverlayWriter(tmp_path, max_workers=1) as writer:
+        # Hold the only encoding thread, so that every task runs after the frame is overwritten
+        gate = threading.Event()
+        writer._submit(gate.wait)
+        writer.write('write', frame)
+        writer.render('render', nx.MultiGraph(), frame)
+        writer.write_montage('montage', [frame], cols=1)
+        frame[:] = 0
+        gate.set()
+
+    for key in ('write', 'render'):
+        assert (cv2.imread(str(tmp_path / f'{key}.png'), cv2.IMREAD_GRAYSCALE) == 200).all()
+    sheet = cv2.imread(str(tmp_path / 'montage.png'), cv2.IMREAD_GRAYSCALE)
+    assert (sheet[2:-2, 2:-2] == 200).all()